@@ -0,0 +1,400 @@
+"""Columnar copy of the ledger for reporting queries, stored as Parquet and queried with DuckDB.
+
+Reports scan years of transactions and daily values; on the row store those scans are slow and
+hold read locks that compete with the writes of the app. Instead the reporting tables are
+exported to Parquet files under ANALYTICS_DIR, one file per year for the large tables, and the
+reports run on an embedded, in-memory DuckDB database whose views read those files. The OLTP
+database only sees the export queries.
+
+Exports are incremental. A table is only looked at when its DataVersion counter moved since the
+last export; then per-year fingerprints (row count, sums of the numeric columns and of the day of
+the year) are compared with those in the manifest and only the years that changed are rewritten.
+Changes the sums can't see, like a transaction moved to another asset, are caught by
+AnalyticsDirtyYear: ORM writes and bulk inserts of transactions and price bars mark the years of
+their old and new dates, and marked years are rewritten too. The marks are cleared by the export
+that rewrites them, so all workers of one database share one ANALYTICS_DIR.
+
+duckdb and pyarrow are imported on first use.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Callable
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from sqlalchemy import ColumnElement, Connection, Select, delete, event, extract, func, insert, inspect, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from .models import Account, AnalyticsDirtyYear, Asset, PortfolioValue, PriceBar, Transaction
+from .schemas import TransactionType
+from .versioning import get_versions
+
+if TYPE_CHECKING:
+    import duckdb
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "backend/analytics")
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "100000"))
+# Bumped whenever the exported columns change, so old exports are rewritten
+EXPORT_FORMAT = 1
+
+@dataclass
+class Dataset:
+    """An exported table.
+
+    Args:
+        name (str): View name in DuckDB and directory name under ANALYTICS_DIR.
+        scope (str): DataVersion scope of the source table.
+        columns (dict[str, str]): DuckDB type of each exported column, in select order.
+        statement (Callable[[], Select]): Select of the exported columns.
+        date (ColumnElement | None): Column the files are partitioned by year on; None for one file.
+        fingerprint (Callable[[], list[ColumnElement]]): Aggregates that change when a year's rows change.
+        model (type | None): Model whose writes mark the years they touch in AnalyticsDirtyYear.
+    """
+    name: str
+    scope: str
+    columns: dict[str, str]
+    statement: Callable[[], Select]
+    date: ColumnElement | None = None
+    fingerprint: Callable[[], list[ColumnElement]] = field(default=lambda: [])
+    model: type | None = None
+
+def _day_sum(date: ColumnElement) -> ColumnElement:
+    return func.sum(extract("doy", date))
+
+DATASETS = (
+    Dataset(
+        name="transactions",
+        scope="transaction",
+        columns={
+            "id": "VARCHAR", "account_id": "VARCHAR", "asset_id": "VARCHAR", "type": "VARCHAR",
+            "quantity": "DOUBLE", "price": "DOUBLE", "fee": "DOUBLE", "date": "TIMESTAMP",
+        },
+        statement=lambda: select(
+            Transaction.id, Transaction.account_id, Transaction.asset_id, Transaction.type,
+            Transaction.quantity, Transaction.price, Transaction.fee, Transaction.date,
+        ),
+        date=Transaction.date,
+        fingerprint=lambda: [
+            func.count(), func.sum(Transaction.quantity), func.sum(Transaction.price), func.sum(Transaction.fee),
+            func.count(func.distinct(Transaction.account_id)), _day_sum(Transaction.date),
+            *(func.count().filter(Transaction.type == transaction_type) for transaction_type in TransactionType),
+        ],
+        model=Transaction,
+    ),
+    Dataset(
+        name="price_bars",
+        scope="pricebar",
+        columns={
+            "asset_id": "VARCHAR", "date": "TIMESTAMP", "open": "DOUBLE", "high": "DOUBLE",
+            "low": "DOUBLE", "close": "DOUBLE", "volume": "DOUBLE",
+        },
+        statement=lambda: select(
+            PriceBar.asset_id, PriceBar.date, PriceBar.open, PriceBar.high, PriceBar.low, PriceBar.close, PriceBar.volume
+        ),
+        date=PriceBar.date,
+        fingerprint=lambda: [
+            func.count(), func.sum(PriceBar.close), func.sum(func.coalesce(PriceBar.volume, 0.0)), _day_sum(PriceBar.date)
+        ],
+        model=PriceBar,
+    ),
+    Dataset(
+        name="portfolio_values",
+        scope="portfoliovalue",
+        columns={"user_id": "VARCHAR", "date": "TIMESTAMP", "value": "DOUBLE", "net_flow": "DOUBLE"},
+        statement=lambda: select(PortfolioValue.user_id, PortfolioValue.date, PortfolioValue.value, PortfolioValue.net_flow),
+        date=PortfolioValue.date,
+        fingerprint=lambda: [
+            func.count(), func.sum(PortfolioValue.value), func.sum(PortfolioValue.net_flow), _day_sum(PortfolioValue.date)
+        ],
+    ),
+    Dataset(
+        name="accounts",
+        scope="account",
+        columns={"id": "VARCHAR", "user_id": "VARCHAR", "name": "VARCHAR"},
+        statement=lambda: select(Account.id, Account.user_id, Account.name),
+    ),
+    Dataset(
+        name="assets",
+        scope="asset",
+        columns={"id": "VARCHAR", "symbol": "VARCHAR", "name": "VARCHAR", "currency": "VARCHAR"},
+        statement=lambda: select(Asset.id, Asset.symbol, Asset.name, Asset.currency),
+    ),
+)
+
+_export_lock = threading.Lock()
+_duckdb: duckdb.DuckDBPyConnection | None = None
+_duckdb_lock = threading.RLock()
+
+def _arrow_type(duckdb_type: str) -> pa.DataType:
+    import pyarrow as pa
+    return {"VARCHAR": pa.string(), "DOUBLE": pa.float64(), "TIMESTAMP": pa.timestamp("us")}[duckdb_type]
+
+def _arrow_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        # Stored by member name, like the database column
+        return value.name
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+def _manifest_path() -> str:
+    return os.path.join(ANALYTICS_DIR, "manifest.json")
+
+def _read_manifest() -> dict[str, Any]:
+    try:
+        with open(_manifest_path()) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"format": EXPORT_FORMAT, "datasets": {}}
+    if manifest.get("format") != EXPORT_FORMAT:
+        return {"format": EXPORT_FORMAT, "datasets": {}}
+    return manifest
+
+def _write_manifest(manifest: dict[str, Any]) -> None:
+    temporary = f"{_manifest_path()}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temporary, _manifest_path())
+
+def _partition_path(dataset: Dataset, key: str) -> str:
+    if dataset.date is None:
+        return os.path.join(ANALYTICS_DIR, dataset.name, "data.parquet")
+    return os.path.join(ANALYTICS_DIR, dataset.name, f"year={key}", "data.parquet")
+
+def _fingerprints(session: Session, dataset: Dataset, version: int) -> dict[str, list[Any]]:
+    if dataset.date is None:
+        return {"all": [version]}
+    year = extract("year", dataset.date)
+    rows = session.exec(select(year, *dataset.fingerprint()).group_by(year)).all()
+    return {str(int(row[0])): [float(value) if value is not None else None for value in row[1:]] for row in rows}
+
+def mark_years_dirty(connection: Connection, dataset: str, years: set[int]) -> None:
+    """Record that rows of these years of a dataset were written, so the next export rewrites them."""
+    if not years:
+        return
+    now = datetime.utcnow()
+    existing = set(connection.execute(
+        select(AnalyticsDirtyYear.year).where(AnalyticsDirtyYear.dataset == dataset, AnalyticsDirtyYear.year.in_(years))
+    ).scalars())
+    if existing:
+        connection.execute(
+            update(AnalyticsDirtyYear)
+            .where(AnalyticsDirtyYear.dataset == dataset, AnalyticsDirtyYear.year.in_(existing))
+            .values(marked=now)
+        )
+    if years - existing:
+        connection.execute(insert(AnalyticsDirtyYear), [{"dataset": dataset, "year": year, "marked": now} for year in years - existing])
+
+_DIRTY_DATASETS = {dataset.model: dataset.name for dataset in DATASETS if dataset.model is not None}
+
+@event.listens_for(OrmSession, "after_flush")
+def _mark_flushed_years(session: OrmSession, flush_context: Any) -> None:
+    # Old and new dates both count: moving a row to another year changes both years
+    years: dict[str, set[int]] = {}
+    for instance in (*session.new, *session.deleted, *session.dirty):
+        name = _DIRTY_DATASETS.get(type(instance))
+        if name is None:
+            continue
+        dates = [instance.date]
+        if instance in session.dirty:
+            if not session.is_modified(instance, include_collections=False):
+                continue
+            dates += inspect(instance).attrs.date.history.deleted
+        years.setdefault(name, set()).update(date.year for date in dates if date is not None)
+    for name, changed in years.items():
+        mark_years_dirty(session.connection(), name, changed)
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _mark_inserted_years(state: Any) -> None:
+    # Bulk inserts and upserts (e.g. price uploads) bypass the flush; their rows carry the dates
+    if not state.is_insert or state.bind_mapper is None:
+        return
+    name = _DIRTY_DATASETS.get(state.bind_mapper.class_)
+    rows = state.parameters if isinstance(state.parameters, list) else [state.parameters or {}]
+    if name is not None:
+        mark_years_dirty(state.session.connection(), name, {row["date"].year for row in rows if isinstance(row.get("date"), datetime)})
+
+def _export_partition(session: Session, dataset: Dataset, key: str) -> int:
+    """Write one partition file. Returns the number of rows written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    statement = dataset.statement()
+    if dataset.date is not None:
+        year = int(key)
+        statement = statement.where(dataset.date >= datetime(year, 1, 1), dataset.date < datetime(year + 1, 1, 1))
+    schema = pa.schema([(name, _arrow_type(duckdb_type)) for name, duckdb_type in dataset.columns.items()])
+    path = _partition_path(dataset, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    rows = 0
+    # Written to a temporary file and renamed, so reports running meanwhile read the old or the new file
+    with pq.ParquetWriter(temporary, schema, compression="zstd") as writer:
+        result = session.execute(statement, execution_options={"yield_per": ANALYTICS_BATCH_SIZE})
+        for chunk in result.partitions():
+            columns = list(zip(*chunk))
+            writer.write_batch(pa.record_batch(
+                [
+                    # Only the string columns hold UUIDs and enums; numbers and datetimes convert natively
+                    pa.array([_arrow_value(value) for value in column] if duckdb_type == "VARCHAR" else column, type=_arrow_type(duckdb_type))
+                    for column, duckdb_type in zip(columns, dataset.columns.values())
+                ],
+                schema=schema,
+            ))
+            rows += len(chunk)
+    os.replace(temporary, path)
+    return rows
+
+def refresh_exports(session: Session, full: bool = False) -> dict[str, int]:
+    """Bring the Parquet export up to date with the database, rewriting only the partitions that changed."""
+    stats = {"datasets_checked": 0, "partitions_written": 0, "partitions_removed": 0, "rows_written": 0}
+    with _export_lock:
+        os.makedirs(ANALYTICS_DIR, exist_ok=True)
+        manifest = _read_manifest()
+        # Versions and marks are read before the fingerprints, so writes committed meanwhile trigger another check next time
+        versions = get_versions(session, [dataset.scope for dataset in DATASETS])
+        marks = session.exec(select(AnalyticsDirtyYear.dataset, AnalyticsDirtyYear.year, AnalyticsDirtyYear.marked)).all()
+        checked: set[str] = set()
+        for dataset in DATASETS:
+            state = manifest["datasets"].get(dataset.name)
+            if not full and state is not None and state["version"] == versions[dataset.scope]:
+                continue
+            stats["datasets_checked"] += 1
+            checked.add(dataset.name)
+            fingerprints = _fingerprints(session, dataset, versions[dataset.scope])
+            previous = state["partitions"] if state is not None and not full else {}
+            dirty = {str(mark.year) for mark in marks if mark.dataset == dataset.name}
+            for key, fingerprint in fingerprints.items():
+                if previous.get(key) != fingerprint or key in dirty or not os.path.exists(_partition_path(dataset, key)):
+                    stats["rows_written"] += _export_partition(session, dataset, key)
+                    stats["partitions_written"] += 1
+            for key in set(previous) - set(fingerprints):
+                shutil.rmtree(os.path.dirname(_partition_path(dataset, key)), ignore_errors=True)
+                stats["partitions_removed"] += 1
+            manifest["datasets"][dataset.name] = {"version": versions[dataset.scope], "partitions": fingerprints}
+        if stats["datasets_checked"]:
+            _write_manifest(manifest)
+            _create_views(manifest)
+            logger.info(f"Analytics export refreshed: {stats}")
+        # Only marks of rewritten datasets are cleared, and marks made after they were read stay for the next export
+        cleared = [mark for mark in marks if mark.dataset in checked]
+        for mark in cleared:
+            session.connection().execute(delete(AnalyticsDirtyYear).where(
+                AnalyticsDirtyYear.dataset == mark.dataset, AnalyticsDirtyYear.year == mark.year, AnalyticsDirtyYear.marked == mark.marked
+            ))
+        if cleared:
+            session.commit()
+    return stats
+
+def _create_views(manifest: dict[str, Any]) -> None:
+    connection = _connection()
+    with _duckdb_lock:
+        for dataset in DATASETS:
+            keys = sorted(manifest["datasets"].get(dataset.name, {}).get("partitions", {}))
+            files = [_partition_path(dataset, key) for key in keys if os.path.exists(_partition_path(dataset, key))]
+            if files:
+                source = f"SELECT * FROM read_parquet({json.dumps(files)})"
+            else:
+                # DuckDB can't read an empty file list; an empty, typed select keeps the reports working
+                source = "SELECT " + ", ".join(f"CAST(NULL AS {duckdb_type}) AS {name}" for name, duckdb_type in dataset.columns.items()) + " LIMIT 0"
+            connection.execute(f"CREATE OR REPLACE VIEW {dataset.name} AS {source}")
+
+def _connection() -> duckdb.DuckDBPyConnection:
+    global _duckdb
+    if _duckdb is None:
+        with _duckdb_lock:
+            if _duckdb is None:
+                import duckdb
+                connection = duckdb.connect(":memory:")
+                _duckdb = connection
+                _create_views(_read_manifest())
+    return _duckdb
+
+def query(session: Session, sql: str, parameters: list[Any] | None = None, refresh: bool = True) -> list[dict[str, Any]]:
+    """Run a report query on the export (refreshed first, unless refresh is False) and return its rows as dicts."""
+    if refresh:
+        refresh_exports(session)
+    # A cursor per query: cursors of one DuckDB connection can run in parallel threads
+    cursor = _connection().cursor()
+    try:
+        result = cursor.execute(sql, parameters or [])
+        names = [column[0] for column in result.description]
+        return [dict(zip(names, row)) for row in result.fetchall()]
+    finally:
+        cursor.close()
+
+def returns_by_year(session: Session, user_id: uuid.UUID) -> list[dict[str, Any]]:
+    """Start and end value, net flow, gain and time-weighted return of each calendar year of daily values."""
+    return query(session, """
+        WITH daily AS (
+            SELECT date, value, net_flow, lag(value) OVER (ORDER BY date) AS previous
+            FROM portfolio_values
+            WHERE user_id = ?
+        )
+        SELECT
+            year(date) AS year,
+            coalesce(arg_min(previous, date), 0.0) AS start_value,
+            arg_max(value, date) AS end_value,
+            sum(net_flow) AS net_flow,
+            arg_max(value, date) - coalesce(arg_min(previous, date), 0.0) - sum(net_flow) AS gain,
+            -- Daily returns exclude the day's flows; days starting from nothing don't count
+            exp(sum(ln((value - net_flow) / previous)) FILTER (WHERE previous > 0 AND value - net_flow > 0)) - 1 AS time_weighted_return
+        FROM daily
+        GROUP BY year
+        ORDER BY year
+    """, [str(user_id)])
+
+def contributions_by_asset(
+    session: Session, user_id: uuid.UUID, start: datetime | None = None, end: datetime | None = None
+) -> list[dict[str, Any]]:
+    """Money put into and taken out of each asset, in the asset's currency, largest net contribution first."""
+    return query(session, """
+        SELECT
+            transactions.asset_id,
+            assets.symbol,
+            assets.currency,
+            sum(CASE WHEN type = ? THEN quantity * price + fee ELSE 0 END) AS contributed,
+            sum(CASE WHEN type = ? THEN quantity * price - fee ELSE 0 END) AS withdrawn,
+            sum(CASE WHEN type = ? THEN quantity * price ELSE 0 END) AS reinvested,
+            contributed - withdrawn AS net_contribution
+        FROM transactions
+        JOIN accounts ON accounts.id = transactions.account_id
+        LEFT JOIN assets ON assets.id = transactions.asset_id
+        WHERE accounts.user_id = ? AND date >= coalesce(?, date) AND date <= coalesce(?, date)
+        GROUP BY ALL
+        ORDER BY net_contribution DESC, symbol
+    """, [
+        TransactionType.BUY.name, TransactionType.SELL.name, TransactionType.DIVIDEND_REINVESTED.name,
+        str(user_id), start, end,
+    ])
+
+def dividends_by_month(
+    session: Session, user_id: uuid.UUID, start: datetime | None = None, end: datetime | None = None
+) -> list[dict[str, Any]]:
+    """Dividends paid out and reinvested per month and currency."""
+    return query(session, """
+        SELECT
+            date_trunc('month', date) AS month,
+            assets.currency,
+            sum(CASE WHEN type = ? THEN quantity * price ELSE 0 END) AS paid,
+            sum(CASE WHEN type = ? THEN quantity * price ELSE 0 END) AS reinvested,
+            paid + reinvested AS total
+        FROM transactions
+        JOIN accounts ON accounts.id = transactions.account_id
+        LEFT JOIN assets ON assets.id = transactions.asset_id
+        WHERE accounts.user_id = ? AND type IN (?, ?) AND date >= coalesce(?, date) AND date <= coalesce(?, date)
+        GROUP BY ALL
+        ORDER BY month, currency
+    """, [
+        TransactionType.DIVIDEND_EARNED.name, TransactionType.DIVIDEND_REINVESTED.name,
+        str(user_id), TransactionType.DIVIDEND_EARNED.name, TransactionType.DIVIDEND_REINVESTED.name, start, end,
+    ])
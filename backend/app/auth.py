@@ -1,17 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession, object_session
 from sqlmodel import Session, select
-from .models import User
+from .models import DataVersion, User
 from .database import get_session
+from .cache import TTLCache
+from .metrics import PASSWORD_JOBS_PENDING
+import asyncio
 import os
+import threading
+import time
+import uuid
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt takes 100-300 ms per call, so async routes hand it to a small dedicated pool instead of
+# blocking the event loop. Jobs beyond the pending limit are rejected rather than queued.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_password_jobs = 0
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hash/verify jobs are already pending."""
+
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
@@ -19,12 +38,56 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 security = HTTPBearer()
 
+# Resolved principals, keyed by username. Entries are detached snapshots without the password hash,
+# so authenticated requests don't need a user lookup until the entry expires or the user changes.
+# Changes committed by this process drop their entries right away. Changes committed by other
+# workers are noticed through the "user" data version, which cache hits re-read at most every
+# PRINCIPAL_VERSION_CHECK_INTERVAL seconds; that interval bounds how long another worker can keep
+# serving a renamed or deleted user.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_VERSION_CHECK_INTERVAL = float(os.getenv("PRINCIPAL_VERSION_CHECK_INTERVAL", "5"))
+principal_cache: TTLCache[str, User] = TTLCache(
+    name="principal", maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL
+)
+_principal_lock = threading.Lock()
+# Bumped by every invalidation, so a lookup that read the user before a change can't store the old row
+_principal_generation = 0
+_user_version: int | None = None
+_user_version_checked = float("-inf")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def _run_password_job(func: Callable[..., Any], *args: Any) -> Any:
+    # Only touched from the event loop thread, so a plain counter is enough
+    global _pending_password_jobs
+    if _pending_password_jobs >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy(f"{_pending_password_jobs} password jobs pending")
+    _pending_password_jobs += 1
+    PASSWORD_JOBS_PENDING.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        _pending_password_jobs -= 1
+        PASSWORD_JOBS_PENDING.dec()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+def password_executor_stats() -> dict[str, int]:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "pending": _pending_password_jobs,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -35,6 +98,69 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _check_user_version(session: Session) -> None:
+    """Clear the principal cache if any process committed a user change since the last check."""
+    global _principal_generation, _user_version, _user_version_checked
+    now = time.monotonic()
+    if now - _user_version_checked < PRINCIPAL_VERSION_CHECK_INTERVAL:
+        return
+    version = session.exec(select(DataVersion.version).where(DataVersion.scope == User.__tablename__)).first() or 0
+    with _principal_lock:
+        _user_version_checked = now
+        if version != _user_version:
+            _user_version = version
+            _principal_generation += 1
+            principal_cache.clear()
+
+def get_user_by_username(session: Session, username: str) -> User | None:
+    """Resolve a username to a read-only User snapshot, using the principal cache when possible.
+
+    The snapshot is detached and carries only id, username, email and base_currency: its
+    relationships (e.g. user.accounts) are empty, so query them by user id instead.
+    """
+    _check_user_version(session)
+    user: User | None = principal_cache.get(username)
+    if user is not None:
+        return user
+    generation = _principal_generation
+    db_user: User | None = session.exec(select(User).where(User.username == username)).first()
+    if db_user is None:
+        return None
+    user = User(id=db_user.id, username=db_user.username, email=db_user.email, base_currency=db_user.base_currency)
+    with _principal_lock:
+        if generation == _principal_generation:
+            principal_cache.set(username, user)
+    return user
+
+def invalidate_principal(user_id: uuid.UUID | None = None, username: str | None = None) -> None:
+    """Drop cached principals for a user, matched by id and/or username."""
+    global _principal_generation
+    with _principal_lock:
+        _principal_generation += 1
+        if username is not None:
+            principal_cache.pop(username)
+        if user_id is not None:
+            principal_cache.pop_where(lambda _, cached: cached.id == user_id)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(mapper, connection, target: User) -> None:
+    # Flushed changes can still roll back, so they are only applied to the cache after the commit.
+    # The username may itself have changed, so both the old and the new key are dropped.
+    session = object_session(target)
+    if session is None:
+        invalidate_principal(user_id=target.id, username=target.username)
+        return
+    changed = session.info.setdefault("changed_principals", set())
+    for old_username in inspect(target).attrs.username.history.deleted:
+        changed.add((target.id, old_username))
+    changed.add((target.id, target.username))
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_committed_users(session: OrmSession) -> None:
+    for user_id, username in session.info.pop("changed_principals", ()):
+        invalidate_principal(user_id=user_id, username=username)
+
 def authenticate_user(session: Session, username: str, password: str) -> Optional[User]:
     user = session.exec(select(User).where(User.username == username)).first()
     if not user:
@@ -43,6 +169,21 @@ def authenticate_user(session: Session, username: str, password: str) -> Optiona
         return None
     return user
 
+async def authenticate_user_async(session: Session, username: str, password: str) -> Optional[User]:
+    """Same as authenticate_user, but verifies the password on the password executor.
+
+    Raises:
+        PasswordHasherBusy: If the executor already has too many pending jobs.
+    """
+    user = session.exec(select(User).where(User.username == username)).first()
+    # Return the pooled connection instead of holding it while bcrypt runs; loaded attributes stay readable
+    session.close()
+    if not user or not user.password_hash:
+        return None
+    if not await verify_password_async(password, user.password_hash):
+        return None
+    return user
+
 async def get_current_user_jwt(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     session: Session = Depends(get_session)
@@ -60,7 +201,7 @@ async def get_current_user_jwt(
     except JWTError:
         raise credentials_exception
     
-    user = session.exec(select(User).where(User.username == username)).first()
+    user = get_user_by_username(session, username)
     if user is None:
         raise credentials_exception
     return user
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""Historical backtests of target allocations with contributions and rebalancing rules.
+
+The daily closes of every asset in a request are aligned on the days all of them traded, so the
+portfolios of one request are compared over the same period. Prices are used in each asset's
+own currency. Every portfolio starts at its target weights and holds its shares until the next
+event: a monthly contribution (invested at the target weights) or a rebalance back to the
+targets, monthly, quarterly, annually or when a weight drifts more than the threshold away from
+its target. Between events the values are one matrix product over the segment of days, so a
+backtest costs one numpy step per event rather than per day.
+
+CAGR, volatility and drawdown are computed from the time-weighted daily returns, so
+contributions don't count as growth. Histories are kept in a TTL cache per symbol and period,
+and whole results in a cache keyed by a hash of the parameters and the asset and price bar data
+versions, so repeated comparisons don't touch the providers or rerun the simulation.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+import hashlib
+import json
+import math
+import os
+from sqlmodel import Session, select
+from .cache import TTLCache
+from .models import Asset
+from .schemas import BacktestPortfolio, BacktestRead, BacktestRequest, BacktestResultRead, DataSource, RebalanceRule
+from .versioning import get_versions
+from ..services.providers import get_provider
+
+if TYPE_CHECKING:
+    import numpy as np
+
+BACKTEST_CACHE_TTL = float(os.getenv("BACKTEST_CACHE_TTL", "3600"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "3600"))
+# Scopes whose changes can change a result: asset symbols and data sources, manually stored price bars
+BACKTEST_SCOPES = ["asset", "pricebar"]
+
+# Daily closes per (symbol, data source, first day, last day, price bar version), as (dates, closes)
+history_cache: TTLCache[tuple[str, DataSource, str, str, int], tuple[np.ndarray, np.ndarray]] = TTLCache(
+    name="history", maxsize=1000, ttl=HISTORY_CACHE_TTL
+)
+# Backtest results per parameter hash
+backtest_cache: TTLCache[str, BacktestRead] = TTLCache(name="backtest", maxsize=256, ttl=BACKTEST_CACHE_TTL)
+
+def _daily_closes(history: list[dict[str, Any]]) -> tuple[np.ndarray, np.ndarray]:
+    import numpy as np
+    bars = [bar for bar in history if bar.get("Close") is not None]
+    if not bars:
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+    date_key = "Date" if "Date" in bars[0] else "Datetime"
+    dates = np.array([bar[date_key].replace(tzinfo=None) for bar in bars], dtype="datetime64[D]")
+    closes = np.array([bar["Close"] for bar in bars], dtype=np.float64)
+    # Keep the last bar of a day
+    last = np.flatnonzero(np.r_[dates[1:] != dates[:-1], True])
+    return dates[last], closes[last]
+
+def load_closes(
+    assets: list[Asset], start: datetime | None, end: datetime | None, pricebar_version: int
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Daily closes of each asset between start and end, from the history cache or one provider call per data source."""
+    first_day = start.date().isoformat() if start else ""
+    last_day = (end or datetime.now()).date().isoformat()
+    closes: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    missing: dict[DataSource, list[str]] = {}
+    for asset in assets:
+        cached = history_cache.get((asset.symbol, asset.data_source, first_day, last_day, pricebar_version))
+        if cached is not None:
+            closes[asset.symbol] = cached
+        else:
+            missing.setdefault(asset.data_source, []).append(asset.symbol)
+    for data_source, symbols in missing.items():
+        histories = get_provider(data_source).get_histories(symbols, start=start, end=end)
+        for symbol in symbols:
+            closes[symbol] = _daily_closes(histories.get(symbol, []))
+            history_cache.set((symbol, data_source, first_day, last_day, pricebar_version), closes[symbol])
+    return closes
+
+def aligned_prices(symbols: list[str], closes: dict[str, tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    """The days every symbol has a close for and the closes on those days (days x symbols)."""
+    import numpy as np
+    dates: np.ndarray | None = None
+    for symbol in symbols:
+        dates = closes[symbol][0] if dates is None else np.intersect1d(dates, closes[symbol][0])
+    if dates is None:
+        return np.empty(0, dtype="datetime64[D]"), np.empty((0, 0))
+    prices = np.empty((len(dates), len(symbols)))
+    for column, symbol in enumerate(symbols):
+        symbol_dates, symbol_closes = closes[symbol]
+        prices[:, column] = symbol_closes[np.searchsorted(symbol_dates, dates)]
+    return dates, prices
+
+def _scheduled_rebalances(dates: np.ndarray, rule: RebalanceRule) -> np.ndarray:
+    """Whether each day is the first trading day of a new rebalancing period."""
+    import numpy as np
+    months = dates.astype("datetime64[M]")
+    if rule == RebalanceRule.MONTHLY:
+        periods = months
+    elif rule == RebalanceRule.QUARTERLY:
+        periods = months.astype(np.int64) // 3
+    elif rule == RebalanceRule.ANNUAL:
+        periods = dates.astype("datetime64[Y]")
+    else:
+        return np.zeros(len(dates), dtype=bool)
+    return np.r_[False, periods[1:] != periods[:-1]]
+
+def simulate(
+    dates: np.ndarray,
+    prices: np.ndarray,
+    weights: np.ndarray,
+    rule: RebalanceRule,
+    threshold: float,
+    initial_value: float,
+    monthly_contribution: float,
+) -> dict[str, Any]:
+    """Run one portfolio over the aligned prices.
+
+    Returns the values at each close before that day's contribution ("before") and after it and
+    any rebalance ("after"), the number of rebalances and the total contributed.
+    """
+    import numpy as np
+    days = len(dates)
+    months = dates.astype("datetime64[M]")
+    contributes = np.r_[False, months[1:] != months[:-1]] & (monthly_contribution > 0)
+    rebalances_on = _scheduled_rebalances(dates, rule)
+    events = np.flatnonzero(contributes | rebalances_on)
+
+    before = np.empty(days)
+    after = np.empty(days)
+    before[0] = after[0] = initial_value
+    shares = initial_value * weights / prices[0]
+    rebalances = 0
+    day = 1
+    event = 0
+    while day < days:
+        while event < len(events) and events[event] < day:
+            event += 1
+        stop = int(events[event]) if event < len(events) else days - 1
+        segment = prices[day:stop + 1]
+        values = segment @ shares
+        rebalance = bool(rebalances_on[stop])
+        if rule == RebalanceRule.THRESHOLD:
+            drift = np.abs(segment * shares / values[:, None] - weights).max(axis=1)
+            breached = np.flatnonzero(drift > threshold)
+            if len(breached):
+                stop = day + int(breached[0])
+                values = values[:breached[0] + 1]
+                rebalance = True
+        before[day:stop + 1] = values
+        after[day:stop + 1] = values
+        flow = monthly_contribution if contributes[stop] else 0.0
+        if rebalance or flow:
+            after[stop] = values[-1] + flow
+            if rebalance:
+                shares = after[stop] * weights / prices[stop]
+                rebalances += 1
+            else:
+                shares = shares + flow * weights / prices[stop]
+        day = stop + 1
+    return {
+        "before": before,
+        "after": after,
+        "rebalances": rebalances,
+        "contributions": initial_value + monthly_contribution * int(contributes.sum()),
+    }
+
+def performance(dates: np.ndarray, before: np.ndarray, after: np.ndarray) -> dict[str, Any]:
+    """CAGR, annualized volatility and maximum drawdown (as a positive fraction) of the time-weighted returns."""
+    import numpy as np
+    returns = before[1:] / after[:-1] - 1.0
+    index = np.r_[1.0, np.cumprod(1.0 + returns)]
+    years = float((dates[-1] - dates[0]) / np.timedelta64(1, "D")) / 365.25
+    periods_per_year = len(returns) / years if years > 0 else 0.0
+    drawdowns = index / np.maximum.accumulate(index) - 1.0
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(index[:trough + 1]))
+    return {
+        "cagr": float(index[-1] ** (1.0 / years) - 1.0) if years > 0 else 0.0,
+        "volatility": float(np.std(returns, ddof=1) * math.sqrt(periods_per_year)) if len(returns) > 1 else 0.0,
+        "max_drawdown": float(-drawdowns[trough]),
+        "max_drawdown_peak": dates[peak].astype("datetime64[us]").item(),
+        "max_drawdown_trough": dates[trough].astype("datetime64[us]").item(),
+    }
+
+def parameter_hash(request: BacktestRequest, versions: dict[str, int]) -> str:
+    """Stable hash of the parameters and data versions a result depends on. An open end means today."""
+    parameters = request.model_dump(mode="json")
+    parameters["end"] = parameters["end"] or datetime.now().date().isoformat()
+    for portfolio in parameters["portfolios"]:
+        portfolio["weights"] = sorted(portfolio["weights"].items())
+    payload = json.dumps({"parameters": parameters, "versions": versions}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _target_weights(portfolio: BacktestPortfolio, columns: dict[Any, int]) -> np.ndarray:
+    import numpy as np
+    if any(weight < 0 for weight in portfolio.weights.values()):
+        raise ValueError(f"Portfolio {portfolio.name} has a negative weight")
+    total = sum(portfolio.weights.values())
+    if total <= 0:
+        raise ValueError(f"Portfolio {portfolio.name} has no positive weight")
+    weights = np.zeros(len(columns))
+    for asset_id, weight in portfolio.weights.items():
+        weights[columns[asset_id]] = weight / total
+    return weights
+
+def run_backtest(session: Session, request: BacktestRequest) -> BacktestRead:
+    """Backtest every portfolio of the request over the same days, or return the cached result.
+
+    Raises LookupError for unknown assets and ValueError for invalid weights or too little common history.
+    """
+    versions = get_versions(session, BACKTEST_SCOPES)
+    key = parameter_hash(request, versions)
+    cached = backtest_cache.get(key)
+    if cached is not None:
+        return cached.model_copy(update={"cached": True})
+
+    asset_ids = list(dict.fromkeys(asset_id for portfolio in request.portfolios for asset_id in portfolio.weights))
+    assets = {asset.id: asset for asset in session.exec(select(Asset).where(Asset.id.in_(asset_ids))).all()}
+    if len(assets) < len(asset_ids):
+        raise LookupError("Asset not found")
+    columns = {asset_id: column for column, asset_id in enumerate(asset_ids)}
+    weights = [_target_weights(portfolio, columns) for portfolio in request.portfolios]
+
+    closes = load_closes(list(assets.values()), request.start, request.end, versions["pricebar"])
+    dates, prices = aligned_prices([assets[asset_id].symbol for asset_id in asset_ids], closes)
+    if len(dates) < 2:
+        raise ValueError("The assets have fewer than two trading days of price history in common")
+
+    results = []
+    for portfolio, target in zip(request.portfolios, weights):
+        run = simulate(dates, prices, target, portfolio.rebalance, portfolio.threshold, request.initial_value, request.monthly_contribution)
+        results.append(BacktestResultRead(
+            name=portfolio.name,
+            final_value=float(run["after"][-1]),
+            contributions=run["contributions"],
+            rebalances=run["rebalances"],
+            **performance(dates, run["before"], run["after"]),
+        ))
+    result = BacktestRead(
+        key=key,
+        cached=False,
+        start=dates[0].astype("datetime64[us]").item(),
+        end=dates[-1].astype("datetime64[us]").item(),
+        trading_days=len(dates),
+        results=results,
+    )
+    backtest_cache.set(key, result)
+    return result
@@ -0,0 +1,248 @@
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Iterable, Iterator, TypeVar
+import json
+import os
+import sqlite3
+import threading
+import time
+from .metrics import CACHE_LOOKUPS
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Registry of named caches so their stats can be reported in one place
+_caches: dict[str, "TTLCache[Any, Any] | SharedCache"] = {}
+
+class TTLCache(Generic[K, V]):
+    """Bounded, thread-safe LRU cache with a per-entry time to live.
+
+    Args:
+        name (str): Name used to report the cache statistics.
+        maxsize (int): Maximum number of entries kept; the least recently used entry is evicted first.
+        ttl (float): Seconds an entry stays fresh after it was stored.
+        clock (Callable[[], float], optional): Monotonic clock, overridable for tests.
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_counter = CACHE_LOOKUPS.labels(name, "hit")
+        self._miss_counter = CACHE_LOOKUPS.labels(name, "miss")
+        _caches[name] = self
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < self._clock():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                self._miss_counter.inc()
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            self._hit_counter.inc()
+            return entry[1]
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        expires = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def pop_where(self, predicate: Callable[[K, V], bool]) -> int:
+        """Remove every entry matching the predicate. Returns the number removed."""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK_SIZE = 500
+
+def private_directory(path: str) -> None:
+    """Create a directory only the current user can access, or check that an existing one is safe.
+
+    Raises:
+        PermissionError: If the directory belongs to another user or others can write to it, since
+            they could then plant or alter the files read from it.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+        raise PermissionError(f"{path} must be owned by the current user and not writable by others")
+
+def _chunks(keys: list[str]) -> Iterator[list[str]]:
+    for start in range(0, len(keys), _CHUNK_SIZE):
+        yield keys[start:start + _CHUNK_SIZE]
+
+class SharedCache:
+    """TTL cache shared by all worker processes of one host, stored in a SQLite database in WAL mode.
+
+    Values are stored as JSON. Expiry uses the wall clock, since monotonic clocks aren't shared
+    between processes. claim() hands out short leases on keys so that only one worker refreshes
+    a key while the others wait for its value instead of fetching it too.
+
+    Args:
+        name (str): Name used to report the cache statistics.
+        path (str): SQLite database file; created on first use, in a directory only the current user can access.
+        ttl (float): Seconds an entry stays fresh after it was stored.
+        lease (float): Seconds a claim is held at most, so a crashed worker can't block a key for long.
+    """
+    def __init__(self, name: str, path: str, ttl: float, lease: float = 30.0) -> None:
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self._hit_counter = CACHE_LOOKUPS.labels(name, "hit")
+        self._miss_counter = CACHE_LOOKUPS.labels(name, "miss")
+        _caches[name] = self
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; autocommit mode, with explicit transactions where atomicity matters
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            private_directory(os.path.dirname(self.path) or ".")
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)")
+            connection.execute("CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, tuple[Any, float]]:
+        """Fresh value and expiry time (epoch seconds) of each key found."""
+        keys = list(dict.fromkeys(keys))
+        found: dict[str, tuple[Any, float]] = {}
+        now = time.time()
+        connection = self._connection()
+        for chunk in _chunks(keys):
+            rows = connection.execute(
+                f"SELECT key, value, expires FROM entries WHERE expires > ? AND key IN ({','.join('?' * len(chunk))})",
+                [now, *chunk],
+            )
+            found.update((key, (json.loads(value), expires)) for key, value, expires in rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        self._hit_counter.inc(len(found))
+        self._miss_counter.inc(len(keys) - len(found))
+        return found
+
+    def set_many(self, items: dict[str, Any], ttl: float | None = None) -> None:
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires) for key, value in items.items()],
+            )
+            connection.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        connection = self._connection()
+        for chunk in _chunks(list(keys)):
+            connection.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+
+    def claim(self, keys: Iterable[str], owner: str) -> set[str]:
+        """Claim the keys no other owner holds a live claim on. Returns the keys now held by owner."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        claimed: set[str] = set()
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't both see a key as free
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM claims WHERE expires <= ?", (now,))
+            connection.executemany(
+                "INSERT OR IGNORE INTO claims (key, owner, expires) VALUES (?, ?, ?)",
+                [(key, owner, now + self.lease) for key in keys],
+            )
+            for chunk in _chunks(keys):
+                rows = connection.execute(
+                    f"SELECT key FROM claims WHERE owner = ? AND key IN ({','.join('?' * len(chunk))})", [owner, *chunk]
+                )
+                claimed.update(key for key, in rows)
+        return claimed
+
+    def claimed(self, keys: Iterable[str]) -> set[str]:
+        """The keys some owner holds a live claim on."""
+        now = time.time()
+        held: set[str] = set()
+        connection = self._connection()
+        for chunk in _chunks(list(keys)):
+            rows = connection.execute(
+                f"SELECT key FROM claims WHERE expires > ? AND key IN ({','.join('?' * len(chunk))})", [now, *chunk]
+            )
+            held.update(key for key, in rows)
+        return held
+
+    def release(self, keys: Iterable[str], owner: str) -> None:
+        connection = self._connection()
+        for chunk in _chunks(list(keys)):
+            connection.execute(
+                f"DELETE FROM claims WHERE owner = ? AND key IN ({','.join('?' * len(chunk))})", [owner, *chunk]
+            )
+
+    def clear(self) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM entries")
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        size = self._connection().execute("SELECT count(*) FROM entries WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return {
+            "name": self.name,
+            "size": size,
+            "maxsize": None,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": 0,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+def cache_stats() -> list[dict[str, Any]]:
+    """Statistics for every cache created in this process."""
+    return [cache.stats() for cache in _caches.values()]
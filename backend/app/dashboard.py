@@ -0,0 +1,36 @@
+"""Queries and template context shared by the HTML pages showing a user's portfolio.
+
+The dashboard's recent activity block is fragment cached until the user's accounts, transactions
+or an asset change. Its rows are passed as a loader, so a cached view doesn't run the query.
+"""
+from typing import Any
+from sqlalchemy.orm import joinedload
+from sqlmodel import Session, select
+from .models import Account, Asset, Transaction, User
+from .templating import fragment_versions
+from .versioning import user_scope
+
+def user_transactions(user: User) -> Any:
+    """The user's transactions, newest first, with the asset symbol and account name joined in."""
+    return (
+        select(Transaction)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(Account.user_id == user.id)
+        .options(
+            joinedload(Transaction.asset).load_only(Asset.symbol),
+            joinedload(Transaction.account).load_only(Account.name),
+        )
+        .order_by(Transaction.date.desc())
+    )
+
+def user_fragment_versions(session: Session, user: User, *scopes: str) -> str:
+    """Fragment cache key part for blocks showing the user's accounts and transactions, plus the given scopes."""
+    return fragment_versions(session, [user_scope("account", user.id), user_scope("transaction", user.id), *scopes])
+
+def dashboard_context(session: Session, user: User) -> dict[str, Any]:
+    """Everything dashboard.html renders, apart from the request."""
+    return {
+        "user": user,
+        "fragment_versions": user_fragment_versions(session, user, "asset"),
+        "load_recent_transactions": lambda: session.exec(user_transactions(user).limit(10)).all(),
+    }
@@ -1,13 +1,15 @@
 from typing import Any, Generator
 from sqlalchemy import Engine
 from sqlmodel import SQLModel, Session, create_engine
+import os
 
-DATABASE_URL = "sqlite:///backend/boglefolio.db"
-engine: Engine = create_engine(url=DATABASE_URL, echo=True)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///backend/boglefolio.db")
+SQL_ECHO = os.getenv("SQL_ECHO", "true").lower() in ("1", "true", "yes")
+engine: Engine = create_engine(url=DATABASE_URL, echo=SQL_ECHO)
 
 def create_db_and_tables() -> None:
     SQLModel.metadata.create_all(bind=engine)
 
 def get_session() -> Generator[Session, Any, None]:
     with Session(bind=engine) as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -1,9 +1,14 @@
 from fastapi import Depends, HTTPException, status, Request
+import ipaddress
+import os
+import secrets
+import uuid
 from fastapi.responses import RedirectResponse
-from sqlmodel import Session, select
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlmodel import Session
 from .database import get_session
-from .models import User
-from .auth import get_current_user_jwt
+from .models import Account, Transaction, User
+from .auth import get_current_user_jwt, get_user_by_username
 
 # Dependency for web routes (redirects to login)
 async def get_current_user_web(request: Request, session: Session = Depends(get_session)) -> User:
@@ -19,8 +24,8 @@ async def get_current_user_web(request: Request, session: Session = Depends(get_
             headers={"Location": "/login"}
         )
     
-    # Get user from database
-    user = session.exec(select(User).where(User.username == user_session["username"])).first()
+    # Get user from the principal cache, falling back to the database
+    user = get_user_by_username(session, user_session["username"])
     if not user:
         # Clear invalid session
         request.session.clear()
@@ -33,12 +38,72 @@ async def get_current_user_web(request: Request, session: Session = Depends(get_
     return user
 
 # Dependency for API routes (returns 401)
-async def get_current_user_api(session: Session = Depends(get_session)) -> User:
+optional_bearer = HTTPBearer(auto_error=False)
+
+async def get_current_user_api(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_bearer),
+    session: Session = Depends(get_session)
+) -> User:
     """
     Dependency for API routes that require authentication.
+    Accepts a bearer token or the login session cookie, so the web pages can call the API.
     Returns 401 if not authenticated (for API calls).
     """
-    return await get_current_user_jwt(session=session)
+    if credentials is not None:
+        return await get_current_user_jwt(credentials=credentials, session=session)
+    user_session = request.session.get("user")
+    user = get_user_by_username(session, user_session["username"]) if user_session else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user
+
+# Ownership checks for API routes addressing a user, account or transaction by id. Anything not owned
+# by the authenticated user answers 404, like a missing row, so ids of other users can't be probed
+def get_owned_user(user_id: uuid.UUID, current_user: User = Depends(get_current_user_api)) -> User:
+    """
+    Dependency for routes with a user_id: the authenticated user, if it is the one addressed.
+    Returns the principal snapshot (see get_user_by_username), not a session-bound row.
+    """
+    if user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return current_user
+
+def owned_account(session: Session, account_id: uuid.UUID, user: User) -> Account:
+    """The account, if it belongs to the user; 404 otherwise."""
+    account: Account | None = session.get(entity=Account, ident=account_id)
+    if account is None or account.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+    return account
+
+def get_owned_account(
+    account_id: uuid.UUID,
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(get_session)
+) -> Account:
+    """
+    Dependency for routes with an account_id: the account, bound to the request's session,
+    if the authenticated user owns it.
+    """
+    return owned_account(session, account_id, current_user)
+
+def get_owned_transaction(
+    transaction_id: uuid.UUID,
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(get_session)
+) -> Transaction:
+    """
+    Dependency for routes with a transaction_id: the transaction, bound to the request's session,
+    if it is in one of the authenticated user's accounts.
+    """
+    transaction: Transaction | None = session.get(entity=Transaction, ident=transaction_id)
+    if transaction is None or transaction.account is None or transaction.account.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
+    return transaction
 
 # Optional user dependency (doesn't require auth)
 async def get_current_user_optional(request: Request, session: Session = Depends(get_session)) -> User | None:
@@ -50,5 +115,36 @@ async def get_current_user_optional(request: Request, session: Session = Depends
     if not user_session:
         return None
     
-    user = session.exec(select(User).where(User.username == user_session["username"])).first()
-    return user
\ No newline at end of file
+    user = get_user_by_username(session, user_session["username"])
+    return user
+
+# Monitoring endpoints (metrics, cache and provider state) reveal traffic and internal state, so
+# they only answer clients in MONITORING_ALLOW (comma-separated addresses or networks, loopback by
+# default) or requests with the bearer token in MONITORING_TOKEN
+MONITORING_ALLOW = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("MONITORING_ALLOW", "127.0.0.1,::1").split(",")
+    if network.strip()
+]
+MONITORING_TOKEN = os.getenv("MONITORING_TOKEN", "")
+
+def _client_allowed(host: str | None) -> bool:
+    try:
+        address = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in MONITORING_ALLOW)
+
+async def require_monitoring_access(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_bearer),
+) -> None:
+    """
+    Dependency for monitoring routes.
+    Returns 403 unless the client address is allowed or the monitoring token is presented.
+    """
+    if MONITORING_TOKEN and credentials is not None and secrets.compare_digest(credentials.credentials, MONITORING_TOKEN):
+        return
+    if _client_allowed(request.client.host if request.client else None):
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Monitoring access denied")
@@ -0,0 +1,71 @@
+"""Largest-Triangle-Three-Buckets downsampling for chart series.
+
+LTTB keeps the first and last points and, from each of the max_points - 2 buckets in between,
+the point forming the largest triangle with the point kept from the previous bucket and the
+average of the next bucket. Peaks and troughs survive, so the chart looks like the full series.
+
+Bucket bounds, next-bucket averages and triangle areas are numpy operations; only the choice of
+the previous point walks the buckets, since it depends on the previous choice.
+"""
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Sequence, TypeVar
+
+if TYPE_CHECKING:
+    import numpy as np
+
+T = TypeVar("T")
+
+def lttb_indices(x: Sequence[float] | np.ndarray, y: Sequence[float] | np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the points LTTB keeps, in order. x must be sorted; NaNs in y carry the previous value."""
+    import numpy as np
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])[:max(max_points, 0)]
+
+    if np.isnan(y).any():
+        valid = ~np.isnan(y)
+        if not valid.any():
+            return np.linspace(0, n - 1, max_points).round().astype(np.int64)
+        carried = np.maximum.accumulate(np.where(valid, np.arange(n), 0))
+        carried[:np.argmax(valid)] = np.argmax(valid)
+        y = y[carried]
+
+    # Buckets over the interior points 1..n-2; the last "next bucket" is the final point alone
+    bounds = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    starts, ends = bounds[:-1], bounds[1:]
+    next_starts = np.r_[starts[1:], n - 1]
+    next_ends = np.r_[ends[1:], n]
+    cumulative_x = np.r_[0.0, np.cumsum(x)]
+    cumulative_y = np.r_[0.0, np.cumsum(y)]
+    counts = next_ends - next_starts
+    average_x = (cumulative_x[next_ends] - cumulative_x[next_starts]) / counts
+    average_y = (cumulative_y[next_ends] - cumulative_y[next_starts]) / counts
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        ax, ay = x[previous], y[previous]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        areas = np.abs((ax - average_x[bucket]) * (y[start:end] - ay) - (ax - x[start:end]) * (average_y[bucket] - ay))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def timestamps(values: Sequence[Any]) -> np.ndarray:
+    """Seconds since the epoch of datetimes (naive or aware, pandas Timestamps included), for use as x."""
+    import numpy as np
+    naive = [value.replace(tzinfo=None) if getattr(value, "tzinfo", None) is not None else value for value in values]
+    return np.array(naive, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+def downsample(points: Sequence[T], dates: Sequence[datetime], values: Sequence[float | None], max_points: int | None) -> list[T]:
+    """Keep at most max_points of the points (all of them when max_points is None)."""
+    if max_points is None or len(points) <= max_points:
+        return list(points)
+    indices = lttb_indices(timestamps(dates), [value if value is not None else float("nan") for value in values], max_points)
+    return [points[index] for index in indices.tolist()]
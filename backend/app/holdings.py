@@ -0,0 +1,178 @@
+from typing import Any, Sequence
+import uuid
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+from .models import Account, Asset, CorporateAction, Transaction
+from .schemas import CorporateActionType, HoldingRead, TransactionType
+from ..services.corporate_actions import cumulative_split_factors, load_splits
+from ..services.fx import conversion_factors, latest_rates
+from ..services.prices import get_cached_prices
+
+# Transaction types that add shares to a position
+INFLOW_TYPES = (TransactionType.BUY, TransactionType.DIVIDEND_REINVESTED)
+DIVIDEND_TYPES = (TransactionType.DIVIDEND_EARNED, TransactionType.DIVIDEND_REINVESTED)
+# Positions smaller than this are treated as closed
+CLOSED_POSITION_EPSILON = 1e-9
+
+def holdings_statement(*filters: Any, include_closed: bool = False) -> Any:
+    """One GROUP BY over the ledger: signed quantity, acquisition cost and dividends per (account, asset).
+
+    Rows are further split by the number of stock splits after the transaction date, so quantities
+    can be scaled by the matching cumulative split factor before they are added up. Quantities are
+    raw; the closed-position filter is only applied here when no splits exist in the result.
+
+    Args:
+        *filters: WHERE clauses restricting the transactions (Account is joined in).
+        include_closed (bool): Also return positions whose quantity sums to zero.
+    """
+    quantity = func.sum(case(
+        (Transaction.type.in_(INFLOW_TYPES), Transaction.quantity),
+        (Transaction.type == TransactionType.SELL, -Transaction.quantity),
+        else_=0.0,
+    ))
+    bought_quantity = func.sum(case((Transaction.type.in_(INFLOW_TYPES), Transaction.quantity), else_=0.0))
+    bought_cost = func.sum(case(
+        (Transaction.type.in_(INFLOW_TYPES), Transaction.quantity * Transaction.price + Transaction.fee),
+        else_=0.0,
+    ))
+    dividends = func.sum(case((Transaction.type.in_(DIVIDEND_TYPES), Transaction.quantity * Transaction.price), else_=0.0))
+    splits_after = (
+        select(func.count())
+        .where(
+            CorporateAction.asset_id == Transaction.asset_id,
+            CorporateAction.type == CorporateActionType.SPLIT,
+            CorporateAction.date > Transaction.date,
+        )
+        .correlate(Transaction)
+        .scalar_subquery()
+        .label("splits_after")
+    )
+
+    statement = (
+        select(
+            Transaction.account_id,
+            Transaction.asset_id,
+            Asset.symbol,
+            Asset.name,
+            Asset.currency,
+            Asset.data_source,
+            quantity.label("quantity"),
+            bought_quantity.label("bought_quantity"),
+            bought_cost.label("bought_cost"),
+            dividends.label("dividends"),
+            splits_after,
+        )
+        .join(Asset, Asset.id == Transaction.asset_id)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(*filters)
+        .group_by(Transaction.account_id, Transaction.asset_id, Asset.symbol, Asset.name, Asset.currency, Asset.data_source, splits_after)
+        .order_by(Transaction.account_id, Asset.symbol)
+    )
+    if not include_closed:
+        # A position can only net to zero across split buckets, so keep any bucket that is open on its own
+        # or belongs to an asset with splits; get_holdings drops the closed ones after adjusting
+        has_splits = select(CorporateAction.id).where(
+            CorporateAction.asset_id == Transaction.asset_id,
+            CorporateAction.type == CorporateActionType.SPLIT,
+        ).exists()
+        statement = statement.having((func.abs(quantity) > CLOSED_POSITION_EPSILON) | has_splits)
+    return statement
+
+def get_holdings(
+    session: Session,
+    *filters: Any,
+    include_closed: bool = False,
+    with_prices: bool = True,
+    base_currency: str | None = None,
+) -> list[HoldingRead]:
+    """Current positions matching the filters, valued with cached prices.
+
+    Quantities are adjusted for stock splits, so they are expressed in today's shares.
+    Cost basis uses the average cost of all shares acquired, so sells reduce it proportionally.
+    With base_currency, cost basis and market value are also converted at the latest FX rates,
+    all positions at once.
+    """
+    buckets: Sequence[Any] = session.exec(holdings_statement(*filters, include_closed=include_closed)).all()
+    rows = _merge_split_buckets(session, buckets)
+    if not include_closed:
+        rows = [row for row in rows if abs(row.quantity) > CLOSED_POSITION_EPSILON]
+
+    # One provider call per data source for all the symbols missing from the quote cache
+    prices = get_cached_prices((row.symbol, row.data_source) for row in rows) if with_prices else {}
+
+    holdings = []
+    for row in rows:
+        average_cost = row.bought_cost / row.bought_quantity if row.bought_quantity else 0.0
+        cost_basis = average_cost * row.quantity
+        price = prices.get((row.symbol, row.data_source))
+        market_value = price[0] * row.quantity if price else None
+        holdings.append(HoldingRead(
+            account_id=row.account_id,
+            asset_id=row.asset_id,
+            symbol=row.symbol,
+            name=row.name,
+            currency=row.currency,
+            quantity=row.quantity,
+            average_cost=average_cost,
+            cost_basis=cost_basis,
+            dividends=row.dividends,
+            price=price[0] if price else None,
+            price_time=price[1] if price else None,
+            market_value=market_value,
+            unrealized_gain=market_value - cost_basis if market_value is not None else None,
+        ))
+    if base_currency and holdings:
+        _convert_holdings(session, holdings, base_currency)
+    return holdings
+
+def _convert_holdings(session: Session, holdings: list[HoldingRead], base_currency: str) -> None:
+    """Fill in the base-currency fields with one vectorized conversion over all positions."""
+    currencies = [holding.currency for holding in holdings]
+    rates = latest_rates(session, [*currencies, base_currency])
+    factors = conversion_factors(currencies, base_currency, rates).tolist()
+    for holding, factor in zip(holdings, factors):
+        holding.base_currency = base_currency.upper()
+        if factor != factor:  # NaN: no rate for this currency pair
+            continue
+        holding.fx_rate = factor
+        holding.cost_basis_base = holding.cost_basis * factor
+        if holding.market_value is not None:
+            holding.market_value_base = holding.market_value * factor
+
+class _Position:
+    """Split-adjusted totals of one (account, asset) position, merged from its split buckets."""
+    __slots__ = ("account_id", "asset_id", "symbol", "name", "currency", "data_source", "quantity", "bought_quantity", "bought_cost", "dividends")
+
+    def __init__(self, row: Any, factor: float) -> None:
+        self.account_id = row.account_id
+        self.asset_id = row.asset_id
+        self.symbol = row.symbol
+        self.name = row.name
+        self.currency = row.currency
+        self.data_source = row.data_source
+        self.quantity = row.quantity * factor
+        self.bought_quantity = row.bought_quantity * factor
+        self.bought_cost = row.bought_cost
+        self.dividends = row.dividends
+
+def _merge_split_buckets(session: Session, buckets: Sequence[Any]) -> list[Any]:
+    """Scale each bucket by the product of the splits after it and add up the buckets of a position."""
+    split_assets = {row.asset_id for row in buckets if row.splits_after}
+    if not split_assets:
+        return list(buckets)
+    factors = {asset_id: cumulative_split_factors(ratios) for asset_id, (_, ratios) in load_splits(session, split_assets).items()}
+    positions: dict[tuple[uuid.UUID, uuid.UUID], _Position] = {}
+    for row in buckets:
+        asset_factors = factors.get(row.asset_id)
+        # splits_after counts the latest splits, so the factor is the product of the last splits_after ratios
+        factor = float(asset_factors[len(asset_factors) - 1 - row.splits_after]) if asset_factors is not None else 1.0
+        key = (row.account_id, row.asset_id)
+        position = positions.get(key)
+        if position is None:
+            positions[key] = _Position(row, factor)
+        else:
+            position.quantity += row.quantity * factor
+            position.bought_quantity += row.bought_quantity * factor
+            position.bought_cost += row.bought_cost
+            position.dividends += row.dividends
+    return list(positions.values())
@@ -0,0 +1,76 @@
+import csv
+from datetime import datetime
+from importlib import import_module
+from typing import Any, List
+from sqlmodel import Session, select
+from .models import Asset, PriceBar
+import logging
+import time
+
+logger: logging.Logger = logging.getLogger(name=__name__)
+
+PRICE_FIELDS = ("open", "high", "low", "close", "volume")
+
+def _optional_float(value: str | None) -> float | None:
+    return float(value) if value not in (None, "") else None
+
+def upsert_price_bars(session: Session, rows: List[dict[str, Any]]) -> None:
+    """Insert price bars, replacing the stored bar of the same asset and day."""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = import_module(f"sqlalchemy.dialects.{dialect}").insert
+        statement = insert(PriceBar)
+        statement = statement.on_conflict_do_update(
+            index_elements=["asset_id", "date"],
+            set_={field: statement.excluded[field] for field in PRICE_FIELDS},
+        )
+        session.execute(statement, rows)
+    else:
+        for row in rows:
+            session.merge(PriceBar(**row))
+
+def process_price_import(reader: csv.DictReader, session: Session, batch_size: int = 5000) -> dict[str, Any]:
+    """
+    Import daily prices from a CSV file with columns date, symbol, close and optionally open, high, low, volume
+    (the format written by the synthetic data generator). Existing prices for the same asset and day are replaced.
+    """
+    started = time.perf_counter()
+    assets: dict[str, Any] = dict(session.exec(select(Asset.symbol, Asset.id)).all())
+    symbols: set[str] = set()
+    stored = 0
+    skipped = 0
+    errors: List[str] = []
+    batch: List[dict[str, Any]] = []
+
+    for row_num, row in enumerate(iterable=reader, start=2):
+        try:
+            asset_id = assets.get(row["symbol"])
+            if asset_id is None:
+                errors.append(f"Row {row_num}: Asset {row['symbol']} not found.")
+                skipped += 1
+                continue
+            bar = {"asset_id": asset_id, "date": datetime.fromisoformat(row["date"])}
+            bar.update({field: _optional_float(row.get(field)) for field in PRICE_FIELDS})
+            if bar["close"] is None:
+                raise ValueError("close is required")
+            batch.append(bar)
+            symbols.add(row["symbol"])
+        except Exception as e:
+            errors.append(f"Row {row_num}: {str(e)}")
+            skipped += 1
+            continue
+
+        if len(batch) >= batch_size:
+            upsert_price_bars(session, batch)
+            stored += len(batch)
+            batch = []
+
+    upsert_price_bars(session, batch)
+    stored += len(batch)
+    session.commit()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Price import complete: {stored} stored, {skipped} skipped in {elapsed:.1f}s.")
+    return {"stored": stored, "skipped": skipped, "symbols": sorted(symbols), "errors": errors[:100]}
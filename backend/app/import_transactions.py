@@ -3,21 +3,25 @@ import uuid
 from datetime import datetime
 from sqlmodel import Session, select
 from .models import Transaction, TransactionType, Account, Asset
+from .metrics import IMPORT_ROWS, IMPORT_ROWS_PER_SECOND
 from typing import List
 import logging
+import time
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger: logging.Logger = logging.getLogger(name=__name__)
 
-def process_csv_import(reader: csv.DictReader, session: Session) -> None:
+def process_csv_import(reader: csv.DictReader, session: Session, user_id: uuid.UUID | None = None) -> None:
     """
     Import transactions from a CSV file. If a transaction with the same account_id, asset_id, type, quantity, price, fee, and date exists, update it.
+    With user_id, rows for accounts of other users are skipped as not found.
     """
     created = 0
     updated = 0
     skipped = 0
     errors: List[str] = []
+    started = time.perf_counter()
     
     batch_size = 100  # Process in chunks
     batch: List[int] = []
@@ -34,7 +38,8 @@ def process_csv_import(reader: csv.DictReader, session: Session) -> None:
             date = datetime.fromisoformat(row["date"])
             
             # Validate existence
-            if not session.get(Account, account_id):
+            account = session.get(Account, account_id)
+            if not account or (user_id is not None and account.user_id != user_id):
                 errors.append(f"Row {row_num}: Account {account_id} not found.")
                 skipped += 1
                 continue
@@ -91,8 +96,16 @@ def process_csv_import(reader: csv.DictReader, session: Session) -> None:
         session.commit()
         logger.info(f"Committed final batch of {len(batch)} rows.")
     
+    # Record throughput
+    elapsed = time.perf_counter() - started
+    IMPORT_ROWS.labels("created").inc(created)
+    IMPORT_ROWS.labels("updated").inc(updated)
+    IMPORT_ROWS.labels("skipped").inc(skipped)
+    if elapsed > 0:
+        IMPORT_ROWS_PER_SECOND.set((created + updated + skipped) / elapsed)
+
     # Log summary
-    logger.info(f"Import complete: {created} created, {updated} updated, {skipped} skipped.")
+    logger.info(f"Import complete: {created} created, {updated} updated, {skipped} skipped in {elapsed:.1f}s.")
     if errors:
         logger.warning(f"Errors: {errors}")
     
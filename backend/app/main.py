@@ -3,35 +3,61 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from typing import Any, AsyncGenerator
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.templating import Jinja2Templates
+from fastapi import Depends, FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.exception_handlers import http_exception_handler
 from contextlib import asynccontextmanager
-from .database import create_db_and_tables
+from .database import create_db_and_tables, engine
+from .metrics import MetricsMiddleware, instrument_engine, render_metrics
+from . import profiling
+from .oidc import oidc_enabled, warm_oidc_metadata
+from .cache import cache_stats
+from .dependencies import require_monitoring_access
+from ..services.resilience import UpstreamUnavailable, upstream_status
 from .routes.assets import router as assets_router
 from .routes.accounts import router as accounts_router
 from .routes.users import router as users_router
 from .routes.transactions import router as transactions_router
 from .routes.auth import router as auth_router
+from .routes.fx import router as fx_router
+from .routes.reports import router as reports_router
+from .routes.stream import router as stream_router
+from .routes.tax import router as tax_router
+from .routes.backtest import router as backtest_router
+from .streaming import hub
+from .projection import shutdown_executor
+from .templating import warm_templates
 from starlette.middleware.sessions import SessionMiddleware
+import asyncio
+import math
 import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
     create_db_and_tables()
+    warm_templates()
+    # Load OIDC discovery/JWKS in the background so the first SSO login doesn't wait on it
+    oidc_warmup = asyncio.create_task(warm_oidc_metadata()) if oidc_enabled() else None
     yield
+    await hub.close()
+    shutdown_executor()
+    if oidc_warmup:
+        oidc_warmup.cancel()
 
 app = FastAPI(title="Boglefolio", lifespan=lifespan)
 app.add_middleware(
     middleware_class=SessionMiddleware,
     secret_key=os.environ.get("SESSION_SECRET_KEY", default="dev-secret-key")
 )
+app.add_middleware(middleware_class=MetricsMiddleware)
+instrument_engine(engine)
+profiling.instrument_engine(engine)
+if profiling.SQL_PROFILE:
+    app.add_middleware(middleware_class=profiling.SQLProfilerMiddleware)
 
-# Mount static files and templates from frontend directory
+# Mount static files from frontend directory; templates are in templating.py
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
-templates = Jinja2Templates(directory="frontend/templates")
 
 # Custom exception handler for authentication redirects
 @app.exception_handler(HTTPException)
@@ -40,11 +66,25 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
         return RedirectResponse(url=exc.headers["Location"])
     return await http_exception_handler(request, exc)
 
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    # Circuit open or rate limit full: tell clients when to come back instead of failing with a 500
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Price provider unavailable: {exc}"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
 app.include_router(router=assets_router)
 app.include_router(router=accounts_router)
 app.include_router(router=users_router)
 app.include_router(router=transactions_router)
 app.include_router(router=auth_router)
+app.include_router(router=fx_router)
+app.include_router(router=reports_router)
+app.include_router(router=stream_router)
+app.include_router(router=tax_router)
+app.include_router(router=backtest_router)
 
 @app.get("/", response_class=HTMLResponse)
 def read_root(request: Request):
@@ -52,4 +92,26 @@ def read_root(request: Request):
     if user:
         return RedirectResponse(url="/dashboard")
     else:
-        return RedirectResponse(url="/login")
\ No newline at end of file
+        return RedirectResponse(url="/login")
+
+@app.get("/cache/stats", tags=["monitoring"], dependencies=[Depends(require_monitoring_access)])
+def read_cache_stats() -> list[dict[str, Any]]:
+    """Size and hit-rate statistics for the in-process caches of this worker."""
+    return cache_stats()
+
+@app.get("/providers/status", tags=["monitoring"], dependencies=[Depends(require_monitoring_access)])
+def read_provider_status() -> list[dict[str, Any]]:
+    """Circuit breaker state, rate limiter tokens and call counters of each upstream provider in this worker."""
+    return upstream_status()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_monitoring_access)])
+def read_metrics() -> Response:
+    """Prometheus metrics: request, SQL, provider, cache and import instrumentation."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+if profiling.SQL_PROFILE:
+    @app.get("/debug/sql-profiles", tags=["monitoring"], dependencies=[Depends(require_monitoring_access)])
+    def read_sql_profiles() -> list[dict[str, Any]]:
+        """SQL summaries of the most recent requests, newest first."""
+        return list(reversed(profiling.recent_profiles))
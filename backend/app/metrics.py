@@ -0,0 +1,202 @@
+"""Prometheus metrics for requests, SQL, price providers, caches, imports and live streams.
+
+Set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before starting uvicorn with
+several workers: every worker then writes its samples there and /metrics aggregates them.
+"""
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, TypeVar
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import Engine, event
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+REQUEST_LATENCY = Histogram(
+    "boglefolio_http_request_duration_seconds",
+    "Time until the response was fully sent, per route",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "boglefolio_http_requests_in_flight",
+    "Requests currently being handled",
+    multiprocess_mode="livesum",
+)
+SQL_QUERY_DURATION = Histogram(
+    "boglefolio_sql_query_duration_seconds",
+    "Duration of individual SQL statements",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+SQL_QUERIES_PER_REQUEST = Histogram(
+    "boglefolio_sql_queries_per_request",
+    "Number of SQL statements executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+SQL_TIME_PER_REQUEST = Histogram(
+    "boglefolio_sql_request_duration_seconds",
+    "Total time spent in SQL statements per request",
+    ["route"],
+)
+PROVIDER_LATENCY = Histogram(
+    "boglefolio_provider_request_duration_seconds",
+    "Latency of upstream price-provider calls",
+    ["provider", "operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+PROVIDER_ERRORS = Counter(
+    "boglefolio_provider_errors_total",
+    "Failed upstream price-provider calls",
+    ["provider", "operation"],
+)
+PROVIDER_RETRIES = Counter(
+    "boglefolio_provider_retries_total",
+    "Upstream price-provider calls retried after a transient error",
+    ["provider", "operation"],
+)
+PROVIDER_REJECTED = Counter(
+    "boglefolio_provider_rejected_total",
+    "Upstream price-provider calls not made, by reason (circuit_open or rate_limited)",
+    ["provider", "reason"],
+)
+PROVIDER_THROTTLE_WAIT = Histogram(
+    "boglefolio_provider_throttle_wait_seconds",
+    "Time upstream price-provider calls waited for the rate limiter",
+    ["provider"],
+    buckets=(0.0, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PROVIDER_CIRCUIT_STATE = Gauge(
+    "boglefolio_provider_circuit_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open",
+    ["provider"],
+    multiprocess_mode="max",
+)
+CACHE_LOOKUPS = Counter(
+    "boglefolio_cache_lookups_total",
+    "Cache lookups by result (hit or miss)",
+    ["cache", "result"],
+)
+PASSWORD_JOBS_PENDING = Gauge(
+    "boglefolio_password_jobs_pending",
+    "Password hash/verify jobs waiting on or running in the password executor",
+    multiprocess_mode="livesum",
+)
+IMPORT_ROWS = Counter(
+    "boglefolio_import_rows_total",
+    "Rows processed by the CSV importer, by result",
+    ["result"],
+)
+IMPORT_ROWS_PER_SECOND = Gauge(
+    "boglefolio_import_rows_per_second",
+    "Throughput of the most recent CSV import",
+    multiprocess_mode="mostrecent",
+)
+STREAM_SUBSCRIBERS = Gauge(
+    "boglefolio_stream_subscribers",
+    "Clients connected to the live price and portfolio streams",
+    multiprocess_mode="livesum",
+)
+STREAM_SYMBOLS = Gauge(
+    "boglefolio_stream_symbols",
+    "Distinct symbols refreshed for the live streams",
+    multiprocess_mode="livesum",
+)
+STREAM_TICKS_COALESCED = Counter(
+    "boglefolio_stream_ticks_coalesced_total",
+    "Price ticks replaced by a newer tick before a slow stream client read them",
+)
+
+class RequestStats:
+    """SQL activity of the request being handled, shared with the threadpool through a context variable."""
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+current_request_stats: ContextVar[RequestStats | None] = ContextVar("current_request_stats", default=None)
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement executed on the engine and attribute it to the current request."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        SQL_QUERY_DURATION.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL usage per route."""
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        finished: float | None = None
+
+        async def send_wrapper(message: dict[str, Any]) -> None:
+            nonlocal status_code, finished
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Background tasks run after this, so don't count them in the request latency
+                finished = time.perf_counter()
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            current_request_stats.reset(token)
+            # The router stores the matched route in the scope; use its template to keep label cardinality low
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            elapsed = (finished or time.perf_counter()) - started
+            REQUEST_LATENCY.labels(scope["method"], route_path, str(status_code)).observe(elapsed)
+            SQL_QUERIES_PER_REQUEST.labels(route_path).observe(stats.queries)
+            SQL_TIME_PER_REQUEST.labels(route_path).observe(stats.sql_seconds)
+
+def observe_provider(provider: str, operation: str) -> Callable[[F], F]:
+    """Decorator recording latency and errors of a price-provider call."""
+    latency = PROVIDER_LATENCY.labels(provider, operation)
+    errors = PROVIDER_ERRORS.labels(provider, operation)
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def render_metrics() -> tuple[bytes, str]:
+    """Metrics in the Prometheus text format, aggregated over all workers in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,7 +1,8 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, UniqueConstraint, true
 import uuid
 from datetime import datetime
-from .schemas import DataSource, TransactionType
+from .schemas import CorporateActionType, DataSource, SeriesTier, TransactionType
 
 class Asset(SQLModel, table=True):
     """Table of assets held by users. One entry for each symbol/ticker and the source of pricing data
@@ -11,6 +12,8 @@ class Asset(SQLModel, table=True):
         name (str, optional): Name of the asset.
         currency (str): Asset currency (ISO 4217 currency code). Defaults to USD.
         data_source (str, optional)): Data source for pricing data (Yahoo, manual, etc).
+        tracking_index (str, optional): Index the asset tracks (e.g. "S&P 500"). Assets tracking the same index
+            are treated as substantially identical for wash sales.
     """
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True)
     symbol: str = Field(max_length=10, index=True, unique=True, description="Ticker symbol of the asset")
@@ -18,6 +21,7 @@ class Asset(SQLModel, table=True):
     currency: str = Field(default="USD", max_length=3)
     transactions: list["Transaction"] = Relationship(back_populates="asset")
     data_source: DataSource = Field(default=DataSource.YAHOO, max_length=20)
+    tracking_index: str | None = Field(default=None, max_length=50, index=True)
 
 class Account(SQLModel, table=True):
     """Table of investment accounts.
@@ -27,12 +31,14 @@ class Account(SQLModel, table=True):
         name (str, optional): Name of the account.
         user_id (uuid.UUID): ID of the user who owns the account.
         balance (float): Current balance of the account.
+        taxable (bool): Whether gains and losses in the account are taxed (False for tax-advantaged accounts). Defaults to True.
     """
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True)
     name: str | None = Field(default=None, max_length=100)
-    user_id: uuid.UUID = Field(foreign_key="user.id")
+    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
     user: "User" = Relationship(back_populates="accounts")
     balance: float | None = Field(default=0.0)
+    taxable: bool = Field(default=True, sa_column_kwargs={"server_default": true()})
     transactions: list["Transaction"] = Relationship(back_populates="account")
 
 class Transaction(SQLModel, table=True):
@@ -50,6 +56,9 @@ class Transaction(SQLModel, table=True):
         fee (float): Transaction fee.
         date (datetime): Date and time of the transaction.
     """
+    # Per-asset date ranges (wash-sale windows, price-history joins) read this index
+    __table_args__ = (Index("ix_transaction_asset_id_date", "asset_id", "date"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True)
     asset_id: uuid.UUID = Field(foreign_key="asset.id", index=True)
     asset: Asset | None = Relationship(back_populates="transactions")
@@ -69,10 +78,141 @@ class User(SQLModel, table=True):
         username (str): Username of the user.
         email (str): Email address of the user.
         password_hash (str): Hashed password for local authentication.
+        base_currency (str): Currency holdings are valued in (ISO 4217 currency code). Defaults to USD.
         accounts (list[Account]): Link to accounts table for all accounts owned by this user.
     """
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True)
     username: str = Field(max_length=50, unique=True, index=True)
     email: str | None = Field(default=None, max_length=100, unique=True)
     password_hash: str | None = Field(default=None, max_length=255)  # New field
-    accounts: list[Account] = Relationship(back_populates="user")
\ No newline at end of file
+    base_currency: str = Field(default="USD", max_length=3, sa_column_kwargs={"server_default": "USD"})
+    accounts: list[Account] = Relationship(back_populates="user")
+
+class CorporateAction(SQLModel, table=True):
+    """Table of corporate actions (splits and cash dividends) reported by an asset's data source
+
+    Args:
+        id (uuid.UUID): Unique identifier for the corporate action.
+        asset_id (uuid.UUID): ID of the asset the action applies to.
+        type (CorporateActionType): Split or dividend.
+        date (datetime): Ex-date of the action.
+        value (float): Split ratio (new shares per old share) or dividend per share.
+    """
+    __table_args__ = (UniqueConstraint("asset_id", "type", "date"),)
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True)
+    asset_id: uuid.UUID = Field(foreign_key="asset.id", index=True)
+    type: CorporateActionType = Field(max_length=20)
+    date: datetime = Field(index=True)
+    value: float
+
+class ProviderSync(SQLModel, table=True):
+    """Table recording when data was last fetched from a provider, so cached data isn't refetched too often
+
+    Args:
+        dataset (str): Kind of data fetched (e.g. corporate_actions).
+        key (str): What it was fetched for, usually the asset symbol.
+        synced_at (datetime): When the data was last fetched.
+    """
+    dataset: str = Field(max_length=30, primary_key=True)
+    key: str = Field(max_length=50, primary_key=True)
+    synced_at: datetime = Field(default_factory=datetime.now)
+
+class FxRate(SQLModel, table=True):
+    """Table of daily exchange rates, stored against a single pivot currency (USD)
+
+    Args:
+        currency (str): Currency the rate is for (ISO 4217 currency code).
+        date (datetime): Trading day of the rate.
+        rate (float): Value of one unit of the currency in the pivot currency (USD per unit).
+    """
+    currency: str = Field(max_length=3, primary_key=True)
+    date: datetime = Field(primary_key=True)
+    rate: float
+
+class PriceBar(SQLModel, table=True):
+    """Table of daily prices for assets priced by the manual provider, entered or uploaded as CSV
+
+    Args:
+        asset_id (uuid.UUID): ID of the asset the price is for.
+        date (datetime): Trading day of the price.
+        open (float, optional): Opening price.
+        high (float, optional): Highest price of the day.
+        low (float, optional): Lowest price of the day.
+        close (float): Closing price, used as the asset price.
+        volume (float, optional): Traded volume.
+    """
+    asset_id: uuid.UUID = Field(foreign_key="asset.id", primary_key=True)
+    date: datetime = Field(primary_key=True)
+    open: float | None = None
+    high: float | None = None
+    low: float | None = None
+    close: float
+    volume: float | None = None
+
+class PortfolioValue(SQLModel, table=True):
+    """Table of end-of-day portfolio values per user, in the user's base currency
+
+    Args:
+        user_id (uuid.UUID): ID of the user whose accounts are valued.
+        date (datetime): Trading day of the value.
+        value (float): Market value of all holdings at the close.
+        net_flow (float): Money put in (buys) minus taken out (sells) on that day.
+    """
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    date: datetime = Field(primary_key=True)
+    value: float
+    net_flow: float = 0.0
+
+class PortfolioValueRollup(SQLModel, table=True):
+    """Table of weekly and monthly rollups of the daily portfolio values, for long-range charts
+
+    Args:
+        user_id (uuid.UUID): ID of the user whose accounts are valued.
+        tier (SeriesTier): Week or month.
+        start (datetime): First day of the week (Monday) or month.
+        open (float): Value on the first trading day of the period.
+        high (float): Highest daily value in the period.
+        low (float): Lowest daily value in the period.
+        close (float): Value on the last trading day of the period.
+        net_flow (float): Sum of the daily net flows in the period.
+    """
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    tier: SeriesTier = Field(primary_key=True, max_length=10)
+    start: datetime = Field(primary_key=True)
+    open: float
+    high: float
+    low: float
+    close: float
+    net_flow: float = 0.0
+
+class DataVersion(SQLModel, table=True):
+    """Table of write counters used to build ETags, one row per table and per (table, user)
+
+    Args:
+        scope (str): Table name, or table name and user ID hex separated by a colon.
+        version (int): Incremented by every write to the scope.
+    """
+    scope: str = Field(max_length=100, primary_key=True)
+    version: int = 0
+
+class PortfolioValueDirty(SQLModel, table=True):
+    """Table of the earliest day whose stored portfolio values are out of date, per user
+
+    Args:
+        user_id (uuid.UUID): ID of the user whose transactions changed.
+        since (datetime): Earliest date of a transaction written, edited or deleted since the values were last computed.
+    """
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    since: datetime
+
+class AnalyticsDirtyYear(SQLModel, table=True):
+    """Table of the years of an exported dataset with rows written since the last analytics export
+
+    Args:
+        dataset (str): Name of the exported dataset (e.g. "transactions").
+        year (int): Calendar year of a row written, edited or deleted.
+        marked (datetime): When the year was last marked; an export only clears marks it has seen.
+    """
+    dataset: str = Field(primary_key=True, max_length=32)
+    year: int = Field(primary_key=True)
+    marked: datetime
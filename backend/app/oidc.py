@@ -1,37 +1,185 @@
-from authlib.integrations.starlette_client import OAuth
 from fastapi import Request
+from typing import TYPE_CHECKING, Any, NamedTuple
+import asyncio
 import os
 import logging
+import time
+
+if TYPE_CHECKING:
+    from authlib.integrations.starlette_client import StarletteOAuth2App
 
 logger = logging.getLogger(__name__)
 
-# Debug: Print environment variables
-client_id = os.getenv("OIDC_CLIENT_ID")
-client_secret = os.getenv("OIDC_CLIENT_SECRET") 
-issuer = os.getenv("OIDC_ISSUER")
+# OIDC is optional: nothing is imported or fetched until the first SSO login.
+# Discovery document and JWKS are cached and refreshed in the background once older than the TTL.
+OIDC_METADATA_TTL = float(os.getenv("OIDC_METADATA_TTL", "3600"))
+# Minimum seconds between forced JWKS refreshes triggered by an unknown key id
+OIDC_JWKS_MIN_REFRESH = float(os.getenv("OIDC_JWKS_MIN_REFRESH", "30"))
+OIDC_HTTP_TIMEOUT = float(os.getenv("OIDC_HTTP_TIMEOUT", "10"))
+
+class OIDCSettings(NamedTuple):
+    client_id: str
+    client_secret: str
+    issuer: str
+
+def get_oidc_settings() -> OIDCSettings | None:
+    """Read the OIDC settings from the environment.
+
+    Returns:
+        OIDCSettings | None: The settings, or None if OIDC is not configured at all.
+
+    Raises:
+        ValueError: If OIDC is only partially configured or the issuer is not an http(s) URL.
+    """
+    client_id = os.getenv("OIDC_CLIENT_ID")
+    client_secret = os.getenv("OIDC_CLIENT_SECRET")
+    issuer = os.getenv("OIDC_ISSUER")
+    if not any([client_id, client_secret, issuer]):
+        return None
+    if not all([client_id, client_secret, issuer]):
+        raise ValueError("Missing required OIDC environment variables: OIDC_CLIENT_ID, OIDC_CLIENT_SECRET, OIDC_ISSUER")
+    if not issuer.startswith(('http://', 'https://')):
+        raise ValueError(f"OIDC_ISSUER must start with http:// or https://. Got: {issuer}")
+    return OIDCSettings(client_id=client_id, client_secret=client_secret, issuer=issuer.rstrip("/"))
+
+def oidc_enabled() -> bool:
+    return get_oidc_settings() is not None
+
+class OIDCMetadataCache:
+    """Discovery document and JWKS of one issuer.
+
+    The first lookup waits for the fetch; afterwards stale entries are served while a single
+    background refresh runs, so login and callback requests don't wait on discovery round trips.
+
+    Args:
+        issuer (str): Issuer URL, without the trailing slash.
+        ttl (float): Seconds before the cached documents are refreshed.
+        jwks_min_refresh (float): Minimum seconds between forced JWKS refreshes.
+    """
+    def __init__(self, issuer: str, ttl: float = OIDC_METADATA_TTL, jwks_min_refresh: float = OIDC_JWKS_MIN_REFRESH) -> None:
+        self.metadata_url = f"{issuer}/.well-known/openid-configuration"
+        self.ttl = ttl
+        self.jwks_min_refresh = jwks_min_refresh
+        self.metadata: dict[str, Any] | None = None
+        self.jwks: dict[str, Any] | None = None
+        self.loaded_at = 0.0
+        self.jwks_loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._background: asyncio.Task | None = None
+
+    async def _fetch_json(self, url: str) -> dict[str, Any]:
+        import httpx
+        async with httpx.AsyncClient(timeout=OIDC_HTTP_TIMEOUT) as client:
+            response = await client.get(url)
+            response.raise_for_status()
+            return response.json()
+
+    def is_stale(self) -> bool:
+        return self.metadata is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def refresh(self) -> None:
+        started = time.monotonic()
+        async with self._lock:
+            # Another coroutine refreshed while we waited for the lock
+            if self.loaded_at >= started:
+                return
+            metadata = await self._fetch_json(self.metadata_url)
+            jwks = await self._fetch_json(metadata["jwks_uri"]) if metadata.get("jwks_uri") else {"keys": []}
+            self.metadata, self.jwks = metadata, jwks
+            self.loaded_at = self.jwks_loaded_at = time.monotonic()
+            logger.info(f"Loaded OIDC metadata from {self.metadata_url}")
+
+    async def refresh_jwks(self) -> None:
+        started = time.monotonic()
+        async with self._lock:
+            if self.jwks_loaded_at >= started or time.monotonic() - self.jwks_loaded_at < self.jwks_min_refresh:
+                return
+            jwks_uri = (self.metadata or {}).get("jwks_uri")
+            if not jwks_uri:
+                raise ValueError(f"The OIDC discovery document at {self.metadata_url} has no jwks_uri")
+            self.jwks = await self._fetch_json(jwks_uri)
+            self.jwks_loaded_at = time.monotonic()
+            logger.info("Refreshed OIDC JWKS after an unknown key id")
+
+    def refresh_in_background(self) -> None:
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"OIDC metadata refresh failed, keeping cached copy: {e}")
+
+    async def get_metadata(self) -> dict[str, Any]:
+        if self.metadata is None:
+            await self.refresh()
+        elif self.is_stale():
+            self.refresh_in_background()
+        return self.metadata
+
+    async def get_jwks(self, force: bool = False) -> dict[str, Any]:
+        await self.get_metadata()
+        if force:
+            await self.refresh_jwks()
+        return self.jwks
+
+_client: "StarletteOAuth2App | None" = None
+_metadata_cache: OIDCMetadataCache | None = None
+
+def get_metadata_cache() -> OIDCMetadataCache | None:
+    global _metadata_cache
+    if _metadata_cache is None:
+        settings = get_oidc_settings()
+        if settings is None:
+            return None
+        _metadata_cache = OIDCMetadataCache(issuer=settings.issuer)
+    return _metadata_cache
+
+def get_oidc_client() -> "StarletteOAuth2App | None":
+    """Register the OIDC client on first use. Returns None if OIDC is not configured."""
+    global _client
+    if _client is not None:
+        return _client
+    settings = get_oidc_settings()
+    if settings is None:
+        return None
+
+    from authlib.integrations.starlette_client import OAuth, StarletteOAuth2App
+    metadata_cache = get_metadata_cache()
 
-logger.info(f"OIDC_CLIENT_ID: {client_id}")
-logger.info(f"OIDC_CLIENT_SECRET: {'***' if client_secret else None}")
-logger.info(f"OIDC_ISSUER: {issuer}")
+    class CachedMetadataOAuth2App(StarletteOAuth2App):
+        # Serve discovery and JWKS from the shared cache instead of fetching them per flow
+        async def load_server_metadata(self) -> dict[str, Any]:
+            self.server_metadata.update(await metadata_cache.get_metadata())
+            return self.server_metadata
 
-# Validate required environment variables
-if not all([client_id, client_secret, issuer]):
-    raise ValueError("Missing required OIDC environment variables: OIDC_CLIENT_ID, OIDC_CLIENT_SECRET, OIDC_ISSUER")
+        async def fetch_jwk_set(self, force: bool = False) -> dict[str, Any]:
+            # authlib forces a refresh when the id_token is signed with an unknown key id
+            return await metadata_cache.get_jwks(force=force)
 
-if not issuer.startswith(('http://', 'https://')):
-    raise ValueError(f"OIDC_ISSUER must start with http:// or https://. Got: {issuer}")
+    logger.info(f"OIDC_CLIENT_ID: {settings.client_id}")
+    logger.info(f"OIDC_ISSUER: {settings.issuer}")
+    oauth = OAuth()
+    oauth.register(
+        name="oidc",
+        client_id=settings.client_id,
+        client_secret=settings.client_secret,
+        server_metadata_url=metadata_cache.metadata_url,
+        client_kwargs={"scope": "openid email profile"},
+        client_cls=CachedMetadataOAuth2App,
+    )
+    _client = oauth.oidc
+    return _client
 
-oauth = OAuth()
-oauth.register(
-    name="oidc",
-    client_id=client_id,
-    client_secret=client_secret,
-    server_metadata_url=f"{issuer}/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
-)
+async def warm_oidc_metadata() -> None:
+    """Fetch the discovery document and JWKS ahead of the first login, if OIDC is configured."""
+    metadata_cache = get_metadata_cache()
+    if metadata_cache is not None:
+        await metadata_cache._refresh_quietly()
 
 async def get_current_user(request: Request):
     user = request.session.get("user")
     if user:
         return user
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,344 @@
+"""Daily portfolio values per user and their weekly/monthly rollups.
+
+Daily values are computed with numpy from the ledger and the providers' price histories and are
+stored in PortfolioValue; the weeks and months touched by an update are re-aggregated into
+PortfolioValueRollup. Updates are incremental: they recompute the last stored day (which may
+have been valued with intraday prices) and the days after it. Every ORM write of a transaction
+records its date in PortfolioValueDirty, so an update also recomputes from the earliest
+backdated, edited or deleted transaction since the last one. A rebuild recomputes everything.
+
+Charts read the coarsest tier that still gives them enough points, so a 30-year chart reads a few
+hundred monthly rows instead of every trading day.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Sequence
+import logging
+import uuid
+from sqlalchemy import Connection, delete, event, func, insert, inspect, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from .downsample import downsample
+from .models import Account, Asset, PortfolioValue, PortfolioValueDirty, PortfolioValueRollup, Transaction, User
+from .schemas import DataSource, SeriesTier, TransactionType, ValuePointRead, ValueSeriesRead
+from ..services.corporate_actions import load_splits, split_factors_at
+from ..services.fx import convert_matrix
+from ..services.providers import get_provider
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFLOW_TYPES = (TransactionType.BUY, TransactionType.DIVIDEND_REINVESTED)
+# Price history fetched before the first computed day, so that day has a previous close to carry forward
+PRICE_LOOKBACK_DAYS = 14
+# Trading days per point of each tier, used to pick the tier for a point budget
+TIER_DAYS = {SeriesTier.DAY: 1, SeriesTier.WEEK: 5, SeriesTier.MONTH: 21}
+TRADING_DAYS_PER_CALENDAR_DAY = 252 / 365
+ROLLUP_TIERS = (SeriesTier.WEEK, SeriesTier.MONTH)
+
+def _day(value: Any) -> np.datetime64:
+    import numpy as np
+    if getattr(value, "tzinfo", None) is not None:
+        value = value.replace(tzinfo=None)
+    return np.datetime64(value, "D")
+
+def _as_of(event_days: np.ndarray, values: np.ndarray, days: np.ndarray, default: float) -> np.ndarray:
+    """Value of the latest event on or before each day (default before the first event)."""
+    import numpy as np
+    positions = np.searchsorted(event_days, days, side="right") - 1
+    result = np.where(positions >= 0, values[np.maximum(positions, 0)], default) if len(values) else np.full(len(days), default)
+    return result.astype(np.float64)
+
+def _price_histories(assets: Sequence[Asset], start: datetime, end: datetime) -> dict[uuid.UUID, tuple[np.ndarray, np.ndarray]]:
+    """Daily closes of every asset as (days, closes), with one provider call per data source."""
+    import numpy as np
+    by_source: dict[DataSource, list[Asset]] = {}
+    for asset in assets:
+        by_source.setdefault(asset.data_source, []).append(asset)
+    closes: dict[uuid.UUID, tuple[np.ndarray, np.ndarray]] = {}
+    for data_source, source_assets in by_source.items():
+        provider = get_provider(data_source)
+        try:
+            histories = provider.get_histories([asset.symbol for asset in source_assets], start=start, end=end)
+        except Exception as e:
+            logger.warning(f"Price history lookup failed for {len(source_assets)} symbols from {provider.name}: {e}")
+            continue
+        for asset in source_assets:
+            records = [record for record in histories.get(asset.symbol, []) if record.get("Close") is not None]
+            if records:
+                closes[asset.id] = (
+                    np.array([_day(record["Date"]) for record in records], dtype="datetime64[D]"),
+                    np.array([record["Close"] for record in records], dtype=np.float64),
+                )
+    return closes
+
+def compute_daily_values(session: Session, user: User, start: datetime, end: datetime) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Value and net flow of the user's portfolio on each trading day from start to end.
+
+    Positions are split-adjusted like the holdings, so they match split-adjusted price histories.
+    Days without a provider close fall back to the latest transaction price of the asset.
+    Returns (days, values, net flows), values and flows in the user's base currency.
+    """
+    import numpy as np
+    days = np.arange(_day(start), _day(end) + 1, dtype="datetime64[D]")
+    days = days[np.is_busday(days)]
+    if not len(days):
+        return days, np.empty(0), np.empty(0)
+
+    rows = session.exec(
+        select(Transaction.asset_id, Transaction.date, Transaction.type, Transaction.quantity, Transaction.price, Transaction.fee)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(Account.user_id == user.id, Transaction.date < datetime.combine(end.date(), datetime.min.time()) + timedelta(days=1))
+        .order_by(Transaction.asset_id, Transaction.date)
+    ).all()
+    if not rows:
+        return days, np.zeros(len(days)), np.zeros(len(days))
+
+    asset_ids = list(dict.fromkeys(row.asset_id for row in rows))
+    assets = {asset.id: asset for asset in session.exec(select(Asset).where(Asset.id.in_(asset_ids))).all()}
+    splits = load_splits(session, asset_ids)
+    closes = _price_histories(list(assets.values()), start - timedelta(days=PRICE_LOOKBACK_DAYS), end)
+
+    values = np.zeros((len(days), len(asset_ids)), dtype=np.float64)
+    flows = np.zeros((len(days), len(asset_ids)), dtype=np.float64)
+    first = 0
+    for column, asset_id in enumerate(asset_ids):
+        # Rows are ordered by asset, so each asset's transactions are one contiguous slice
+        last = first
+        while last < len(rows) and rows[last].asset_id == asset_id:
+            last += 1
+        asset_rows = rows[first:last]
+        first = last
+
+        dates = np.array([row.date for row in asset_rows], dtype="datetime64[us]")
+        tx_days = dates.astype("datetime64[D]")
+        quantities = np.array([row.quantity for row in asset_rows], dtype=np.float64)
+        prices = np.array([row.price for row in asset_rows], dtype=np.float64)
+        fees = np.array([row.fee for row in asset_rows], dtype=np.float64)
+        inflow = np.array([row.type in INFLOW_TYPES for row in asset_rows])
+        sell = np.array([row.type == TransactionType.SELL for row in asset_rows])
+        factors = split_factors_at(dates, *splits[asset_id]) if asset_id in splits else np.ones(len(dates))
+
+        signed = np.where(inflow, quantities, np.where(sell, -quantities, 0.0)) * factors
+        position = _as_of(tx_days, np.cumsum(signed), days, 0.0)
+        trade = inflow | sell
+        fallback = _as_of(tx_days[trade], (prices / factors)[trade], days, np.nan)
+        if asset_id in closes:
+            close = _as_of(*closes[asset_id], days, np.nan)
+            close = np.where(np.isnan(close), fallback, close)
+        else:
+            close = fallback
+        values[:, column] = np.nan_to_num(position * close)
+
+        # Buys bring money in and sells take it out; reinvested dividends stay inside the portfolio
+        buy = np.array([row.type == TransactionType.BUY for row in asset_rows])
+        cash = np.where(buy, quantities * prices + fees, np.where(sell, -(quantities * prices - fees), 0.0))
+        # Trades on a weekend or holiday count on the next trading day
+        buckets = np.searchsorted(days, tx_days, side="left")
+        in_range = (buckets < len(days)) & (tx_days >= _day(start)) & (buy | sell)
+        np.add.at(flows[:, column], buckets[in_range], cash[in_range])
+
+    currencies = [assets[asset_id].currency.upper() if asset_id in assets else user.base_currency.upper() for asset_id in asset_ids]
+    if any(currency != user.base_currency.upper() for currency in currencies):
+        values = convert_matrix(session, values, days, currencies, user.base_currency)
+        flows = convert_matrix(session, flows, days, currencies, user.base_currency)
+        if np.isnan(values).any():
+            logger.warning(f"Missing FX rates while valuing the portfolio of user {user.id}; those positions count as zero")
+    return days, np.nansum(values, axis=1), np.nansum(flows, axis=1)
+
+def _rollup_starts(days: np.ndarray, tier: SeriesTier) -> np.ndarray:
+    import numpy as np
+    if tier == SeriesTier.WEEK:
+        # 1970-01-01 was a Thursday, so shift by 3 days to start weeks on Monday
+        return ((days - np.datetime64("1970-01-05")) // np.timedelta64(7, "D")) * np.timedelta64(7, "D") + np.datetime64("1970-01-05")
+    return days.astype("datetime64[M]").astype("datetime64[D]")
+
+def _period_start(value: datetime, tier: SeriesTier) -> datetime:
+    """First day of the week or month containing value."""
+    import numpy as np
+    return datetime.combine(_rollup_starts(np.array([_day(value)]), tier)[0].astype(datetime), datetime.min.time())
+
+def rollup_rows(user_id: uuid.UUID, days: np.ndarray, values: np.ndarray, flows: np.ndarray, tier: SeriesTier) -> list[dict[str, Any]]:
+    """Open/high/low/close of the values and the summed flows per week or month (days must be sorted)."""
+    import numpy as np
+    if not len(days):
+        return []
+    starts = _rollup_starts(days, tier)
+    boundaries = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    ends = np.r_[boundaries[1:], len(days)] - 1
+    highs = np.maximum.reduceat(values, boundaries)
+    lows = np.minimum.reduceat(values, boundaries)
+    net_flows = np.add.reduceat(flows, boundaries)
+    return [
+        {
+            "user_id": user_id,
+            "tier": tier,
+            "start": datetime.combine(starts[first].astype(datetime), datetime.min.time()),
+            "open": float(values[first]),
+            "high": float(high),
+            "low": float(low),
+            "close": float(values[last]),
+            "net_flow": float(flow),
+        }
+        for first, last, high, low, flow in zip(boundaries.tolist(), ends.tolist(), highs, lows, net_flows)
+    ]
+
+def update_rollups(session: Session, user_id: uuid.UUID, since: datetime) -> None:
+    """Re-aggregate every week and month containing days on or after since."""
+    import numpy as np
+    for tier in ROLLUP_TIERS:
+        period_start = _period_start(since, tier)
+        rows = session.exec(
+            select(PortfolioValue.date, PortfolioValue.value, PortfolioValue.net_flow)
+            .where(PortfolioValue.user_id == user_id, PortfolioValue.date >= period_start)
+            .order_by(PortfolioValue.date)
+        ).all()
+        session.exec(delete(PortfolioValueRollup).where(
+            PortfolioValueRollup.user_id == user_id,
+            PortfolioValueRollup.tier == tier,
+            PortfolioValueRollup.start >= period_start,
+        ).execution_options(version_users=[user_id]))
+        days = np.array([row.date for row in rows], dtype="datetime64[D]")
+        rollups = rollup_rows(
+            user_id,
+            days,
+            np.array([row.value for row in rows], dtype=np.float64),
+            np.array([row.net_flow for row in rows], dtype=np.float64),
+            tier,
+        )
+        if rollups:
+            session.execute(insert(PortfolioValueRollup).execution_options(version_users=[user_id]), rollups)
+
+def mark_values_dirty(connection: Connection, dirty: dict[uuid.UUID, datetime]) -> None:
+    """Record that each user's stored values are out of date from the given day on (keeping an earlier day)."""
+    if not dirty:
+        return
+    existing = dict(connection.execute(
+        select(PortfolioValueDirty.user_id, PortfolioValueDirty.since).where(PortfolioValueDirty.user_id.in_(list(dirty)))
+    ).all())
+    for user_id, since in dirty.items():
+        if user_id not in existing:
+            connection.execute(insert(PortfolioValueDirty).values(user_id=user_id, since=since))
+        elif since < existing[user_id]:
+            connection.execute(update(PortfolioValueDirty).where(PortfolioValueDirty.user_id == user_id).values(since=since))
+
+@event.listens_for(OrmSession, "after_flush")
+def _mark_changed_transactions(session: OrmSession, flush_context: Any) -> None:
+    # Old and new values both count: moving a transaction changes the days of its old date and account too
+    earliest: dict[uuid.UUID, datetime] = {}
+    for instance in (*session.new, *session.deleted, *session.dirty):
+        if not isinstance(instance, Transaction):
+            continue
+        dates = [instance.date]
+        account_ids = [instance.account_id]
+        if instance in session.dirty:
+            if not session.is_modified(instance, include_collections=False):
+                continue
+            state = inspect(instance)
+            dates += state.attrs.date.history.deleted
+            account_ids += state.attrs.account_id.history.deleted
+        for account_id in account_ids:
+            if account_id is not None:
+                earliest[account_id] = min([date for date in dates if date is not None] + [earliest.get(account_id, datetime.max)])
+    if not earliest:
+        return
+    connection = session.connection()
+    owners = connection.execute(select(Account.id, Account.user_id).where(Account.id.in_(list(earliest)))).all()
+    dirty: dict[uuid.UUID, datetime] = {}
+    for account_id, user_id in owners:
+        dirty[user_id] = min(earliest[account_id], dirty.get(user_id, datetime.max))
+    mark_values_dirty(connection, dirty)
+
+def update_portfolio_values(session: Session, user: User, end: datetime | None = None, rebuild: bool = False) -> int:
+    """Compute and store the daily values from the last stored day or the earliest changed transaction, whichever
+    is earlier (all of them with rebuild).
+
+    Returns the number of days written.
+    """
+    import numpy as np
+    end = end or datetime.now()
+    last: datetime | None = None
+    dirty_since = session.exec(select(PortfolioValueDirty.since).where(PortfolioValueDirty.user_id == user.id)).first()
+    if not rebuild:
+        last = session.exec(select(func.max(PortfolioValue.date)).where(PortfolioValue.user_id == user.id)).one()
+    if last is not None:
+        start = min(last, dirty_since) if dirty_since is not None else last
+    else:
+        first = session.exec(
+            select(func.min(Transaction.date)).join(Account, Account.id == Transaction.account_id).where(Account.user_id == user.id)
+        ).one()
+        if first is None:
+            return 0
+        start = first
+    start = datetime.combine(start.date(), datetime.min.time())
+    if start > end:
+        return 0
+
+    days, values, flows = compute_daily_values(session, user, start, end)
+    session.exec(delete(PortfolioValue).where(PortfolioValue.user_id == user.id, PortfolioValue.date >= start).execution_options(version_users=[user.id]))
+    if len(days):
+        dates = [datetime.combine(day, datetime.min.time()) for day in days.astype(datetime).tolist()]
+        session.execute(insert(PortfolioValue).execution_options(version_users=[user.id]), [
+            {"user_id": user.id, "date": date, "value": value, "net_flow": flow}
+            for date, value, flow in zip(dates, values.tolist(), flows.tolist())
+        ])
+    update_rollups(session, user.id, start)
+    # Keep the mark if a transaction written meanwhile moved it to an earlier day
+    if dirty_since is not None:
+        session.exec(delete(PortfolioValueDirty).where(PortfolioValueDirty.user_id == user.id, PortfolioValueDirty.since >= dirty_since))
+    session.commit()
+    return int(len(days))
+
+def choose_tier(trading_days: int, max_points: int) -> SeriesTier:
+    """The finest tier whose number of points fits the budget (months if none does)."""
+    for tier in (SeriesTier.DAY, SeriesTier.WEEK):
+        if trading_days / TIER_DAYS[tier] <= max_points:
+            return tier
+    return SeriesTier.MONTH
+
+def get_value_series(
+    session: Session,
+    user: User,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    max_points: int = 500,
+    tier: SeriesTier | None = None,
+) -> ValueSeriesRead:
+    """Stored portfolio values of a user between start and end, from the tier that fits max_points.
+
+    If even the chosen tier has more points (e.g. months over a long range with a small budget,
+    or a tier forced by the caller), the points are downsampled with LTTB on the close.
+    """
+    if tier is None:
+        # Estimated from the calendar range, so picking the tier doesn't read the daily rows; an open
+        # end is bounded by the user's first or last stored day, one primary key lookup each
+        first = start or session.exec(select(func.min(PortfolioValue.date)).where(PortfolioValue.user_id == user.id)).one()
+        last = end or session.exec(select(func.max(PortfolioValue.date)).where(PortfolioValue.user_id == user.id)).one()
+        calendar_days = (last - first).days + 1 if first and last else 0
+        tier = choose_tier(int(calendar_days * TRADING_DAYS_PER_CALENDAR_DAY), max_points)
+
+    if tier == SeriesTier.DAY:
+        statement = select(PortfolioValue).where(PortfolioValue.user_id == user.id)
+        if start is not None:
+            statement = statement.where(PortfolioValue.date >= start)
+        if end is not None:
+            statement = statement.where(PortfolioValue.date <= end)
+        points = [
+            ValuePointRead(date=row.date, open=row.value, high=row.value, low=row.value, close=row.value, net_flow=row.net_flow)
+            for row in session.exec(statement.order_by(PortfolioValue.date)).all()
+        ]
+    else:
+        statement = select(PortfolioValueRollup).where(PortfolioValueRollup.user_id == user.id, PortfolioValueRollup.tier == tier)
+        if start is not None:
+            # Include the period containing start
+            statement = statement.where(PortfolioValueRollup.start >= _period_start(start, tier))
+        if end is not None:
+            statement = statement.where(PortfolioValueRollup.start <= end)
+        points = [
+            ValuePointRead(date=row.start, open=row.open, high=row.high, low=row.low, close=row.close, net_flow=row.net_flow)
+            for row in session.exec(statement.order_by(PortfolioValueRollup.start)).all()
+        ]
+    points = downsample(points, [point.date for point in points], [point.close for point in points], max_points)
+    return ValueSeriesRead(tier=tier, base_currency=user.base_currency, points=points)
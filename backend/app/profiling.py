@@ -0,0 +1,146 @@
+"""Opt-in per-request SQL profiler with N+1 query detection.
+
+Enable with SQL_PROFILE=1. Every statement executed while handling a request is recorded;
+statements that differ only in their bound values share a "shape", and a shape executed
+SQL_PROFILE_REPEAT_THRESHOLD times or more in one request is reported as a likely N+1 pattern.
+The summary is returned in X-SQL-* and Server-Timing response headers, and the last requests
+can be inspected at /debug/sql-profiles.
+
+SQL_QUERY_BUDGET caps the statements per request. Exceeding it logs a warning, or raises
+QueryBudgetExceeded when SQL_PROFILE_STRICT=1 so that test clients fail on the offending route.
+"""
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").lower() in ("1", "true", "yes")
+SQL_PROFILE_STRICT = os.getenv("SQL_PROFILE_STRICT", "false").lower() in ("1", "true", "yes")
+SQL_PROFILE_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", "3"))
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0")) or None
+SQL_PROFILE_HISTORY = int(os.getenv("SQL_PROFILE_HISTORY", "50"))
+
+_IN_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request executes more statements than the budget allows."""
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so repeated executions with different values compare equal."""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+class QueryProfile:
+    """Statements executed within one request (or one count_queries block)."""
+    def __init__(self, label: str = "") -> None:
+        self.label = label
+        self.statements: list[tuple[str, float]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(duration for _, duration in self.statements)
+
+    def repeated_shapes(self, threshold: int = SQL_PROFILE_REPEAT_THRESHOLD) -> dict[str, int]:
+        shapes = Counter(statement_shape(statement) for statement, _ in self.statements)
+        return {shape: count for shape, count in shapes.most_common() if count >= threshold}
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "label": self.label,
+            "queries": self.count,
+            "sql_ms": round(self.total_seconds * 1000, 3),
+            "repeated": self.repeated_shapes(),
+        }
+
+current_query_profile: ContextVar[QueryProfile | None] = ContextVar("current_query_profile", default=None)
+recent_profiles: deque[dict[str, Any]] = deque(maxlen=SQL_PROFILE_HISTORY)
+
+def instrument_engine(engine: Engine) -> None:
+    """Record statements on the engine into the active QueryProfile, if any."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["profile_started"].pop()
+        profile = current_query_profile.get()
+        if profile is not None:
+            profile.statements.append((statement, elapsed))
+
+@contextmanager
+def count_queries(label: str = "") -> Iterator[QueryProfile]:
+    """Profile the statements executed in this block (in the current thread/context).
+
+    Example:
+        with count_queries() as profile:
+            transactions_list(...)
+        assert profile.count <= 3
+    """
+    profile = QueryProfile(label)
+    token = current_query_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        current_query_profile.reset(token)
+
+class SQLProfilerMiddleware:
+    """ASGI middleware profiling the SQL of each request and reporting it in response headers."""
+    def __init__(self, app: Any, budget: int | None = SQL_QUERY_BUDGET, strict: bool = SQL_PROFILE_STRICT) -> None:
+        self.app = app
+        self.budget = budget
+        self.strict = strict
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(f"{scope['method']} {scope['path']}")
+        token = current_query_profile.set(profile)
+
+        async def send_wrapper(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                self._check(profile)
+                summary = profile.summary()
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-sql-query-count", str(summary["queries"]).encode()),
+                    (b"x-sql-time-ms", str(summary["sql_ms"]).encode()),
+                    (b"x-sql-repeated-shapes", str(len(summary["repeated"])).encode()),
+                    (b"server-timing", f'sql;dur={summary["sql_ms"]};desc="{summary["queries"]} queries"'.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_profile.reset(token)
+            recent_profiles.append(profile.summary())
+
+    def _check(self, profile: QueryProfile) -> None:
+        repeated = profile.repeated_shapes()
+        if repeated:
+            logger.warning(f"Possible N+1 queries in {profile.label}: {repeated}")
+        if self.budget is not None and profile.count > self.budget:
+            message = f"{profile.label} executed {profile.count} queries, budget is {self.budget}"
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,206 @@
+"""Monte Carlo projections of a user's portfolio ("will this last?").
+
+Every path starts from the current market value of the holdings (or a given value) and evolves
+month by month: the scheduled contribution or withdrawal is applied, then the month's return.
+Returns come from one of two models:
+
+- bootstrap: months drawn from the historical monthly returns of the current holdings, weighted
+  by market value. Blocks of consecutive months are drawn together, for all assets at once, so
+  streaks and correlations between assets survive.
+- parametric: log-normal monthly returns with the given expected annual return and volatility.
+
+Paths are simulated as numpy arrays, in chunks of PROJECTION_CHUNK_PATHS paths. Each chunk gets
+its own child of the seed's SeedSequence, so a seed gives the same result whether the chunks run
+in this process or on the PROJECTION_WORKERS process pool.
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+import math
+import multiprocessing
+import os
+import threading
+from sqlmodel import Session, select
+from .cache import TTLCache
+from .holdings import get_holdings
+from .models import Account, Asset, User
+from .schemas import DataSource, ProjectionBandRead, ProjectionRead, ProjectionRequest, ReturnModel
+from ..services.providers import get_provider
+
+if TYPE_CHECKING:
+    import numpy as np
+
+PROJECTION_WORKERS = int(os.getenv("PROJECTION_WORKERS", "0"))
+PROJECTION_CHUNK_PATHS = int(os.getenv("PROJECTION_CHUNK_PATHS", "5000"))
+RETURNS_CACHE_TTL = float(os.getenv("RETURNS_CACHE_TTL", "86400"))
+# Fewer common months than this can't represent market conditions; use the parametric model instead
+MIN_HISTORY_MONTHS = 24
+
+# Monthly returns per (symbol, first month), as (months, returns)
+returns_cache: TTLCache[tuple[str, str], tuple[np.ndarray, np.ndarray]] = TTLCache(name="returns", maxsize=1000, ttl=RETURNS_CACHE_TTL)
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+def _monthly_returns(history: list[dict[str, Any]]) -> tuple[np.ndarray, np.ndarray]:
+    """Month-end to month-end returns of a daily history, labelled with the month they end in."""
+    import numpy as np
+    bars = [bar for bar in history if bar.get("Close") is not None]
+    if len(bars) < 2:
+        return np.empty(0, dtype="datetime64[M]"), np.empty(0)
+    date_key = "Date" if "Date" in bars[0] else "Datetime"
+    dates = np.array([bar[date_key].replace(tzinfo=None) for bar in bars], dtype="datetime64[D]")
+    closes = np.array([bar["Close"] for bar in bars], dtype=np.float64)
+    months = dates.astype("datetime64[M]")
+    last = np.flatnonzero(np.r_[months[1:] != months[:-1], True])
+    return months[last][1:], closes[last][1:] / closes[last][:-1] - 1.0
+
+def load_monthly_returns(assets: list[Asset], history_years: int) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Monthly returns of each asset over the last history_years, from the returns cache or one provider call per data source."""
+    import numpy as np
+    first_month = np.datetime64(datetime.now(), "M") - np.timedelta64(history_years * 12, "M")
+    returns: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    missing: dict[DataSource, list[str]] = {}
+    for asset in assets:
+        cached = returns_cache.get((asset.symbol, str(first_month)))
+        if cached is not None:
+            returns[asset.symbol] = cached
+        else:
+            missing.setdefault(asset.data_source, []).append(asset.symbol)
+    for data_source, symbols in missing.items():
+        histories = get_provider(data_source).get_histories(symbols, start=first_month.astype("datetime64[us]").astype(datetime), end=datetime.now())
+        for symbol in symbols:
+            returns[symbol] = _monthly_returns(histories.get(symbol, []))
+            returns_cache.set((symbol, str(first_month)), returns[symbol])
+    return returns
+
+def portfolio_returns(weights: dict[str, float], returns: dict[str, tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    """Monthly returns of the weighted mix over the months every asset has a return for (rebalanced monthly)."""
+    import numpy as np
+    common: np.ndarray | None = None
+    for symbol in weights:
+        months = returns[symbol][0]
+        common = months if common is None else np.intersect1d(common, months)
+    if common is None or not len(common):
+        return np.empty(0)
+    mix = np.zeros(len(common))
+    for symbol, weight in weights.items():
+        months, values = returns[symbol]
+        mix += weight * values[np.searchsorted(months, common)]
+    return mix
+
+def monthly_flows(request: ProjectionRequest) -> np.ndarray:
+    """Cash flow of every simulated month, grown with inflation from today's money."""
+    import numpy as np
+    months = request.years * 12
+    years = np.arange(months) // 12
+    flows = np.zeros(months)
+    for period in request.cash_flows:
+        end = request.years if period.end_year is None else period.end_year
+        flows[(years >= period.start_year) & (years < end)] += period.amount / 12
+    return flows * (1 + request.inflation) ** (np.arange(months) / 12)
+
+def simulate_paths(
+    initial_value: float,
+    flows: np.ndarray,
+    paths: int,
+    seed: Any,
+    model: ReturnModel,
+    parameters: dict[str, Any],
+) -> tuple[np.ndarray, np.ndarray]:
+    """Simulate paths; returns the values at each year end (paths x years + 1) and whether each path ran out."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    months = len(flows)
+    if model == ReturnModel.PARAMETRIC:
+        sigma = parameters["volatility"] / math.sqrt(12)
+        mu = math.log1p(parameters["expected_return"]) / 12 - sigma ** 2 / 2
+        growth = np.exp(rng.normal(mu, sigma, size=(paths, months)))
+    else:
+        history = parameters["history"]
+        block = min(parameters["block_months"], len(history))
+        starts = rng.integers(0, len(history), size=(paths, -(-months // block)))
+        # Circular blocks, so the last months of the history are drawn as often as the others
+        indices = (starts[:, :, None] + np.arange(block)).reshape(paths, -1)[:, :months] % len(history)
+        growth = 1.0 + history[indices]
+
+    values = np.full(paths, float(initial_value))
+    year_ends = np.empty((paths, months // 12 + 1))
+    year_ends[:, 0] = values
+    depleted = np.zeros(paths, dtype=bool)
+    for month in range(months):
+        values = values + flows[month]
+        # A path runs out when a withdrawal empties it, not when it is empty before anything is put in
+        if flows[month] < 0:
+            depleted |= values <= 0
+        np.maximum(values, 0.0, out=values)
+        values *= growth[:, month]
+        if (month + 1) % 12 == 0:
+            year_ends[:, (month + 1) // 12] = values
+    return year_ends, depleted
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a process that runs threads (the server's threadpool) isn't safe
+            _executor = ProcessPoolExecutor(max_workers=PROJECTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+def run_projection(session: Session, user: User, request: ProjectionRequest) -> ProjectionRead:
+    """Simulate the user's portfolio. Raises ValueError when the holdings have too little history to bootstrap."""
+    import numpy as np
+    holdings = get_holdings(session, Account.user_id == user.id, base_currency=user.base_currency)
+    values: dict[str, float] = {}
+    for holding in holdings:
+        if holding.market_value_base:
+            values[holding.symbol] = values.get(holding.symbol, 0.0) + holding.market_value_base
+    total = sum(values.values())
+    weights = {symbol: value / total for symbol, value in values.items()} if total > 0 else {}
+    initial_value = request.initial_value if request.initial_value is not None else total
+
+    parameters: dict[str, Any] = {"expected_return": request.expected_return, "volatility": request.volatility, "block_months": request.block_months}
+    history_months = None
+    if request.model == ReturnModel.BOOTSTRAP:
+        if not weights:
+            raise ValueError("No priced holdings to bootstrap returns from; use the parametric model")
+        assets = session.exec(select(Asset).where(Asset.symbol.in_(list(weights)))).all()
+        history = portfolio_returns(weights, load_monthly_returns(list(assets), request.history_years))
+        if len(history) < MIN_HISTORY_MONTHS:
+            raise ValueError(f"The holdings share only {len(history)} months of price history; use the parametric model")
+        parameters["history"] = history
+        history_months = len(history)
+
+    seed = request.seed if request.seed is not None else int(np.random.SeedSequence().entropy % 2**63)
+    flows = monthly_flows(request)
+    chunks = [min(PROJECTION_CHUNK_PATHS, request.paths - start) for start in range(0, request.paths, PROJECTION_CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    jobs = [(initial_value, flows, size, child, request.model, parameters) for size, child in zip(chunks, seeds)]
+    if PROJECTION_WORKERS > 0 and len(jobs) > 1:
+        results = list(_get_executor().map(simulate_paths, *zip(*jobs)))
+    else:
+        results = [simulate_paths(*job) for job in jobs]
+    year_ends = np.concatenate([result[0] for result in results])
+    depleted = np.concatenate([result[1] for result in results])
+
+    bands = np.percentile(year_ends, request.percentiles, axis=0)
+    return ProjectionRead(
+        base_currency=user.base_currency,
+        model=request.model,
+        paths=request.paths,
+        seed=seed,
+        initial_value=initial_value,
+        weights=weights,
+        history_months=history_months,
+        success_probability=float(1.0 - depleted.mean()),
+        percentiles=request.percentiles,
+        bands=[ProjectionBandRead(year=year, values=bands[:, year].tolist()) for year in range(bands.shape[1])],
+    )
@@ -1,53 +1,78 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from sqlmodel import Session, select
-from ..models import Account
+from ..models import Account, Transaction, User
 from ..database import get_session
-from ..schemas import AccountCreate, AccountRead, AccountUpdate
+from ..dependencies import get_current_user_api, get_owned_account
+from ..versioning import user_conditional_get
+from ..holdings import get_holdings
+from ..schemas import AccountCreate, AccountRead, AccountUpdate, HoldingRead
 from typing import Any, List, Sequence
 import uuid
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
 @router.post(path="/", response_model=AccountRead, status_code=status.HTTP_201_CREATED)
-def create_account(account: AccountCreate, session: Session = Depends(dependency=get_session)) -> AccountRead:
+def create_account(
+    account: AccountCreate,
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(dependency=get_session)
+) -> AccountRead:
+    # Accounts are only created for the authenticated user
+    if account.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="User not found")
     db_account: Account = Account.model_validate(obj=account)
     session.add(instance=db_account)
     session.commit()
     session.refresh(instance=db_account)
     return AccountRead.model_validate(obj=db_account)
 
-@router.get(path="/", response_model=List[AccountRead])
+@router.get(path="/", response_model=List[AccountRead], dependencies=[Depends(user_conditional_get("account:{current_user}"))])
 def read_accounts(
+    current_user: User = Depends(get_current_user_api),
     session: Session = Depends(dependency=get_session),
     offset: int = 0,
     limit: int = 100
 ) -> Sequence[AccountRead]:
+    # Only the authenticated user's accounts, through the account user_id index
     accounts: Sequence[Account] = session.exec(
-        statement=select(Account).offset(offset=offset).limit(limit=limit)
+        statement=select(Account).where(Account.user_id == current_user.id).offset(offset=offset).limit(limit=limit)
     ).all()
     return [AccountRead.model_validate(obj=account) for account in accounts]
 
 @router.get(path="/{account_id}", response_model=AccountRead)
-def read_account(account_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> AccountRead:
-    account: Account | None = session.get(entity=Account, ident=account_id)
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
+def read_account(account: Account = Depends(get_owned_account)) -> AccountRead:
     return AccountRead.model_validate(obj=account)
 
+@router.get(path="/{account_id}/holdings", response_model=List[HoldingRead])
+def read_account_holdings(
+    account: Account = Depends(get_owned_account),
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(dependency=get_session),
+    include_closed: bool = False,
+    with_prices: bool = True,
+    base_currency: str | None = None
+) -> List[HoldingRead]:
+    return get_holdings(
+        session, Transaction.account_id == account.id,
+        include_closed=include_closed, with_prices=with_prices, base_currency=base_currency or current_user.base_currency
+    )
+
 @router.delete(path="/{account_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_account(account_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> None:
-    account: Account | None = session.get(entity=Account, ident=account_id)
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
+def delete_account(account: Account = Depends(get_owned_account), session: Session = Depends(dependency=get_session)) -> None:
     session.delete(instance=account)
     session.commit()
 
 @router.patch(path="/{account_id}", response_model=AccountRead)
-def update_account(account_id: uuid.UUID, account_update: AccountUpdate, session: Session = Depends(get_session)) -> AccountRead:
-    account: Account | None = session.get(entity=Account, ident=account_id)
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
+def update_account(
+    account_update: AccountUpdate,
+    account: Account = Depends(get_owned_account),
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(get_session)
+) -> AccountRead:
     account_data: dict[str, Any] = account_update.model_dump(exclude_unset=True)
+    # Accounts can't be handed to another user
+    if account_data.get("user_id", current_user.id) != current_user.id:
+        raise HTTPException(status_code=404, detail="User not found")
     for key, value in account_data.items():
         setattr(account, key, value)
     session.add(instance=account)
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from pandas import DataFrame
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query
 from datetime import datetime
 from sqlmodel import Session, select
-from ..models import Asset
+from ..models import Account, Asset, CorporateAction, User
 from ..database import get_session
-from ..schemas import AssetCreate, AssetRead, AssetUpdate, DataSource
-from ...services.yahoo import get_yahoo_price, get_yahoo_history
+from ..dependencies import get_current_user_api
+from ..holdings import get_holdings
+from ..versioning import conditional_get, user_conditional_get
+from ..schemas import AssetCreate, AssetRead, AssetUpdate, CorporateActionRead, DataSource
+from ..import_prices import process_price_import
+from ..downsample import downsample
+from ...services.corporate_actions import sync_corporate_actions
+from ...services.prices import get_cached_price, get_cached_prices, invalidate_prices
+from ...services.providers import get_provider
 from typing import Any, List, Sequence
 import uuid
+import io
+import csv
 from enum import Enum
 from ..schemas import IntervalEnum
 
@@ -25,7 +33,7 @@ def create_asset(asset: AssetCreate, session: Session = Depends(dependency=get_s
     session.refresh(instance=db_asset)
     return AssetRead.model_validate(obj=db_asset)
 
-@router.get(path="/", response_model=List[AssetRead])
+@router.get(path="/", response_model=List[AssetRead], dependencies=[Depends(conditional_get("asset"))])
 def read_assets(
     session: Session = Depends(dependency=get_session),
     offset: int = 0,
@@ -36,6 +44,54 @@ def read_assets(
     ).all()
     return [AssetRead.model_validate(obj=asset) for asset in assets]
 
+@router.get(path="/held", response_model=List[AssetRead], dependencies=[Depends(user_conditional_get("asset", "transaction:{current_user}", "corporateaction"))])
+def read_held_assets(
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(dependency=get_session)
+) -> Sequence[AssetRead]:
+    # Assets with an open position in the authenticated user's accounts, found through the account_id indexes
+    holdings = get_holdings(session, Account.user_id == current_user.id, with_prices=False)
+    asset_ids = {holding.asset_id for holding in holdings}
+    assets: Sequence[Asset] = session.exec(
+        select(Asset).where(Asset.id.in_(asset_ids)).order_by(Asset.symbol)
+    ).all() if asset_ids else []
+    return [AssetRead.model_validate(obj=asset) for asset in assets]
+
+@router.get(path="/prices")
+def get_asset_prices(
+    asset_id: List[uuid.UUID] = Query(default=[]),
+    session: Session = Depends(dependency=get_session)
+) -> List[dict[str, Any]]:
+    # Latest prices of many assets, with one provider call per data source for the cache misses
+    assets: Sequence[Asset] = session.exec(select(Asset).where(Asset.id.in_(asset_id))).all() if asset_id else []
+    prices = get_cached_prices((asset.symbol, asset.data_source) for asset in assets)
+    return [
+        {"asset_id": asset.id, "symbol": asset.symbol, "price": price[0], "price_time": price[1]}
+        for asset in assets if (price := prices.get((asset.symbol, asset.data_source)))
+    ]
+
+@router.post(path="/prices/upload")
+async def upload_asset_prices(
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user_api),
+) -> dict[str, Any]:
+    # Bulk load daily prices for the manual provider: date,symbol,close and optionally open,high,low,volume
+    # Manual prices value every user's holdings, so only signed-in users can upload them
+    if not file.filename or not file.filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Only CSV files are supported.")
+    contents = await file.read()
+    reader = csv.DictReader(io.StringIO(contents.decode("utf-8")))
+    result = process_price_import(reader, session)
+    invalidate_prices(result["symbols"])
+    return result
+
+@router.post(path="/corporate-actions/sync")
+def sync_all_corporate_actions(session: Session = Depends(dependency=get_session), force: bool = False) -> dict[str, int]:
+    # Fetches in provider batches; without force only symbols older than the sync TTL are fetched
+    assets: Sequence[Asset] = session.exec(select(Asset).where(Asset.data_source == DataSource.YAHOO)).all()
+    return {"synced": sync_corporate_actions(session, assets, force=force)}
+
 @router.get(path="/{asset_id}", response_model=AssetRead)
 def read_asset(asset_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> AssetRead:
     asset: Asset | None = session.get(entity=Asset, ident=asset_id)
@@ -48,13 +104,25 @@ def get_asset_price(asset_id: uuid.UUID, session: Session = Depends(dependency=g
     asset: Asset | None = session.get(entity=Asset, ident=asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    if asset.data_source == DataSource.YAHOO:
-        price: tuple[float, datetime] | None = get_yahoo_price(asset.symbol)
-        if price is None:
-            raise HTTPException(status_code=404, detail="Price not found on Yahoo")
-        return {"symbol": asset.symbol, "price": price[0], "price_time": price[1]}
-    # For manual or other sources, implement your logic here
-    raise HTTPException(status_code=400, detail="Manual price entry not implemented yet")
+    price: tuple[float, datetime] | None = get_cached_price(asset.symbol, asset.data_source)
+    if price is None:
+        raise HTTPException(status_code=404, detail=f"Price not found ({get_provider(asset.data_source).name} provider)")
+    return {"symbol": asset.symbol, "price": price[0], "price_time": price[1]}
+
+@router.get(path="/{asset_id}/corporate-actions", response_model=List[CorporateActionRead])
+def get_asset_corporate_actions(
+    asset_id: uuid.UUID,
+    session: Session = Depends(dependency=get_session),
+    refresh: bool = False
+) -> Sequence[CorporateActionRead]:
+    asset: Asset | None = session.get(entity=Asset, ident=asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    sync_corporate_actions(session, [asset], force=refresh)
+    actions: Sequence[CorporateAction] = session.exec(
+        select(CorporateAction).where(CorporateAction.asset_id == asset_id).order_by(CorporateAction.date)
+    ).all()
+    return [CorporateActionRead.model_validate(obj=action) for action in actions]
 
 @router.get(path="/{asset_id}/history")
 def get_asset_history(
@@ -62,18 +130,22 @@ def get_asset_history(
     session: Session = Depends(dependency=get_session),
     start: datetime | None = None,
     end: datetime | None = datetime.now(),
-    interval: IntervalEnum | None = IntervalEnum.ONE_DAY
+    interval: IntervalEnum | None = IntervalEnum.ONE_DAY,
+    max_points: int | None = Query(default=None, ge=3, description="Downsample to at most this many bars (LTTB on the close)")
 ) -> List[dict[str, Any]]:
     asset: Asset | None = session.get(entity=Asset, ident=asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    if asset.data_source == DataSource.YAHOO:
-        history: DataFrame = get_yahoo_history(symbol=asset.symbol, start=start, end=end, interval=interval)
-        if history is None or history.empty:
-            raise HTTPException(status_code=404, detail="History not found on Yahoo")
-        return history.reset_index().to_dict(orient="records")
-    # For manual or other sources, implement your logic here
-    raise HTTPException(status_code=400, detail="Manual price entry not implemented yet")
+    provider = get_provider(asset.data_source)
+    try:
+        histories = provider.get_histories([asset.symbol], start=start, end=end, interval=interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not histories.get(asset.symbol):
+        raise HTTPException(status_code=404, detail=f"History not found ({provider.name} provider)")
+    history = histories[asset.symbol]
+    date_key = "Date" if "Date" in history[0] else "Datetime"  # Yahoo names the index Datetime for intraday bars
+    return downsample(history, [bar[date_key] for bar in history], [bar.get("Close") for bar in history], max_points)
 
 @router.delete(path="/{asset_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_asset(asset_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> None:
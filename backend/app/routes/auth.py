@@ -1,25 +1,22 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
-from ..oidc import oauth
-from ..auth import authenticate_user, create_access_token, get_password_hash
+from ..oidc import get_oidc_client
+from ..auth import authenticate_user_async, create_access_token, get_password_hash_async, PasswordHasherBusy
 from ..database import get_session
 from ..models import User
 from ..dependencies import get_current_user_web
+from ..dashboard import dashboard_context
+from ..templating import templates
 from datetime import timedelta
 import os
 
 router = APIRouter(tags=["auth"])
-templates = Jinja2Templates(directory="frontend/templates")
 
-# Dashboard route (protected)
+# Dashboard route (protected); its context is built in dashboard.py
 @router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, current_user: User = Depends(get_current_user_web)):
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "user": current_user
-    })
+def dashboard(request: Request, current_user: User = Depends(get_current_user_web), session: Session = Depends(get_session)):
+    return templates.TemplateResponse("dashboard.html", {"request": request, **dashboard_context(session, current_user)})
 
 # Profile route (protected)
 @router.get("/profile", response_class=HTMLResponse) 
@@ -51,7 +48,15 @@ async def login_submit(
     password: str = Form(...),
     session: Session = Depends(get_session)
 ):
-    user = authenticate_user(session, username, password)
+    try:
+        user = await authenticate_user_async(session, username, password)
+    except PasswordHasherBusy:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Too many logins in progress, please try again in a moment"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "1"},
+        )
     if not user:
         return templates.TemplateResponse(
             "login.html", 
@@ -122,9 +127,20 @@ async def register_submit(
             {"request": request, "error": "Email already registered"}
         )
     
+    # Don't hold a pooled connection while bcrypt runs
+    session.close()
+    try:
+        hashed_password = await get_password_hash_async(password)
+    except PasswordHasherBusy:
+        return templates.TemplateResponse(
+            "register.html",
+            {"request": request, "error": "Too many requests in progress, please try again in a moment"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "1"},
+        )
+
     try:
         # Create new user
-        hashed_password = get_password_hash(password)
         db_user = User(
             username=username,
             email=email,
@@ -150,14 +166,19 @@ async def register_submit(
 async def oidc_login(request: Request):
     if request.session.get("user"):
         return RedirectResponse(url="/dashboard")
-    redirect_uri = "http://192.168.88.50:8000/login/callback"
-    print(f"Redirect URI being sent: {redirect_uri}")
-    return await oauth.oidc.authorize_redirect(request, redirect_uri)
+    client = get_oidc_client()
+    if client is None:
+        raise HTTPException(status_code=404, detail="SSO login is not configured")
+    redirect_uri = os.getenv("OIDC_REDIRECT_URI") or str(request.url_for("auth_callback"))
+    return await client.authorize_redirect(request, redirect_uri)
 
 @router.get("/login/callback")
 async def auth_callback(request: Request):
-    token = await oauth.oidc.authorize_access_token(request)
-    user = await oauth.oidc.parse_id_token(request, token)
+    client = get_oidc_client()
+    if client is None:
+        raise HTTPException(status_code=404, detail="SSO login is not configured")
+    token = await client.authorize_access_token(request)
+    user = token.get("userinfo") or await client.userinfo(token=token)
     request.session["user"] = dict(user)
     return RedirectResponse(url="/dashboard")
 
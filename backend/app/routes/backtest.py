@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlmodel import Session
+from ..database import get_session
+from ..schemas import BacktestRead, BacktestRequest
+from ..backtest import run_backtest
+
+router = APIRouter(prefix="/backtest", tags=["backtest"])
+
+@router.post(path="/", response_model=BacktestRead)
+def backtest_portfolios(request: BacktestRequest, session: Session = Depends(dependency=get_session)) -> BacktestRead:
+    # Compare allocations and rebalancing rules over the same history; repeated parameters are served from the cache
+    try:
+        return run_backtest(session, request)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
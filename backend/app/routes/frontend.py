@@ -1,41 +1,49 @@
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
+from sqlalchemy.orm import joinedload
 from sqlmodel import Session, select
-from typing import Optional
+from typing import Any, Optional
 from datetime import datetime
 import uuid
 
 from ..database import get_session
+from ..dependencies import get_current_user_web, owned_account
 from ..models import User, Asset, Account, Transaction
 from ..schemas import UserCreate, AssetCreate, AccountCreate, TransactionCreate, TransactionType
+from ..dashboard import dashboard_context, user_fragment_versions, user_transactions
+from ..templating import templates
 
 router = APIRouter(tags=["frontend"])
-templates = Jinja2Templates(directory="frontend/templates")
 
-@router.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, session: Session = Depends(get_session)):
-    """Dashboard homepage showing overview stats."""
-    # Get counts for stats
-    users_count = len(session.exec(select(User)).all())
-    assets_count = len(session.exec(select(Asset)).all())
-    accounts_count = len(session.exec(select(Account)).all())
-    transactions_count = len(session.exec(select(Transaction)).all())
-    
-    # Get recent transactions
-    recent_transactions = session.exec(
-        select(Transaction).order_by(Transaction.date.desc()).limit(5)
-    ).all()
-    
-    context = {
-        "request": request,
-        "users_count": users_count,
-        "assets_count": assets_count,
-        "accounts_count": accounts_count,
-        "transactions_count": transactions_count,
-        "recent_transactions": recent_transactions,
+# The list pages below load everything they render in a fixed number of queries: related rows
+# are joined in with only the columns the templates show, and the form selects get plain
+# (id, label) rows, so rendering never lazy-loads relationships row by row. Accounts and
+# transactions are the logged-in user's only, reached through the account user_id index.
+# Large tables are rendered inside fragment cache blocks keyed by the user's data versions and
+# get their rows through a loader the template calls only when the block isn't cached.
+
+def _transactions_page_context(session: Session, user: User) -> dict[str, Any]:
+    assets = session.exec(select(Asset.id, Asset.symbol, Asset.name)).all()
+    accounts = session.exec(select(Account.id, Account.name).where(Account.user_id == user.id)).all()
+    return {
+        "user": user,
+        "fragment_versions": user_fragment_versions(session, user, "asset"),
+        "load_transactions": lambda: session.exec(user_transactions(user)).all(),
+        "assets": assets,
+        "accounts": accounts,
     }
-    return templates.TemplateResponse("dashboard.html", context)
+
+def _accounts_page_context(session: Session, user: User) -> dict[str, Any]:
+    accounts = session.exec(
+        select(Account).where(Account.user_id == user.id).options(joinedload(Account.user).load_only(User.username, User.email))
+    ).all()
+    # Accounts are created for the logged-in user
+    return {"accounts": accounts, "users": [user]}
+
+@router.get("/", response_class=HTMLResponse)
+def dashboard(request: Request, current_user: User = Depends(get_current_user_web), session: Session = Depends(get_session)):
+    """Dashboard homepage, the same page as /dashboard."""
+    return templates.TemplateResponse("dashboard.html", {"request": request, **dashboard_context(session, current_user)})
 
 @router.get("/users", response_class=HTMLResponse)
 async def users_list(request: Request, session: Session = Depends(get_session)):
@@ -102,26 +110,24 @@ async def create_asset(
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/accounts", response_class=HTMLResponse)
-async def accounts_list(request: Request, session: Session = Depends(get_session)):
+async def accounts_list(request: Request, current_user: User = Depends(get_current_user_web), session: Session = Depends(get_session)):
     """Accounts management page."""
-    accounts = session.exec(select(Account)).all()
-    users = session.exec(select(User)).all()
-    context = {"request": request, "accounts": accounts, "users": users}
+    context = {"request": request, **_accounts_page_context(session, current_user)}
     return templates.TemplateResponse("accounts/list.html", context)
 
 @router.post("/accounts", response_class=HTMLResponse)
 async def create_account(
     request: Request,
     name: Optional[str] = Form(None),
-    user_id: str = Form(...),
     balance: float = Form(0.0),
+    current_user: User = Depends(get_current_user_web),
     session: Session = Depends(get_session)
 ):
-    """Create a new account via form submission."""
+    """Create a new account via form submission, for the logged-in user."""
     try:
         account_data = AccountCreate(
             name=name, 
-            user_id=uuid.UUID(user_id), 
+            user_id=current_user.id, 
             balance=balance
         )
         db_account = Account.model_validate(account_data)
@@ -130,20 +136,15 @@ async def create_account(
         session.refresh(db_account)
         
         # Return updated accounts list
-        accounts = session.exec(select(Account)).all()
-        users = session.exec(select(User)).all()
-        context = {"request": request, "accounts": accounts, "users": users}
+        context = {"request": request, **_accounts_page_context(session, current_user)}
         return templates.TemplateResponse("accounts/list.html", context)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/transactions", response_class=HTMLResponse)
-async def transactions_list(request: Request, session: Session = Depends(get_session)):
+async def transactions_list(request: Request, current_user: User = Depends(get_current_user_web), session: Session = Depends(get_session)):
     """Transactions management page."""
-    transactions = session.exec(select(Transaction).order_by(Transaction.date.desc())).all()
-    assets = session.exec(select(Asset)).all()
-    accounts = session.exec(select(Account)).all()
-    context = {"request": request, "transactions": transactions, "assets": assets, "accounts": accounts}
+    context = {"request": request, **_transactions_page_context(session, current_user)}
     return templates.TemplateResponse("transactions/list.html", context)
 
 @router.post("/transactions", response_class=HTMLResponse)
@@ -156,6 +157,7 @@ async def create_transaction(
     price: float = Form(...),
     fee: float = Form(0.0),
     date: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user_web),
     session: Session = Depends(get_session)
 ):
     """Create a new transaction via form submission."""
@@ -165,6 +167,8 @@ async def create_transaction(
         if date:
             transaction_date = datetime.fromisoformat(date.replace('T', ' '))
         
+        # Transactions are only added to the logged-in user's accounts
+        owned_account(session, uuid.UUID(account_id), current_user)
         transaction_data = TransactionCreate(
             asset_id=uuid.UUID(asset_id),
             account_id=uuid.UUID(account_id),
@@ -186,10 +190,7 @@ async def create_transaction(
         session.refresh(db_transaction)
         
         # Return updated transactions list
-        transactions = session.exec(select(Transaction).order_by(Transaction.date.desc())).all()
-        assets = session.exec(select(Asset)).all()
-        accounts = session.exec(select(Account)).all()
-        context = {"request": request, "transactions": transactions, "assets": assets, "accounts": accounts}
+        context = {"request": request, **_transactions_page_context(session, current_user)}
         return templates.TemplateResponse("transactions/list.html", context)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
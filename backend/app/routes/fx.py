@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+from sqlmodel import Session, select
+from ..models import Asset, FxRate, User
+from ..database import get_session
+from ..schemas import FxRateRead
+from ...services.fx import backfill_fx_rates, latest_rates
+from typing import List, Sequence
+
+router = APIRouter(prefix="/fx", tags=["fx"])
+
+@router.get(path="/rates")
+def read_latest_rates(
+    currencies: List[str] = Query(default=[]),
+    base_currency: str = "USD",
+    session: Session = Depends(dependency=get_session)
+) -> dict[str, float]:
+    # Value of one unit of each currency in the base currency; currencies without rates are left out
+    currencies = [currency.upper() for currency in currencies]
+    base_currency = base_currency.upper()
+    rates = latest_rates(session, [*currencies, base_currency])
+    if base_currency not in rates:
+        return {}
+    return {currency: rates[currency] / rates[base_currency] for currency in currencies if currency in rates}
+
+@router.get(path="/{currency}/history", response_model=List[FxRateRead])
+def read_rate_history(
+    currency: str,
+    session: Session = Depends(dependency=get_session),
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> Sequence[FxRateRead]:
+    currency = currency.upper()
+    backfill_fx_rates(session, [currency])
+    statement = select(FxRate).where(FxRate.currency == currency)
+    if start is not None:
+        statement = statement.where(FxRate.date >= start)
+    if end is not None:
+        statement = statement.where(FxRate.date <= end)
+    rates: Sequence[FxRate] = session.exec(statement.order_by(FxRate.date)).all()
+    return [FxRateRead.model_validate(obj=rate) for rate in rates]
+
+@router.post(path="/sync")
+def sync_rates(
+    currencies: List[str] = Query(default=[]),
+    force: bool = False,
+    session: Session = Depends(dependency=get_session)
+) -> dict[str, int]:
+    # Without currencies, backfills every currency that is stored or used by an asset or user
+    if not currencies:
+        currencies = list(
+            set(session.exec(select(FxRate.currency).distinct()).all())
+            | set(session.exec(select(Asset.currency).distinct()).all())
+            | set(session.exec(select(User.base_currency).distinct()).all())
+        )
+    return {"stored": backfill_fx_rates(session, currencies, force=force)}
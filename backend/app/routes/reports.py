@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlmodel import Session
+from ..database import get_session
+from ..dependencies import get_owned_user, require_monitoring_access
+from ..schemas import AssetContributionRead, MonthlyDividendRead, YearReturnRead
+from .. import analytics
+from typing import Any, List
+from datetime import datetime
+import importlib.util
+import uuid
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+def require_analytics() -> None:
+    # duckdb and pyarrow are only needed by the reports, so a missing install shouldn't break the app
+    missing = [module for module in ("duckdb", "pyarrow") if importlib.util.find_spec(module) is None]
+    if missing:
+        raise HTTPException(status_code=503, detail=f"Reports need {', '.join(missing)} installed")
+
+# Rewrites every dataset with full=true, so it's an operator endpoint like /metrics
+@router.post(path="/refresh", dependencies=[Depends(require_monitoring_access), Depends(require_analytics)])
+def refresh_reports(session: Session = Depends(dependency=get_session), full: bool = False) -> dict[str, int]:
+    # Reports refresh the export themselves; this is for warming it up after bulk loads, or full=true after edits it can't detect
+    return analytics.refresh_exports(session, full=full)
+
+@router.get(path="/{user_id}/returns-by-year", response_model=List[YearReturnRead], dependencies=[Depends(get_owned_user), Depends(require_analytics)])
+def read_returns_by_year(user_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> List[dict[str, Any]]:
+    # Based on the stored daily values, see POST /users/{user_id}/value-series/refresh
+    return analytics.returns_by_year(session, user_id)
+
+@router.get(path="/{user_id}/contributions-by-asset", response_model=List[AssetContributionRead], dependencies=[Depends(get_owned_user), Depends(require_analytics)])
+def read_contributions_by_asset(
+    user_id: uuid.UUID,
+    session: Session = Depends(dependency=get_session),
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> List[dict[str, Any]]:
+    return analytics.contributions_by_asset(session, user_id, start=start, end=end)
+
+@router.get(path="/{user_id}/dividends-by-month", response_model=List[MonthlyDividendRead], dependencies=[Depends(get_owned_user), Depends(require_analytics)])
+def read_dividends_by_month(
+    user_id: uuid.UUID,
+    session: Session = Depends(dependency=get_session),
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> List[dict[str, Any]]:
+    return analytics.dividends_by_month(session, user_id, start=start, end=end)
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from ..dependencies import get_owned_user
+from ..models import User
+from ..streaming import PortfolioPositions, STREAM_INTERVAL, asset_symbols, hub
+from typing import Any, AsyncGenerator, List
+import asyncio
+import json
+import os
+import time
+import uuid
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+# Seconds between keep-alive comments when no tick arrives, so proxies don't close idle streams
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _event(name: str, data: dict[str, Any]) -> str:
+    return f"event: {name}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+def _price_event(symbol: str, asset_id: uuid.UUID | None, price: tuple[float, Any]) -> str:
+    return _event("price", {"symbol": symbol, "asset_id": asset_id, "price": price[0], "price_time": price[1]})
+
+@router.get(path="/prices")
+async def stream_prices(request: Request, asset_id: List[uuid.UUID] = Query(default=[])) -> StreamingResponse:
+    # Server-sent "price" events for the given assets, one per price change
+    symbols = await asyncio.to_thread(asset_symbols, asset_id)
+    if not symbols:
+        raise HTTPException(status_code=404, detail="No assets found")
+
+    async def events() -> AsyncGenerator[str, None]:
+        subscription = hub.subscribe({symbol: data_source for symbol, (_, data_source) in symbols.items()})
+        try:
+            yield f"retry: {int(STREAM_INTERVAL * 1000)}\n\n"
+            while not await request.is_disconnected():
+                ticks = await subscription.next(timeout=STREAM_HEARTBEAT)
+                if not ticks:
+                    yield ": keep-alive\n\n"
+                for symbol, price in ticks.items():
+                    yield _price_event(symbol, symbols[symbol][0], price)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get(path="/users/{user_id}")
+async def stream_user_portfolio(request: Request, user: User = Depends(get_owned_user)) -> StreamingResponse:
+    # "price" events for the user's holdings and a "portfolio" event with the total in the base currency after each batch
+    positions = PortfolioPositions(user.id)
+    try:
+        await asyncio.to_thread(positions.load)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    async def events() -> AsyncGenerator[str, None]:
+        subscription = hub.subscribe(positions.sources)
+        prices: dict[str, tuple[float, Any]] = {}
+        next_check = time.monotonic() + STREAM_INTERVAL
+        try:
+            yield f"retry: {int(STREAM_INTERVAL * 1000)}\n\n"
+            yield _event("portfolio", positions.total(prices))
+            while not await request.is_disconnected():
+                ticks = await subscription.next(timeout=min(STREAM_HEARTBEAT, STREAM_INTERVAL))
+                if time.monotonic() >= next_check:
+                    # New transactions change the positions; reload them when the user's ledger version moved
+                    next_check = time.monotonic() + STREAM_INTERVAL
+                    if await asyncio.to_thread(positions.changed):
+                        await asyncio.to_thread(positions.load)
+                        hub.resubscribe(subscription, positions.sources)
+                        prices = {symbol: price for symbol, price in prices.items() if symbol in positions.sources}
+                        ticks = {**ticks, **await subscription.next(timeout=0)}
+                        if not ticks:
+                            yield _event("portfolio", positions.total(prices))
+                if not ticks:
+                    yield ": keep-alive\n\n"
+                    continue
+                prices.update(ticks)
+                for symbol, price in ticks.items():
+                    yield _price_event(symbol, positions.asset_ids.get(symbol), price)
+                yield _event("portfolio", positions.total(prices))
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
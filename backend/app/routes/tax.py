@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from ..models import User
+from ..database import get_session
+from ..dependencies import get_owned_user
+from ..schemas import HarvestReportRead
+from ..tax import harvest_candidates
+from datetime import datetime
+
+router = APIRouter(prefix="/tax", tags=["tax"])
+
+@router.get(path="/harvest-candidates", response_model=HarvestReportRead)
+def read_harvest_candidates(
+    user: User = Depends(get_owned_user),
+    session: Session = Depends(dependency=get_session),
+    min_loss: float = Query(default=0.0, ge=0),
+    as_of: datetime | None = None
+) -> HarvestReportRead:
+    # Lots in taxable accounts with an unrealized loss of at least min_loss (base currency), with wash-sale conflicts around as_of
+    return harvest_candidates(session, user, min_loss=min_loss, as_of=as_of)
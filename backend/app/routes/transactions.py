@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, BackgroundTasks
 from sqlmodel import Session, select
-from ..models import Transaction
+from ..models import Account, Transaction, User
 from ..database import get_session
+from ..dependencies import get_current_user_api, get_owned_transaction, owned_account
+from ..versioning import user_conditional_get
 from ..schemas import TransactionCreate, TransactionRead, TransactionUpdate
 from ..import_transactions import process_csv_import
+from ...services.corporate_actions import adjust_for_splits, load_splits
 from typing import Any, List, Sequence
 import uuid
 from datetime import datetime
@@ -13,7 +16,12 @@ import csv
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 @router.post(path="/", response_model=TransactionRead, status_code=status.HTTP_201_CREATED)
-def create_transaction(transaction: TransactionCreate, session: Session = Depends(dependency=get_session)) -> TransactionRead:
+def create_transaction(
+    transaction: TransactionCreate,
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(dependency=get_session)
+) -> TransactionRead:
+    owned_account(session, transaction.account_id, current_user)
     data: dict[str, Any] = transaction.model_dump()
     if data.get("date") is None:
         data["date"] = datetime.now()
@@ -23,38 +31,55 @@ def create_transaction(transaction: TransactionCreate, session: Session = Depend
     session.refresh(instance=db_transaction)
     return TransactionRead.model_validate(obj=db_transaction)
 
-@router.get(path="/", response_model=List[TransactionRead])
+@router.get(path="/", response_model=List[TransactionRead], dependencies=[Depends(user_conditional_get("transaction:{current_user}", "corporateaction"))])
 def read_transactions(
+    current_user: User = Depends(get_current_user_api),
     session: Session = Depends(dependency=get_session),
     offset: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    adjusted: bool = False
 ) -> Sequence[TransactionRead]:
+    # Only the authenticated user's ledger: the user's accounts, then their rows through the transaction account_id index
     transactions: Sequence[Transaction] = session.exec(
-        statement=select(Transaction).offset(offset=offset).limit(limit=limit)
+        statement=select(Transaction)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(Account.user_id == current_user.id)
+        .offset(offset=offset).limit(limit=limit)
     ).all()
-    return [TransactionRead.model_validate(obj=transaction) for transaction in transactions]
+    results = [TransactionRead.model_validate(obj=transaction) for transaction in transactions]
+    if adjusted:
+        # Express quantities and prices in today's shares; the stored ledger is left as recorded
+        splits = load_splits(session, (transaction.asset_id for transaction in results))
+        for asset_id, (split_dates, split_ratios) in splits.items():
+            rows = [transaction for transaction in results if transaction.asset_id == asset_id]
+            quantities, prices = adjust_for_splits(
+                [row.date for row in rows], [row.quantity for row in rows], [row.price for row in rows], split_dates, split_ratios
+            )
+            for row, quantity, price in zip(rows, quantities.tolist(), prices.tolist()):
+                row.quantity = quantity
+                row.price = price
+    return results
 
 @router.get(path="/{transaction_id}", response_model=TransactionRead)
-def read_transaction(transaction_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> TransactionRead:
-    transaction: Transaction | None = session.get(entity=Transaction, ident=transaction_id)
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+def read_transaction(transaction: Transaction = Depends(get_owned_transaction)) -> TransactionRead:
     return TransactionRead.model_validate(obj=transaction)
 
 @router.delete(path="/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_transaction(transaction_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> None:
-    transaction: Transaction | None = session.get(entity=Transaction, ident=transaction_id)
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+def delete_transaction(transaction: Transaction = Depends(get_owned_transaction), session: Session = Depends(dependency=get_session)) -> None:
     session.delete(instance=transaction)
     session.commit()
 
 @router.patch(path="/{transaction_id}", response_model=TransactionRead)
-def update_transaction(transaction_id: uuid.UUID, transaction_update: TransactionUpdate, session: Session = Depends(get_session)) -> TransactionRead:
-    transaction: Transaction | None = session.get(entity=Transaction, ident=transaction_id)
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+def update_transaction(
+    transaction_update: TransactionUpdate,
+    transaction: Transaction = Depends(get_owned_transaction),
+    current_user: User = Depends(get_current_user_api),
+    session: Session = Depends(get_session)
+) -> TransactionRead:
     transaction_data: dict[str, Any] = transaction_update.model_dump(exclude_unset=True)
+    if "account_id" in transaction_data:
+        # Transactions can only move between the user's own accounts
+        owned_account(session, transaction_data["account_id"], current_user)
     for key, value in transaction_data.items():
         setattr(transaction, key, value)
     session.add(instance=transaction)
@@ -71,7 +96,7 @@ def update_transaction(transaction_id: uuid.UUID, transaction_update: Transactio
         "Upload a CSV file to import transactions asynchronously. Processing happens in the background."
         "The CSV must have the following columns: "
         "`asset_id`, `account_id`, `type`, `quantity`, `price`, `fee`, `date`.\n\n"
-        "- `asset_id` and `account_id` must be valid UUIDs of existing assets/accounts.\n"
+        "- `asset_id` and `account_id` must be valid UUIDs of existing assets and of your own accounts.\n"
         "- `type` must match a valid TransactionType (e.g., BUY, SELL).\n"
         "- `quantity`, `price`, and `fee` must be numbers.\n"
         "- `date` must be in ISO format (e.g., 2024-08-22T14:00:00).\n"
@@ -81,6 +106,7 @@ def update_transaction(transaction_id: uuid.UUID, transaction_update: Transactio
 async def import_transactions_csv(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user_api),
     session: Session = Depends(get_session)
 ):
     if not file.filename or not file.filename.endswith(".csv"):
@@ -91,6 +117,6 @@ async def import_transactions_csv(
     reader = csv.DictReader(csv_data)
     
     # Add to background task
-    background_tasks.add_task(process_csv_import, reader, session)
+    background_tasks.add_task(process_csv_import, reader, session, user_id=current_user.id)
     
     return {"message": "CSV import started. Check logs for results."}
\ No newline at end of file
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from sqlmodel import Session, select
-from ..models import User
+from ..models import Account, User
 from ..database import get_session
-from ..schemas import UserCreate, UserRead, UserUpdate
+from ..dependencies import get_owned_user
+from ..versioning import conditional_get
+from ..holdings import get_holdings
+from ..portfolio_values import get_value_series, update_portfolio_values
+from ..projection import run_projection
+from ..schemas import HoldingRead, ProjectionRead, ProjectionRequest, SeriesTier, UserCreate, UserRead, UserUpdate, ValueSeriesRead
 from typing import Any, List, Sequence
+from datetime import datetime
 import uuid
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -28,23 +34,66 @@ def read_users(
     return [UserRead.model_validate(obj=user) for user in users]
 
 @router.get(path="/{user_id}", response_model=UserRead)
-def read_user(user_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> UserRead:
-    user: User | None = session.get(entity=User, ident=user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def read_user(user: User = Depends(get_owned_user)) -> UserRead:
     return UserRead.model_validate(obj=user)
 
+@router.get(path="/{user_id}/holdings", response_model=List[HoldingRead])
+def read_user_holdings(
+    user: User = Depends(get_owned_user),
+    session: Session = Depends(dependency=get_session),
+    include_closed: bool = False,
+    with_prices: bool = True,
+    base_currency: str | None = None
+) -> List[HoldingRead]:
+    return get_holdings(
+        session, Account.user_id == user.id,
+        include_closed=include_closed, with_prices=with_prices, base_currency=base_currency or user.base_currency
+    )
+
+@router.get(path="/{user_id}/value-series", response_model=ValueSeriesRead, dependencies=[Depends(get_owned_user), Depends(conditional_get("user", "portfoliovalue:{user_id}", "portfoliovaluerollup:{user_id}"))])
+def read_user_value_series(
+    user: User = Depends(get_owned_user),
+    session: Session = Depends(dependency=get_session),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    max_points: int = Query(default=500, ge=3, le=10000),
+    tier: SeriesTier | None = None
+) -> ValueSeriesRead:
+    # Reads daily values or the weekly/monthly rollups, whichever is the finest tier within max_points
+    return get_value_series(session, user, start=start, end=end, max_points=max_points, tier=tier)
+
+@router.post(path="/{user_id}/value-series/refresh")
+def refresh_user_value_series(
+    user: User = Depends(get_owned_user),
+    session: Session = Depends(dependency=get_session),
+    rebuild: bool = False
+) -> dict[str, int]:
+    # Recomputes from the last stored day or the earliest changed transaction; rebuild recomputes everything
+    return {"days": update_portfolio_values(session, user, rebuild=rebuild)}
+
+@router.post(path="/{user_id}/projection", response_model=ProjectionRead)
+def project_user_portfolio(
+    request: ProjectionRequest,
+    user: User = Depends(get_owned_user),
+    session: Session = Depends(dependency=get_session)
+) -> ProjectionRead:
+    # Monte Carlo projection of the holdings under the cash-flow schedule; pass seed to reproduce a result
+    try:
+        return run_projection(session, user, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete(path="/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: uuid.UUID, session: Session = Depends(dependency=get_session)) -> None:
-    user: User | None = session.get(entity=User, ident=user_id)
+def delete_user(owner: User = Depends(get_owned_user), session: Session = Depends(dependency=get_session)) -> None:
+    user: User | None = session.get(entity=User, ident=owner.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     session.delete(instance=user)
     session.commit()
 
 @router.patch(path="/{user_id}", response_model=UserRead)
-def update_user(user_id: uuid.UUID, user_update: UserUpdate, session: Session = Depends(dependency=get_session)) -> UserRead:
-    user: User | None = session.get(entity=User, ident=user_id)
+def update_user(user_update: UserUpdate, owner: User = Depends(get_owned_user), session: Session = Depends(dependency=get_session)) -> UserRead:
+    user: User | None = session.get(entity=User, ident=owner.id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user_data: dict[str, Any] = user_update.model_dump(exclude_unset=True)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 import uuid
 from datetime import datetime
@@ -31,11 +31,32 @@ class TransactionType(str, Enum):
     DIVIDEND_EARNED = "Dividend Earned"
     DIVIDEND_REINVESTED = "Dividend Reinvested"
 
+class CorporateActionType(str, Enum):
+    SPLIT = "Split"
+    DIVIDEND = "Dividend"
+
+class ReturnModel(str, Enum):
+    BOOTSTRAP = "bootstrap"
+    PARAMETRIC = "parametric"
+
+class RebalanceRule(str, Enum):
+    NONE = "none"
+    MONTHLY = "monthly"
+    QUARTERLY = "quarterly"
+    ANNUAL = "annual"
+    THRESHOLD = "threshold"
+
+class SeriesTier(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
 class AssetCreate(BaseModel):
     symbol: str
     name: str | None = None
     currency: str = "USD"
     data_source: DataSource = DataSource.YAHOO
+    tracking_index: str | None = None
     
 class AssetRead(BaseModel):
     id: uuid.UUID
@@ -43,6 +64,7 @@ class AssetRead(BaseModel):
     name: str | None = None
     currency: str
     data_source: DataSource
+    tracking_index: str | None = None
 
     class Config:
         from_attributes = True
@@ -52,17 +74,20 @@ class AssetUpdate(BaseModel):
     name: str | None = None
     currency: str | None = None
     data_source: DataSource | None = None
+    tracking_index: str | None = None
     
 class AccountCreate(BaseModel):
     name: str | None = None
     user_id: uuid.UUID
     balance: float | None = None
+    taxable: bool = True
 
 class AccountRead(BaseModel):
     id: uuid.UUID
     name: str | None = None
     user_id: uuid.UUID
     balance: float
+    taxable: bool = True
 
     class Config:
         from_attributes = True
@@ -71,15 +96,18 @@ class AccountUpdate(BaseModel):
     name: str | None = None
     user_id: uuid.UUID | None = None
     balance: float | None = None
+    taxable: bool | None = None
 
 class UserCreate(BaseModel):
     username: str
     email: str | None = None
+    base_currency: str = "USD"
 
 class UserRead(BaseModel):
     id: uuid.UUID
     username: str
     email: str | None = None
+    base_currency: str = "USD"
 
     class Config:
         from_attributes = True
@@ -87,6 +115,7 @@ class UserRead(BaseModel):
 class UserUpdate(BaseModel):
     username: str | None = None
     email: str | None = None
+    base_currency: str | None = None
     
 class TransactionCreate(BaseModel):
     asset_id: uuid.UUID
@@ -116,4 +145,180 @@ class TransactionUpdate(BaseModel):
     quantity: float | None = None
     price: float | None = None
     fee: float | None = None
-    date: datetime | None = None
\ No newline at end of file
+    date: datetime | None = None
+
+class HoldingRead(BaseModel):
+    account_id: uuid.UUID
+    asset_id: uuid.UUID
+    symbol: str
+    name: str | None = None
+    currency: str
+    quantity: float
+    average_cost: float
+    cost_basis: float
+    dividends: float
+    price: float | None = None
+    price_time: datetime | None = None
+    market_value: float | None = None
+    unrealized_gain: float | None = None
+    base_currency: str | None = None
+    fx_rate: float | None = None
+    cost_basis_base: float | None = None
+    market_value_base: float | None = None
+
+class CorporateActionRead(BaseModel):
+    id: uuid.UUID
+    asset_id: uuid.UUID
+    type: CorporateActionType
+    date: datetime
+    value: float
+
+    class Config:
+        from_attributes = True
+
+class FxRateRead(BaseModel):
+    currency: str
+    date: datetime
+    rate: float
+
+    class Config:
+        from_attributes = True
+
+class ValuePointRead(BaseModel):
+    date: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    net_flow: float
+
+class ValueSeriesRead(BaseModel):
+    tier: SeriesTier
+    base_currency: str
+    points: list[ValuePointRead]
+
+class YearReturnRead(BaseModel):
+    year: int
+    start_value: float
+    end_value: float
+    net_flow: float
+    gain: float
+    time_weighted_return: float | None = None
+
+class AssetContributionRead(BaseModel):
+    asset_id: uuid.UUID
+    symbol: str | None = None
+    currency: str | None = None
+    contributed: float
+    withdrawn: float
+    reinvested: float
+    net_contribution: float
+
+class MonthlyDividendRead(BaseModel):
+    month: datetime
+    currency: str | None = None
+    paid: float
+    reinvested: float
+    total: float
+
+class HarvestLotRead(BaseModel):
+    transaction_id: uuid.UUID
+    account_id: uuid.UUID
+    asset_id: uuid.UUID
+    symbol: str
+    currency: str
+    acquired: datetime
+    long_term: bool
+    quantity: float
+    cost_basis: float
+    price: float
+    market_value: float
+    unrealized_gain: float
+    unrealized_gain_base: float
+    wash_sale_group: str
+    wash_sale_conflicts: int
+
+class WashSaleConflictRead(BaseModel):
+    transaction_id: uuid.UUID
+    account_id: uuid.UUID
+    asset_id: uuid.UUID
+    symbol: str
+    type: TransactionType
+    quantity: float
+    date: datetime
+    wash_sale_group: str
+
+class HarvestReportRead(BaseModel):
+    as_of: datetime
+    base_currency: str
+    min_loss: float
+    total_loss: float
+    candidates: list[HarvestLotRead]
+    wash_sale_conflicts: list[WashSaleConflictRead]
+
+class CashFlowPeriod(BaseModel):
+    start_year: int = Field(default=0, ge=0)
+    end_year: int | None = Field(default=None, ge=0, description="First year without the flow; None runs to the end")
+    amount: float = Field(description="Per year in today's money; negative for withdrawals")
+
+class ProjectionRequest(BaseModel):
+    years: int = Field(default=30, ge=1, le=100)
+    paths: int = Field(default=10000, ge=100, le=200000)
+    seed: int | None = None
+    initial_value: float | None = Field(default=None, description="Starting value; defaults to the market value of the holdings")
+    cash_flows: list[CashFlowPeriod] = []
+    inflation: float = Field(default=0.0, description="Annual growth of the cash flows")
+    model: ReturnModel = ReturnModel.BOOTSTRAP
+    expected_return: float = Field(default=0.06, description="Parametric model: expected annual return")
+    volatility: float = Field(default=0.15, ge=0, description="Parametric model: annual volatility")
+    history_years: int = Field(default=30, ge=2, le=100, description="Bootstrap model: years of monthly returns to sample")
+    block_months: int = Field(default=12, ge=1, le=120, description="Bootstrap model: consecutive months drawn together")
+    percentiles: list[float] = [5, 10, 25, 50, 75, 90, 95]
+
+class ProjectionBandRead(BaseModel):
+    year: int
+    values: list[float]
+
+class ProjectionRead(BaseModel):
+    base_currency: str
+    model: ReturnModel
+    paths: int
+    seed: int
+    initial_value: float
+    weights: dict[str, float]
+    history_months: int | None = None
+    success_probability: float
+    percentiles: list[float]
+    bands: list[ProjectionBandRead]
+
+class BacktestPortfolio(BaseModel):
+    name: str
+    weights: dict[uuid.UUID, float] = Field(description="Target weight per asset id; normalized to sum to 1")
+    rebalance: RebalanceRule = RebalanceRule.ANNUAL
+    threshold: float = Field(default=0.05, gt=0, lt=1, description="Threshold rule: largest drift from a target weight before rebalancing")
+
+class BacktestRequest(BaseModel):
+    portfolios: list[BacktestPortfolio] = Field(min_length=1, max_length=20)
+    start: datetime | None = None
+    end: datetime | None = None
+    initial_value: float = Field(default=10000.0, gt=0)
+    monthly_contribution: float = Field(default=0.0, ge=0, description="Invested at the target weights on the first trading day of every month")
+
+class BacktestResultRead(BaseModel):
+    name: str
+    final_value: float
+    contributions: float
+    cagr: float
+    volatility: float
+    max_drawdown: float
+    max_drawdown_peak: datetime
+    max_drawdown_trough: datetime
+    rebalances: int
+
+class BacktestRead(BaseModel):
+    key: str
+    cached: bool
+    start: datetime
+    end: datetime
+    trading_days: int
+    results: list[BacktestResultRead]
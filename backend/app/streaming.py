@@ -0,0 +1,200 @@
+"""Live price ticks and portfolio totals for server-sent event streams, fed by one shared refresh loop.
+
+The hub keeps a reference count per distinct symbol subscribed by any client and refreshes all
+of them every STREAM_INTERVAL seconds with get_cached_prices, which makes one call per provider
+for the whole batch (and, with PRICE_CACHE_BACKEND=sqlite, shares the result between workers).
+Upstream calls grow with the distinct symbols in use, not with the connected clients.
+
+Every subscription has a mailbox keyed by symbol: a newer tick replaces one the client hasn't
+read yet. A slow client therefore gets the latest prices when it catches up instead of a backlog,
+and a subscription never buffers more than one tick per symbol.
+"""
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime
+from typing import Any, Iterable
+import asyncio
+import logging
+import os
+import uuid
+from sqlmodel import Session, select
+from .database import engine
+from .holdings import get_holdings
+from .metrics import STREAM_SUBSCRIBERS, STREAM_SYMBOLS, STREAM_TICKS_COALESCED
+from .models import Account, Asset, User
+from .schemas import DataSource
+from .versioning import get_versions, user_scope
+from ..services.prices import get_cached_prices
+
+logger = logging.getLogger(__name__)
+
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "15"))
+
+class Subscription:
+    """Symbols one client follows and the ticks it hasn't read yet (latest per symbol)."""
+
+    def __init__(self, symbols: dict[str, DataSource]) -> None:
+        self.symbols = symbols
+        self._pending: dict[str, tuple[float, datetime]] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, symbol: str, price: tuple[float, datetime]) -> None:
+        if symbol in self._pending:
+            STREAM_TICKS_COALESCED.inc()
+        self._pending[symbol] = price
+        self._ready.set()
+
+    async def next(self, timeout: float) -> dict[str, tuple[float, datetime]]:
+        """Ticks received since the last call, waiting up to timeout seconds for one (empty on timeout)."""
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {}
+        self._ready.clear()
+        ticks, self._pending = self._pending, {}
+        return ticks
+
+class PriceHub:
+    """Fans the prices of every subscribed symbol out to the subscriptions, refreshing each symbol once per interval."""
+
+    def __init__(self, interval: float = STREAM_INTERVAL) -> None:
+        self.interval = interval
+        self._subscriptions: set[Subscription] = set()
+        self._sources: dict[str, DataSource] = {}
+        self._counts: Counter[str] = Counter()
+        self._latest: dict[str, tuple[float, datetime]] = {}
+        self._task: asyncio.Task[None] | None = None
+        self._wake: asyncio.Event | None = None
+
+    def subscribe(self, symbols: dict[str, DataSource]) -> Subscription:
+        subscription = Subscription(symbols)
+        self._subscriptions.add(subscription)
+        STREAM_SUBSCRIBERS.inc()
+        self._add_symbols(subscription, symbols)
+        return subscription
+
+    def resubscribe(self, subscription: Subscription, symbols: dict[str, DataSource]) -> None:
+        """Change the symbols of a subscription, e.g. after the user's holdings changed."""
+        self._remove_symbols(subscription.symbols)
+        subscription.symbols = symbols
+        self._add_symbols(subscription, symbols)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.discard(subscription)
+            STREAM_SUBSCRIBERS.dec()
+            self._remove_symbols(subscription.symbols)
+
+    def _add_symbols(self, subscription: Subscription, symbols: dict[str, DataSource]) -> None:
+        new = [symbol for symbol in symbols if not self._counts[symbol]]
+        self._counts.update(symbols.keys())
+        self._sources.update(symbols)
+        STREAM_SYMBOLS.inc(len(new))
+        # New subscribers start from the last prices seen; symbols nobody followed yet are fetched right away
+        for symbol in symbols:
+            if symbol in self._latest:
+                subscription.push(symbol, self._latest[symbol])
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        elif new and self._wake is not None:
+            self._wake.set()
+
+    def _remove_symbols(self, symbols: Iterable[str]) -> None:
+        for symbol in symbols:
+            self._counts[symbol] -= 1
+            if self._counts[symbol] <= 0:
+                del self._counts[symbol]
+                self._sources.pop(symbol, None)
+                self._latest.pop(symbol, None)
+                STREAM_SYMBOLS.dec()
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while self._counts:
+            sources = list(self._sources.items())
+            try:
+                # Providers are blocking, so the refresh runs in a thread
+                prices = await asyncio.to_thread(get_cached_prices, sources)
+            except Exception:
+                logger.exception(f"Refreshing {len(sources)} streamed symbols failed")
+                prices = {}
+            changed = {
+                symbol: price for (symbol, _), price in prices.items()
+                if symbol in self._counts and self._latest.get(symbol) != price
+            }
+            self._latest.update(changed)
+            if changed:
+                for subscription in list(self._subscriptions):
+                    for symbol in changed.keys() & subscription.symbols.keys():
+                        subscription.push(symbol, changed[symbol])
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+hub = PriceHub()
+
+def asset_symbols(asset_ids: Iterable[uuid.UUID]) -> dict[str, tuple[uuid.UUID, DataSource]]:
+    """Symbol of each asset with its id and data source."""
+    with Session(engine) as session:
+        assets = session.exec(select(Asset).where(Asset.id.in_(list(asset_ids)))).all()
+    return {asset.symbol: (asset.id, asset.data_source) for asset in assets}
+
+class PortfolioPositions:
+    """Quantities held by a user per symbol, with the factor converting their value to the base currency."""
+
+    def __init__(self, user_id: uuid.UUID) -> None:
+        self.user_id = user_id
+        self.base_currency = "USD"
+        self.quantities: dict[str, float] = {}
+        self.sources: dict[str, DataSource] = {}
+        self.asset_ids: dict[str, uuid.UUID] = {}
+        self.version: dict[str, int] = {}
+
+    def _scopes(self) -> list[str]:
+        return ["asset", "user", user_scope("transaction", self.user_id)]
+
+    def load(self) -> None:
+        with Session(engine) as session:
+            user = session.get(entity=User, ident=self.user_id)
+            if user is None:
+                raise LookupError(f"User {self.user_id} not found")
+            self.version = get_versions(session, self._scopes())
+            self.base_currency = user.base_currency
+            holdings = get_holdings(session, Account.user_id == self.user_id, with_prices=False, base_currency=user.base_currency)
+        self.quantities = {}
+        for holding in holdings:
+            # Positions without an FX rate can't be added to the total
+            if holding.fx_rate is not None:
+                self.quantities[holding.symbol] = self.quantities.get(holding.symbol, 0.0) + holding.quantity * holding.fx_rate
+        symbols = asset_symbols({holding.asset_id for holding in holdings})
+        self.sources = {symbol: data_source for symbol, (_, data_source) in symbols.items()}
+        self.asset_ids = {symbol: asset_id for symbol, (asset_id, _) in symbols.items()}
+
+    def changed(self) -> bool:
+        """Whether the holdings may have changed since load()."""
+        with Session(engine) as session:
+            return get_versions(session, self._scopes()) != self.version
+
+    def total(self, prices: dict[str, tuple[float, datetime]]) -> dict[str, Any]:
+        priced = [symbol for symbol in self.quantities if symbol in prices]
+        return {
+            "user_id": self.user_id,
+            "base_currency": self.base_currency,
+            "market_value": sum(self.quantities[symbol] * prices[symbol][0] for symbol in priced),
+            "priced_positions": len(priced),
+            "positions": len(self.quantities),
+            "price_time": max((prices[symbol][1] for symbol in priced), default=None),
+        }
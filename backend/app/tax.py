@@ -0,0 +1,179 @@
+"""Tax-loss harvesting candidates: open lots in taxable accounts trading below their cost.
+
+Open lots are computed for every position of the user at once with numpy. Acquisitions (buys
+and reinvested dividends) are lots, and sells consume the oldest lots first (FIFO). With the
+ledger ordered by account, asset and date, the quantity left in each lot is its cumulative
+acquired quantity minus the position's total sold quantity, clipped to the lot size. Quantities
+are split-adjusted like the holdings, so they are in today's shares.
+
+A loss is disallowed as a wash sale when the same or a substantially identical asset is bought
+within 30 days before or after the sale, in any of the user's accounts (taxable or not). Assets
+tracking the same index count as substantially identical. The buys in that window come from one
+query on the (asset_id, date) index of Transaction.
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+import uuid
+from sqlalchemy import or_
+from sqlmodel import Session, select
+from .models import Account, Asset, Transaction, User
+from .schemas import HarvestLotRead, HarvestReportRead, TransactionType, WashSaleConflictRead
+from ..services.corporate_actions import load_splits, split_factors_at
+from ..services.fx import conversion_factors, latest_rates
+from ..services.prices import get_cached_prices
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ACQUISITION_TYPES = (TransactionType.BUY, TransactionType.DIVIDEND_REINVESTED)
+WASH_SALE_DAYS = 30
+LONG_TERM_DAYS = 365
+# Lots smaller than this are treated as fully sold
+CLOSED_LOT_EPSILON = 1e-9
+
+def wash_sale_group(asset: Asset) -> str:
+    """Key shared by substantially identical assets: the tracking index, or the asset itself."""
+    return f"index:{asset.tracking_index}" if asset.tracking_index else f"asset:{asset.id}"
+
+def open_lots(session: Session, user_id: uuid.UUID) -> dict[str, np.ndarray]:
+    """Open lots of the user's taxable accounts as parallel arrays, in ledger order.
+
+    Returns the arrays transaction_id, account_id, asset_id (object), acquired (datetime64),
+    quantity (split-adjusted shares left) and cost (cost basis of the shares left).
+    """
+    import numpy as np
+    # Accounts first, so the ledger query searches the account_id index instead of walking the whole table
+    account_ids = session.exec(select(Account.id).where(Account.user_id == user_id, Account.taxable)).all()
+    rows = session.exec(
+        select(Transaction.id, Transaction.account_id, Transaction.asset_id, Transaction.type, Transaction.quantity, Transaction.price, Transaction.fee, Transaction.date)
+        .where(Transaction.account_id.in_(account_ids), Transaction.type.in_([*ACQUISITION_TYPES, TransactionType.SELL]))
+        .order_by(Transaction.account_id, Transaction.asset_id, Transaction.date)
+    ).all() if account_ids else []
+    columns = ("transaction_id", "account_id", "asset_id", "acquired", "quantity", "cost")
+    if not rows:
+        return {column: np.empty(0) for column in columns}
+
+    transaction_ids = np.array([row.id for row in rows], dtype=object)
+    account_ids = np.array([row.account_id for row in rows], dtype=object)
+    asset_ids = np.array([row.asset_id for row in rows], dtype=object)
+    dates = np.array([row.date for row in rows], dtype="datetime64[us]")
+    quantities = np.array([row.quantity for row in rows], dtype=np.float64)
+    costs = np.array([row.quantity * row.price + row.fee for row in rows], dtype=np.float64)
+    acquired = np.array([row.type in ACQUISITION_TYPES for row in rows])
+
+    factors = np.ones(len(rows), dtype=np.float64)
+    for asset_id, (split_dates, split_ratios) in load_splits(session, set(asset_ids.tolist())).items():
+        mask = asset_ids == asset_id
+        factors[mask] = split_factors_at(dates[mask], split_dates, split_ratios)
+    shares = quantities * factors
+
+    # Positions are contiguous runs of (account, asset); cumulative sums restart at each run
+    starts = np.flatnonzero(np.r_[True, (account_ids[1:] != account_ids[:-1]) | (asset_ids[1:] != asset_ids[:-1])])
+    position = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(rows)]))
+    lot_shares = np.where(acquired, shares, 0.0)
+    cumulative = np.cumsum(lot_shares)
+    cumulative -= np.r_[0.0, cumulative][starts][position]
+    sold = np.add.reduceat(np.where(acquired, 0.0, shares), starts)[position]
+    left = np.clip(cumulative - sold, 0.0, lot_shares)
+
+    keep = acquired & (left > CLOSED_LOT_EPSILON)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining_cost = np.where(lot_shares > 0, costs * left / lot_shares, 0.0)
+    return {
+        "transaction_id": transaction_ids[keep],
+        "account_id": account_ids[keep],
+        "asset_id": asset_ids[keep],
+        "acquired": dates[keep],
+        "quantity": left[keep],
+        "cost": remaining_cost[keep],
+    }
+
+def _window_buys(session: Session, user_id: uuid.UUID, groups: dict[uuid.UUID, str], as_of: datetime) -> list[Any]:
+    """Acquisitions of any asset in the groups within the wash-sale window around as_of, in all of the user's accounts."""
+    indexes = {group.removeprefix("index:") for group in groups.values() if group.startswith("index:")}
+    related = session.exec(
+        select(Asset).where(or_(Asset.id.in_(list(groups)), Asset.tracking_index.in_(indexes)))
+    ).all()
+    assets = {asset.id: asset for asset in related}
+    window = timedelta(days=WASH_SALE_DAYS)
+    rows = session.exec(
+        select(Transaction.id, Transaction.account_id, Transaction.asset_id, Transaction.type, Transaction.quantity, Transaction.date)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(
+            Transaction.asset_id.in_(list(assets)),
+            Transaction.date >= as_of - window,
+            Transaction.date <= as_of + window,
+            Transaction.type.in_(ACQUISITION_TYPES),
+            Account.user_id == user_id,
+        )
+        .order_by(Transaction.date)
+    ).all()
+    return [(row, assets[row.asset_id]) for row in rows]
+
+def harvest_candidates(session: Session, user: User, min_loss: float = 0.0, as_of: datetime | None = None) -> HarvestReportRead:
+    """Open lots in taxable accounts whose unrealized loss in the base currency is at least min_loss, largest first."""
+    import numpy as np
+    as_of = as_of or datetime.now()
+    base_currency = user.base_currency.upper()
+    report = HarvestReportRead(as_of=as_of, base_currency=base_currency, min_loss=min_loss, total_loss=0.0, candidates=[], wash_sale_conflicts=[])
+    lots = open_lots(session, user.id)
+    if not len(lots["quantity"]):
+        return report
+
+    lot_asset_ids = list(dict.fromkeys(lots["asset_id"].tolist()))
+    assets = {asset.id: asset for asset in session.exec(select(Asset).where(Asset.id.in_(lot_asset_ids))).all()}
+    prices = get_cached_prices((asset.symbol, asset.data_source) for asset in assets.values())
+    price_of = {asset_id: prices.get((asset.symbol, asset.data_source)) for asset_id, asset in assets.items()}
+    price = np.array([price_of[asset_id][0] if price_of[asset_id] else np.nan for asset_id in lots["asset_id"]])
+    currencies = [assets[asset_id].currency for asset_id in lots["asset_id"]]
+    factors = conversion_factors(currencies, base_currency, latest_rates(session, [*set(currencies), base_currency]))
+
+    market_value = lots["quantity"] * price
+    gain = market_value - lots["cost"]
+    gain_base = gain * factors
+    # Lots without a price or FX rate have a NaN gain and are never candidates
+    selected = np.flatnonzero(gain_base <= -abs(min_loss) if min_loss else gain_base < 0)
+    if not len(selected):
+        return report
+    selected = selected[np.argsort(gain_base[selected], kind="stable")]
+
+    groups = {asset_id: wash_sale_group(assets[asset_id]) for asset_id in set(lots["asset_id"][selected].tolist())}
+    buys = _window_buys(session, user.id, groups, as_of)
+    buys_per_group: dict[str, int] = {}
+    for row, asset in buys:
+        buys_per_group[wash_sale_group(asset)] = buys_per_group.get(wash_sale_group(asset), 0) + 1
+    # A lot bought inside the window doesn't conflict with its own sale
+    bought = {row.id for row, _ in buys}
+    own = [transaction_id in bought for transaction_id in lots["transaction_id"][selected].tolist()]
+    long_term = lots["acquired"][selected] <= np.datetime64(as_of - timedelta(days=LONG_TERM_DAYS), "us")
+
+    for index, is_own, is_long_term in zip(selected.tolist(), own, long_term.tolist()):
+        asset = assets[lots["asset_id"][index]]
+        group = groups[asset.id]
+        report.candidates.append(HarvestLotRead(
+            transaction_id=lots["transaction_id"][index],
+            account_id=lots["account_id"][index],
+            asset_id=asset.id,
+            symbol=asset.symbol,
+            currency=asset.currency,
+            acquired=lots["acquired"][index].item(),
+            long_term=is_long_term,
+            quantity=float(lots["quantity"][index]),
+            cost_basis=float(lots["cost"][index]),
+            price=float(price[index]),
+            market_value=float(market_value[index]),
+            unrealized_gain=float(gain[index]),
+            unrealized_gain_base=float(gain_base[index]),
+            wash_sale_group=group,
+            wash_sale_conflicts=buys_per_group.get(group, 0) - int(is_own),
+        ))
+    report.total_loss = float(gain_base[selected].sum())
+    report.wash_sale_conflicts = [
+        WashSaleConflictRead(
+            transaction_id=row.id, account_id=row.account_id, asset_id=asset.id, symbol=asset.symbol,
+            type=row.type, quantity=row.quantity, date=row.date, wash_sale_group=wash_sale_group(asset),
+        )
+        for row, asset in buys
+    ]
+    return report
@@ -0,0 +1,85 @@
+"""The Jinja environment shared by every HTML route, with precompiled templates and a fragment cache.
+
+Templates are compiled once per process and, through a bytecode cache, once per deployment:
+a restarted worker loads the compiled code instead of parsing the sources again. The cache is
+Jinja's per-user temporary directory, or TEMPLATE_CACHE_DIR, which must be private to the
+app's user since the cached code is executed. warm_templates() compiles all of them at startup, so no request pays for it. Source
+changes are only picked up with TEMPLATE_AUTO_RELOAD=true, for development.
+
+Expensive blocks are wrapped in a fragment cache tag:
+
+    {% cache "dashboard-recent", fragment_versions %} ... {% endcache %}
+
+The rendered block is stored per worker under the tag's arguments. Views pass the versions of
+the data the block shows (see fragment_versions), so any write to that data changes the key
+and the block is rendered again on the next view. Data the block needs should be passed as a
+callable and called inside the block, so a cached view doesn't run the queries either.
+"""
+from typing import Any, Iterable
+import os
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, nodes, select_autoescape
+from jinja2.ext import Extension
+from jinja2.parser import Parser
+from sqlmodel import Session
+from .cache import TTLCache, private_directory
+from .versioning import get_versions
+
+TEMPLATE_DIR = "frontend/templates"
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
+# Unset uses Jinja's per-user directory, empty disables the bytecode cache
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", "3600"))
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "2000"))
+
+# Rendered template blocks per cache tag key
+fragment_cache: TTLCache[tuple[Any, ...], str] = TTLCache(name="fragment", maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL)
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, ... %}body{% endcache %}: render body once per distinct key."""
+    tags = {"cache"}
+
+    def parse(self, parser: Parser) -> nodes.Node:
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render_cached", [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, parts: list[Any], caller: Any) -> str:
+        key = tuple(str(part) for part in parts)
+        rendered = fragment_cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            fragment_cache.set(key, rendered)
+        return rendered
+
+def _bytecode_cache() -> FileSystemBytecodeCache | None:
+    if TEMPLATE_CACHE_DIR is None:
+        # Jinja creates its own directory per user and refuses one that is shared
+        return FileSystemBytecodeCache()
+    if not TEMPLATE_CACHE_DIR:
+        return None
+    private_directory(TEMPLATE_CACHE_DIR)
+    return FileSystemBytecodeCache(directory=TEMPLATE_CACHE_DIR)
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    bytecode_cache=_bytecode_cache(),
+    extensions=[FragmentCacheExtension],
+)
+templates = Jinja2Templates(env=environment)
+
+def warm_templates() -> int:
+    """Compile every template into the environment (and the bytecode cache). Returns the number compiled."""
+    names = environment.list_templates(extensions=["html"])
+    for name in names:
+        environment.get_template(name)
+    return len(names)
+
+def fragment_versions(session: Session, scopes: Iterable[str]) -> str:
+    """Fragment cache key part that changes whenever one of the scopes is written."""
+    return ";".join(f"{scope}={version}" for scope, version in get_versions(session, scopes).items())
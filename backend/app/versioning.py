@@ -0,0 +1,163 @@
+"""Per-table and per-user data versions for conditional GETs.
+
+Every ORM write bumps a counter in the DataVersion table, in the same transaction as the write:
+one per table (e.g. "transaction") and, for tables owned by a user, one per table and user
+(e.g. "transaction:<user id>"). ORM bulk statements (insert/update/delete on a mapped class)
+bump the table and the user counters of the owners named in the statement's "version_users"
+execution option, e.g. delete(PortfolioValue).execution_options(version_users=[user.id]).
+Without the option the owners aren't known, so all of the table's existing user counters are
+bumped. Writes that bypass the ORM (raw SQL in the synthetic data generator) must call
+bump_versions themselves.
+
+List endpoints declare the versions they depend on with conditional_get; the dependency turns
+them into a strong ETag and answers If-None-Match with 304 before the endpoint runs its query.
+"""
+from importlib import import_module
+from typing import Any, Callable, Iterable
+import hashlib
+import uuid
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import Connection, event, select, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from .database import get_session
+from .dependencies import get_current_user_api
+from .models import Account, DataVersion, PortfolioValue, PortfolioValueRollup, Transaction, User
+
+# Tables whose rows belong to a user, so they also have per-user versions
+USER_SCOPED_TABLES = ("account", "transaction", "portfoliovalue", "portfoliovaluerollup")
+
+def user_scope(table: str, user_id: uuid.UUID) -> str:
+    return f"{table}:{user_id.hex}"
+
+def _scopes_for(table: str, user_ids: Iterable[uuid.UUID]) -> set[str]:
+    return {table} | {user_scope(table, user_id) for user_id in user_ids}
+
+def bump_versions(connection: Connection, scopes: Iterable[str], all_users: Iterable[str] = ()) -> None:
+    """Increment the given version scopes (creating them at 1), plus every user scope of the all_users tables."""
+    scopes = sorted(set(scopes) | set(all_users))
+    if not scopes:
+        return
+    for table in all_users:
+        connection.execute(
+            update(DataVersion).where(DataVersion.scope.like(f"{table}:%")).values(version=DataVersion.version + 1)
+        )
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = import_module(f"sqlalchemy.dialects.{dialect}").insert
+        statement = insert(DataVersion).values([{"scope": scope, "version": 1} for scope in scopes])
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=["scope"], set_={"version": DataVersion.version + 1}
+        ))
+        return
+    existing = set(connection.execute(select(DataVersion.scope).where(DataVersion.scope.in_(scopes))).scalars())
+    if existing:
+        connection.execute(
+            update(DataVersion).where(DataVersion.scope.in_(existing)).values(version=DataVersion.version + 1)
+        )
+    missing = [{"scope": scope, "version": 1} for scope in scopes if scope not in existing]
+    if missing:
+        connection.execute(DataVersion.__table__.insert(), missing)
+
+def get_versions(session: Session, scopes: Iterable[str]) -> dict[str, int]:
+    """Current version of each scope; scopes never written are at 0."""
+    scopes = list(scopes)
+    found = dict(session.exec(select(DataVersion.scope, DataVersion.version).where(DataVersion.scope.in_(scopes))).all())
+    return {scope: found.get(scope, 0) for scope in scopes}
+
+@event.listens_for(OrmSession, "after_flush")
+def _bump_flushed(session: OrmSession, flush_context: Any) -> None:
+    changed = [
+        *session.new,
+        *session.deleted,
+        *(instance for instance in session.dirty if session.is_modified(instance, include_collections=False)),
+    ]
+    tables: dict[str, set[uuid.UUID]] = {}
+    account_ids: dict[str, set[uuid.UUID]] = {}
+    for instance in changed:
+        table = getattr(type(instance), "__tablename__", None)
+        if table is None or table == DataVersion.__tablename__:
+            continue
+        owners = tables.setdefault(table, set())
+        if isinstance(instance, (Account, PortfolioValue, PortfolioValueRollup)) and instance.user_id:
+            owners.add(instance.user_id)
+        elif isinstance(instance, Transaction) and instance.account_id:
+            account_ids.setdefault(table, set()).add(instance.account_id)
+    if not tables:
+        return
+
+    connection = session.connection()
+    if account_ids:
+        wanted = set().union(*account_ids.values())
+        owners_by_account = dict(connection.execute(select(Account.id, Account.user_id).where(Account.id.in_(wanted))).all())
+        for table, ids in account_ids.items():
+            tables[table].update(owners_by_account[account_id] for account_id in ids if account_id in owners_by_account)
+    scopes: set[str] = set()
+    for table, owners in tables.items():
+        scopes |= _scopes_for(table, owners)
+    bump_versions(connection, scopes)
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _bump_bulk(state: Any) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    table = state.bind_mapper.local_table.name
+    if table == DataVersion.__tablename__:
+        return
+    if table not in USER_SCOPED_TABLES:
+        bump_versions(state.session.connection(), [table])
+        return
+    owners = state.execution_options.get("version_users")
+    if owners is not None:
+        bump_versions(state.session.connection(), _scopes_for(table, owners))
+    else:
+        bump_versions(state.session.connection(), [table], all_users=[table])
+
+def _scope_value(value: Any) -> str:
+    # Path parameters arrive as strings; user scopes use the UUID hex form
+    try:
+        return uuid.UUID(str(value)).hex
+    except ValueError:
+        return str(value)
+
+def _matches(etag: str, if_none_match: str) -> bool:
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def _answer_conditional(request: Request, response: Response, session: Session, scopes: list[str]) -> None:
+    versions = get_versions(session, scopes)
+    fingerprint = ";".join(f"{scope}={version}" for scope, version in versions.items())
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    digest = hashlib.sha256(f"{fingerprint}|{request.url.path}?{query}".encode()).hexdigest()[:32]
+    etag = f'"{digest}"'
+    if _matches(etag, request.headers.get("if-none-match", "")):
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+def conditional_get(*scopes: str) -> Callable[..., None]:
+    """Dependency adding a strong ETag built from the scopes' versions, and answering 304 when it matches.
+
+    Scopes may reference path parameters, e.g. "transaction:{user_id}". The query string is part
+    of the ETag, so every page of a list has its own.
+    """
+    def dependency(request: Request, response: Response, session: Session = Depends(get_session)) -> None:
+        params = {name: _scope_value(value) for name, value in request.path_params.items()}
+        _answer_conditional(request, response, session, [scope.format(**params) for scope in scopes])
+    return dependency
+
+def user_conditional_get(*scopes: str) -> Callable[..., None]:
+    """conditional_get for lists of the authenticated user: "{current_user}" in a scope is the user's id.
+
+    The scope names are part of the ETag, so two users never share one.
+    """
+    def dependency(
+        request: Request,
+        response: Response,
+        current_user: User = Depends(get_current_user_api),
+        session: Session = Depends(get_session),
+    ) -> None:
+        resolved = [scope.format(current_user=current_user.id.hex) for scope in scopes]
+        _answer_conditional(request, response, session, resolved)
+    return dependency
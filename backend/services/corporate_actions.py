@@ -0,0 +1,120 @@
+# Corporate actions (splits and dividends) fetched from the providers and cached in the database,
+# plus the split adjustment applied to ledger quantities and prices when they are read
+# numpy is imported on first use, so importing the app doesn't load it
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Iterable, Sequence
+import logging
+import os
+import uuid
+from sqlmodel import Session, delete, select
+from ..app.models import Asset, CorporateAction, ProviderSync
+from ..app.schemas import CorporateActionType, DataSource
+from .yahoo import get_yahoo_corporate_actions
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SYNC_DATASET = "corporate_actions"
+# Corporate actions change rarely, so refetch them at most once a day per symbol
+CORPORATE_ACTIONS_TTL = float(os.getenv("CORPORATE_ACTIONS_TTL", "86400"))
+# Number of symbols requested from the provider per call
+CORPORATE_ACTIONS_BATCH_SIZE = int(os.getenv("CORPORATE_ACTIONS_BATCH_SIZE", "50"))
+
+# Returns the assets whose corporate actions were never fetched or are older than the TTL
+def stale_assets(session: Session, assets: Iterable[Asset], ttl: float = CORPORATE_ACTIONS_TTL) -> list[Asset]:
+    candidates = [asset for asset in assets if asset.data_source == DataSource.YAHOO]
+    if not candidates:
+        return []
+    cutoff = datetime.now() - timedelta(seconds=ttl)
+    fresh = set(session.exec(
+        select(ProviderSync.key).where(
+            ProviderSync.dataset == SYNC_DATASET,
+            ProviderSync.key.in_([asset.symbol for asset in candidates]),
+            ProviderSync.synced_at >= cutoff,
+        )
+    ).all())
+    return [asset for asset in candidates if asset.symbol not in fresh]
+
+# Fetch the corporate actions of the given assets in batches and replace the stored ones
+# Only stale assets are fetched unless force is set. Returns the number of assets synced
+def sync_corporate_actions(session: Session, assets: Iterable[Asset], force: bool = False) -> int:
+    assets = list(assets)
+    to_sync = [asset for asset in assets if asset.data_source == DataSource.YAHOO] if force else stale_assets(session, assets)
+    synced = 0
+    for start in range(0, len(to_sync), CORPORATE_ACTIONS_BATCH_SIZE):
+        batch = to_sync[start:start + CORPORATE_ACTIONS_BATCH_SIZE]
+        try:
+            actions = get_yahoo_corporate_actions([asset.symbol for asset in batch])
+        except Exception as e:
+            # Keep serving what is stored; the next read retries the sync
+            logger.warning(f"Fetching corporate actions failed for {len(batch)} symbols: {e}")
+            continue
+        now = datetime.now()
+        for asset in batch:
+            if asset.symbol not in actions:
+                continue
+            session.exec(delete(CorporateAction).where(CorporateAction.asset_id == asset.id))
+            session.add_all([
+                CorporateAction(asset_id=asset.id, type=action_type, date=date, value=value)
+                for date, action_type, value in actions[asset.symbol]
+            ])
+            session.merge(ProviderSync(dataset=SYNC_DATASET, key=asset.symbol, synced_at=now))
+            synced += 1
+        session.commit()
+    return synced
+
+# Split history of several assets in one query: {asset_id: (ex-dates, ratios)} sorted by date
+def load_splits(session: Session, asset_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, tuple[np.ndarray, np.ndarray]]:
+    import numpy as np
+    asset_ids = list(set(asset_ids))
+    if not asset_ids:
+        return {}
+    rows = session.exec(
+        select(CorporateAction.asset_id, CorporateAction.date, CorporateAction.value)
+        .where(CorporateAction.type == CorporateActionType.SPLIT, CorporateAction.asset_id.in_(asset_ids))
+        .order_by(CorporateAction.asset_id, CorporateAction.date)
+    ).all()
+    grouped: dict[uuid.UUID, tuple[list[datetime], list[float]]] = {}
+    for asset_id, date, ratio in rows:
+        dates, ratios = grouped.setdefault(asset_id, ([], []))
+        dates.append(date)
+        ratios.append(ratio)
+    return {
+        asset_id: (np.array(dates, dtype="datetime64[us]"), np.array(ratios, dtype=np.float64))
+        for asset_id, (dates, ratios) in grouped.items()
+    }
+
+# Cumulative factor of the splits after each position of the split list:
+# factors[i] is the product of ratios[i:], with a trailing 1.0 for "no later split"
+def cumulative_split_factors(ratios: np.ndarray) -> np.ndarray:
+    import numpy as np
+    factors = np.ones(len(ratios) + 1, dtype=np.float64)
+    if len(ratios):
+        factors[:-1] = np.cumprod(ratios[::-1])[::-1]
+    return factors
+
+# Split factor for each date: the product of the ratios of every split after that date
+# A split dated on the same instant as a transaction is treated as already applied to it
+def split_factors_at(dates: Sequence[datetime] | np.ndarray, split_dates: np.ndarray, split_ratios: np.ndarray) -> np.ndarray:
+    import numpy as np
+    dates = np.asarray(dates, dtype="datetime64[us]")
+    if not len(split_ratios):
+        return np.ones(len(dates), dtype=np.float64)
+    positions = np.searchsorted(split_dates, dates, side="right")
+    return cumulative_split_factors(split_ratios)[positions]
+
+# Adjust quantities and prices for the splits after each date, so they are expressed in today's shares
+# Quantity times price (and so the transaction value) is unchanged
+def adjust_for_splits(
+    dates: Sequence[datetime] | np.ndarray,
+    quantities: Sequence[float] | np.ndarray,
+    prices: Sequence[float] | np.ndarray,
+    split_dates: np.ndarray,
+    split_ratios: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    import numpy as np
+    factors = split_factors_at(dates, split_dates, split_ratios)
+    return np.asarray(quantities, dtype=np.float64) * factors, np.asarray(prices, dtype=np.float64) / factors
@@ -0,0 +1,180 @@
+# Daily exchange rates cached in the database, backfilled incrementally from the provider,
+# and bulk conversion of amounts and price matrices into a base currency
+# numpy is imported on first use, so importing the app doesn't load it
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Iterable, Sequence
+import logging
+import os
+from sqlalchemy import and_, delete, func, insert
+from sqlmodel import Session, select
+from ..app.cache import TTLCache
+from ..app.models import FxRate, ProviderSync
+from .yahoo import get_yahoo_fx_history
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rates are stored as the value of one unit in the pivot currency, so any pair is rate[a] / rate[b]
+PIVOT_CURRENCY = "USD"
+SYNC_DATASET = "fx"
+# Fetch new rates at most this often per currency
+FX_SYNC_TTL = float(os.getenv("FX_SYNC_TTL", "21600"))
+# First day fetched for a currency that has no stored rates yet
+FX_BACKFILL_START = datetime.fromisoformat(os.getenv("FX_BACKFILL_START", "2000-01-01"))
+FX_CACHE_TTL = float(os.getenv("FX_CACHE_TTL", "300"))
+latest_rate_cache: TTLCache[str, float] = TTLCache(name="fx", maxsize=1000, ttl=FX_CACHE_TTL)
+
+# Fetch the rates missing since the last stored day for each currency, in as few provider calls as possible
+# The last stored day is fetched again and replaced, since it may have been stored from an intraday rate
+# Currencies synced within FX_SYNC_TTL are skipped unless force is set. Returns the number of rates stored
+def backfill_fx_rates(session: Session, currencies: Iterable[str], force: bool = False) -> int:
+    pending = sorted({currency.upper() for currency in currencies} - {PIVOT_CURRENCY})
+    if pending and not force:
+        cutoff = datetime.now() - timedelta(seconds=FX_SYNC_TTL)
+        fresh = set(session.exec(
+            select(ProviderSync.key).where(
+                ProviderSync.dataset == SYNC_DATASET,
+                ProviderSync.key.in_(pending),
+                ProviderSync.synced_at >= cutoff,
+            )
+        ).all())
+        pending = [currency for currency in pending if currency not in fresh]
+    if not pending:
+        return 0
+
+    last_dates: dict[str, datetime] = dict(session.exec(
+        select(FxRate.currency, func.max(FxRate.date)).where(FxRate.currency.in_(pending)).group_by(FxRate.currency)
+    ).all())
+    # Currencies stored up to the same day are downloaded together, which is usually all of them
+    groups: dict[datetime | None, list[str]] = {}
+    for currency in pending:
+        groups.setdefault(last_dates.get(currency), []).append(currency)
+
+    stored = 0
+    now = datetime.now()
+    for last_date, group in groups.items():
+        start = last_date or FX_BACKFILL_START
+        try:
+            rates = get_yahoo_fx_history(group, start=start)
+        except Exception as e:
+            # Keep valuing with the stored rates; the next read retries the backfill
+            logger.warning(f"Fetching FX rates failed for {', '.join(group)}: {e}")
+            continue
+        rows = [
+            {"currency": currency, "date": date, "rate": rate}
+            for currency in group
+            for date, rate in rates.get(currency, [])
+            if last_date is None or date >= last_date
+        ]
+        refreshed = sorted({row["currency"] for row in rows if row["date"] == last_date})
+        if refreshed:
+            session.execute(delete(FxRate).where(FxRate.currency.in_(refreshed), FxRate.date == last_date))
+        if rows:
+            session.execute(insert(FxRate), rows)
+        for currency in group:
+            session.merge(ProviderSync(dataset=SYNC_DATASET, key=currency, synced_at=now))
+        stored += len(rows)
+    session.commit()
+    latest_rate_cache.pop_where(lambda currency, _: currency in pending)
+    return stored
+
+# Latest stored rate of each currency in the pivot currency; currencies without any rate are left out
+# With sync, stale currencies are backfilled from the provider first
+def latest_rates(session: Session, currencies: Iterable[str], sync: bool = True) -> dict[str, float]:
+    wanted = {currency.upper() for currency in currencies}
+    rates: dict[str, float] = {PIVOT_CURRENCY: 1.0} if PIVOT_CURRENCY in wanted else {}
+    missing = []
+    for currency in wanted - {PIVOT_CURRENCY}:
+        rate = latest_rate_cache.get(currency)
+        if rate is None:
+            missing.append(currency)
+        else:
+            rates[currency] = rate
+    if not missing:
+        return rates
+
+    if sync:
+        backfill_fx_rates(session, missing)
+    latest = (
+        select(FxRate.currency, func.max(FxRate.date).label("date"))
+        .where(FxRate.currency.in_(missing))
+        .group_by(FxRate.currency)
+        .subquery()
+    )
+    rows = session.exec(
+        select(FxRate.currency, FxRate.rate).join(latest, and_(FxRate.currency == latest.c.currency, FxRate.date == latest.c.date))
+    ).all()
+    for currency, rate in rows:
+        rates[currency] = rate
+        latest_rate_cache.set(currency, rate)
+    return rates
+
+# Factor converting one unit of each listed currency into the base currency (NaN when a rate is unknown)
+# Unique currencies are resolved once, so the cost doesn't grow with the number of rows
+def conversion_factors(currencies: Sequence[str], base_currency: str, rates: dict[str, float]) -> np.ndarray:
+    import numpy as np
+    codes = np.array([currency.upper() for currency in currencies], dtype=str)
+    if not len(codes):
+        return np.empty(0, dtype=np.float64)
+    unique, inverse = np.unique(codes, return_inverse=True)
+    pivot_rates = np.array([rates.get(currency, np.nan) for currency in unique], dtype=np.float64)
+    return pivot_rates[inverse] / rates.get(base_currency.upper(), np.nan)
+
+# Convert amounts given in the listed currencies into the base currency with the latest rates
+def convert_to_base(
+    session: Session,
+    amounts: Sequence[float] | np.ndarray,
+    currencies: Sequence[str],
+    base_currency: str,
+    sync: bool = True,
+) -> np.ndarray:
+    import numpy as np
+    rates = latest_rates(session, [*currencies, base_currency], sync=sync)
+    return np.asarray(amounts, dtype=np.float64) * conversion_factors(currencies, base_currency, rates)
+
+# Rates of each currency on each date, as of the latest stored day on or before it (NaN before the first)
+# Returns an array of shape (len(dates), len(currencies)) loaded with one query
+def rate_matrix(session: Session, currencies: Sequence[str], dates: Sequence[datetime] | np.ndarray) -> np.ndarray:
+    import numpy as np
+    dates = np.asarray(dates, dtype="datetime64[us]")
+    codes = [currency.upper() for currency in currencies]
+    matrix = np.full((len(dates), len(codes)), np.nan, dtype=np.float64)
+    if not len(dates) or not codes:
+        return matrix
+    stored = sorted(set(codes) - {PIVOT_CURRENCY})
+    rows = session.exec(
+        select(FxRate.currency, FxRate.date, FxRate.rate)
+        .where(FxRate.currency.in_(stored), FxRate.date <= dates.max().item())
+        .order_by(FxRate.currency, FxRate.date)
+    ).all() if stored else []
+    series: dict[str, tuple[list[datetime], list[float]]] = {}
+    for currency, date, rate in rows:
+        days, values = series.setdefault(currency, ([], []))
+        days.append(date)
+        values.append(rate)
+    for column, currency in enumerate(codes):
+        if currency == PIVOT_CURRENCY:
+            matrix[:, column] = 1.0
+            continue
+        if currency not in series:
+            continue
+        days = np.array(series[currency][0], dtype="datetime64[us]")
+        values = np.append(np.nan, series[currency][1])
+        # Index 0 (NaN) is used for dates before the first stored rate
+        matrix[:, column] = values[np.searchsorted(days, dates, side="right")]
+    return matrix
+
+# Convert a (dates x columns) matrix of values, each column in its own currency, into the base currency
+def convert_matrix(
+    session: Session,
+    values: np.ndarray,
+    dates: Sequence[datetime] | np.ndarray,
+    column_currencies: Sequence[str],
+    base_currency: str,
+) -> np.ndarray:
+    import numpy as np
+    rates = rate_matrix(session, [*column_currencies, base_currency], dates)
+    return np.asarray(values, dtype=np.float64) * (rates[:, :-1] / rates[:, -1:])
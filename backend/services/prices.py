@@ -0,0 +1,168 @@
+# Quote lookups shared by the routes, served from a short-lived cache in front of the providers
+# With PRICE_CACHE_BACKEND=sqlite the quotes are also shared by all workers on the host: one worker
+# claims and fetches the missing symbols, the others wait for its result instead of calling the provider
+# When a provider fails or its circuit is open (see resilience.py), the last price fetched within
+# QUOTE_STALE_TTL is served instead; its price time tells how old it is
+from datetime import datetime
+from typing import Iterable
+import logging
+import os
+import time
+import uuid
+from ..app.cache import SharedCache, TTLCache
+from ..app.schemas import DataSource
+from .providers import get_provider
+from .resilience import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "300"))
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "5000"))
+PRICE_CACHE_BACKEND = os.getenv("PRICE_CACHE_BACKEND", "memory").lower()
+PRICE_CACHE_PATH = os.getenv("PRICE_CACHE_PATH", "backend/cache/prices.db")
+# Seconds a worker waits for symbols another worker is fetching before fetching them itself
+PRICE_CACHE_WAIT = float(os.getenv("PRICE_CACHE_WAIT", "10"))
+PRICE_CACHE_POLL = 0.05
+QUOTE_STALE_TTL = float(os.getenv("QUOTE_STALE_TTL", "86400"))
+
+# Quotes are keyed by (symbol, data source): the same symbol can be priced by different providers
+QuoteKey = tuple[str, DataSource]
+Quote = tuple[float, datetime]
+
+quote_cache: TTLCache[QuoteKey, Quote] = TTLCache(name="quote", maxsize=QUOTE_CACHE_SIZE, ttl=QUOTE_CACHE_TTL)
+# Last fetched quote of each symbol, served when its provider can't be reached
+stale_quote_cache: TTLCache[QuoteKey, Quote] = TTLCache(name="quote_stale", maxsize=QUOTE_CACHE_SIZE, ttl=QUOTE_STALE_TTL)
+shared_quote_cache: SharedCache | None = None
+if PRICE_CACHE_BACKEND == "sqlite":
+    shared_quote_cache = SharedCache(name="quote_shared", path=PRICE_CACHE_PATH, ttl=QUOTE_CACHE_TTL)
+elif PRICE_CACHE_BACKEND != "memory":
+    raise ValueError(f"Unknown PRICE_CACHE_BACKEND {PRICE_CACHE_BACKEND}, expected memory or sqlite")
+
+def _shared_key(key: QuoteKey) -> str:
+    symbol, data_source = key
+    return f"{DataSource(data_source).value}:{symbol}"
+
+def _by_source(keys: Iterable[QuoteKey]) -> dict[DataSource, list[str]]:
+    missing: dict[DataSource, list[str]] = {}
+    for symbol, data_source in keys:
+        missing.setdefault(data_source, []).append(symbol)
+    return missing
+
+def _fetch(missing: dict[DataSource, list[str]]) -> dict[QuoteKey, Quote]:
+    prices: dict[QuoteKey, Quote] = {}
+    for data_source, symbols in missing.items():
+        provider = get_provider(data_source)
+        try:
+            fetched = provider.get_prices(symbols)
+        except UpstreamUnavailable as e:
+            logger.debug(f"Skipped price lookup of {len(symbols)} symbols from {provider.name}: {e}")
+            continue
+        except Exception as e:
+            logger.warning(f"Price lookup failed for {len(symbols)} symbols from {provider.name}: {e}")
+            continue
+        for symbol, price in fetched.items():
+            stale_quote_cache.set((symbol, data_source), price)
+            prices[symbol, data_source] = price
+    return prices
+
+def _stale_prices(missing: dict[DataSource, list[str]], prices: dict[QuoteKey, Quote]) -> dict[QuoteKey, Quote]:
+    """Last known prices of the missing symbols still without a price."""
+    stale: dict[QuoteKey, Quote] = {}
+    for data_source, symbols in missing.items():
+        for symbol in symbols:
+            if (symbol, data_source) not in prices:
+                price = stale_quote_cache.get((symbol, data_source))
+                if price is not None:
+                    stale[symbol, data_source] = price
+    return stale
+
+def _read_shared(shared: SharedCache, keys: Iterable[QuoteKey]) -> dict[QuoteKey, Quote]:
+    keys_by_name = {_shared_key(key): key for key in keys}
+    prices: dict[QuoteKey, Quote] = {}
+    for name, ((price, time_), expires) in shared.get_many(keys_by_name).items():
+        key = keys_by_name[name]
+        prices[key] = (price, datetime.fromisoformat(time_))
+        # Keep the local copy no longer than the shared one
+        quote_cache.set(key, prices[key], ttl=expires - time.time())
+        stale_quote_cache.set(key, prices[key])
+    return prices
+
+def _fetch_to_shared(shared: SharedCache, keys: list[QuoteKey]) -> dict[QuoteKey, Quote]:
+    """Fetch the quotes and store them in the shared cache and this worker's cache."""
+    prices = _fetch(_by_source(keys))
+    shared.set_many({_shared_key(key): (price, time_.isoformat()) for key, (price, time_) in prices.items()})
+    for key, price in prices.items():
+        quote_cache.set(key, price)
+    return prices
+
+def _fetch_shared(shared: SharedCache, missing: dict[DataSource, list[str]]) -> dict[QuoteKey, Quote]:
+    owner = uuid.uuid4().hex
+    keys_by_name = {_shared_key((symbol, data_source)): (symbol, data_source) for data_source, symbols in missing.items() for symbol in symbols}
+    claimed = {keys_by_name[name] for name in shared.claim(keys_by_name, owner)}
+    try:
+        prices = _fetch_to_shared(shared, [key for key in keys_by_name.values() if key in claimed])
+    finally:
+        shared.release((_shared_key(key) for key in claimed), owner)
+
+    # Wait for the symbols other workers are fetching; a released claim without a value means no price
+    waiting = set(keys_by_name.values()) - claimed
+    deadline = time.monotonic() + PRICE_CACHE_WAIT
+    while waiting:
+        found = _read_shared(shared, waiting)
+        prices.update(found)
+        waiting = {keys_by_name[name] for name in shared.claimed(_shared_key(key) for key in waiting.difference(found))}
+        if not waiting or time.monotonic() >= deadline:
+            break
+        time.sleep(PRICE_CACHE_POLL)
+    if waiting:
+        logger.warning(f"Gave up waiting for {len(waiting)} symbols claimed by another worker, fetching them here")
+        prices.update(_fetch_to_shared(shared, [key for key in keys_by_name.values() if key in waiting]))
+    return prices
+
+def get_cached_prices(assets: Iterable[QuoteKey]) -> dict[QuoteKey, Quote]:
+    """Latest price and price time of each (symbol, data source), fetched on cache misses.
+
+    Misses are grouped by provider, so each provider is called once for all its symbols.
+    Prices are returned by (symbol, data source); symbols without a price are left out. For a
+    failing provider the last known prices are returned, but not cached as fresh, so the next
+    call asks the provider again.
+    """
+    prices: dict[QuoteKey, Quote] = {}
+    misses: list[QuoteKey] = []
+    for key in dict.fromkeys(assets):
+        price = quote_cache.get(key)
+        if price is not None:
+            prices[key] = price
+        else:
+            misses.append(key)
+    if not misses:
+        return prices
+    if shared_quote_cache is None:
+        missing = _by_source(misses)
+        fetched = _fetch(missing)
+        for key, price in fetched.items():
+            quote_cache.set(key, price)
+        prices.update(fetched)
+        prices.update(_stale_prices(missing, prices))
+        return prices
+
+    prices.update(_read_shared(shared_quote_cache, misses))
+    missing = _by_source(key for key in misses if key not in prices)
+    if missing:
+        prices.update(_fetch_shared(shared_quote_cache, missing))
+        prices.update(_stale_prices(missing, prices))
+    return prices
+
+def get_cached_price(symbol: str, data_source: DataSource) -> Quote | None:
+    """Latest price and price time of a symbol, or None if its provider has no price."""
+    return get_cached_prices([(symbol, data_source)]).get((symbol, data_source))
+
+def invalidate_prices(symbols: Iterable[str]) -> None:
+    """Drop cached quotes of the symbols from every data source, e.g. after new prices were uploaded.
+
+    Other workers' local copies expire on their own.
+    """
+    symbols = set(symbols)
+    quote_cache.pop_where(lambda key, _: key[0] in symbols)
+    if shared_quote_cache is not None:
+        shared_quote_cache.delete_many(_shared_key((symbol, data_source)) for symbol in symbols for data_source in DataSource)
@@ -0,0 +1,230 @@
+# Price providers keyed by DataSource
+# Every provider answers for many symbols in one call, so callers group assets by data source
+# and make a single call per provider instead of one per asset
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any
+import csv
+import logging
+import os
+import random
+import threading
+import time
+from sqlalchemy import and_, func
+from sqlmodel import Session, select
+from ..app.database import engine
+from ..app.models import Asset, PriceBar
+from ..app.schemas import DataSource, IntervalEnum
+from .resilience import get_guard
+from .yahoo import get_yahoo_histories, get_yahoo_prices
+
+logger = logging.getLogger(__name__)
+
+# Keys of the history records returned by every provider (the columns Yahoo uses)
+HISTORY_COLUMNS = ("Date", "Open", "High", "Low", "Close", "Volume")
+
+class PriceProvider(ABC):
+    """Batch-first price lookups. Symbols a provider has no data for are left out of the results.
+
+    Subclasses must implement both lookups; one missing a method can't be instantiated.
+    """
+    name = "base"
+
+    @abstractmethod
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        """Latest price and price time of each symbol."""
+
+    @abstractmethod
+    def get_histories(
+        self,
+        symbols: list[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        interval: IntervalEnum | None = None,
+    ) -> dict[str, list[dict[str, Any]]]:
+        """Price history records of each symbol, oldest first. Raises ValueError for unsupported intervals."""
+
+class YahooProvider(PriceProvider):
+    name = "yahoo"
+
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        return get_yahoo_prices(symbols)
+
+    def get_histories(
+        self,
+        symbols: list[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        interval: IntervalEnum | None = None,
+    ) -> dict[str, list[dict[str, Any]]]:
+        histories = get_yahoo_histories(symbols, start=start, end=end, interval=interval)
+        return {symbol: history.reset_index().to_dict(orient="records") for symbol, history in histories.items()}
+
+def _check_daily(provider: PriceProvider, interval: IntervalEnum | None) -> None:
+    if interval not in (None, IntervalEnum.ONE_DAY):
+        raise ValueError(f"The {provider.name} provider only has daily prices")
+
+class ManualProvider(PriceProvider):
+    """Prices stored in the PriceBar table, entered or uploaded as CSV."""
+    name = "manual"
+
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        latest = (
+            select(PriceBar.asset_id, func.max(PriceBar.date).label("date"))
+            .join(Asset, Asset.id == PriceBar.asset_id)
+            .where(Asset.symbol.in_(symbols))
+            .group_by(PriceBar.asset_id)
+            .subquery()
+        )
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Asset.symbol, PriceBar.close, PriceBar.date)
+                .join(PriceBar, PriceBar.asset_id == Asset.id)
+                .join(latest, and_(PriceBar.asset_id == latest.c.asset_id, PriceBar.date == latest.c.date))
+            ).all()
+        return {symbol: (close, date) for symbol, close, date in rows}
+
+    def get_histories(
+        self,
+        symbols: list[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        interval: IntervalEnum | None = None,
+    ) -> dict[str, list[dict[str, Any]]]:
+        _check_daily(self, interval)
+        statement = (
+            select(Asset.symbol, PriceBar.date, PriceBar.open, PriceBar.high, PriceBar.low, PriceBar.close, PriceBar.volume)
+            .join(PriceBar, PriceBar.asset_id == Asset.id)
+            .where(Asset.symbol.in_(symbols))
+        )
+        if start is not None:
+            statement = statement.where(PriceBar.date >= start)
+        if end is not None:
+            statement = statement.where(PriceBar.date <= end)
+        histories: dict[str, list[dict[str, Any]]] = {}
+        with Session(engine) as session:
+            for symbol, *bar in session.exec(statement.order_by(Asset.symbol, PriceBar.date)).all():
+                histories.setdefault(symbol, []).append(dict(zip(HISTORY_COLUMNS, bar)))
+        return histories
+
+class FileProvider(PriceProvider):
+    """Prices read from a CSV file (date,symbol,open,high,low,close,volume), for offline tests and benchmarks.
+
+    The file is the one written by `python -m backend.tools.synth --prices`; it is read once, on first use.
+    """
+    name = "file"
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self._bars: dict[str, tuple[list[datetime], list[tuple[Any, ...]]]] | None = None
+        self._lock = threading.Lock()
+
+    def load(self, path: str | None = None) -> None:
+        """Read (or re-read) the price file."""
+        self.path = path or self.path or os.getenv("PRICE_FILE")
+        if not self.path:
+            raise ValueError("No price file configured, set PRICE_FILE")
+        bars: dict[str, tuple[list[datetime], list[tuple[Any, ...]]]] = {}
+        with open(self.path, newline="") as f:
+            for row in csv.DictReader(f):
+                date = datetime.fromisoformat(row["date"])
+                bar = (date, *(float(row[column]) if row.get(column) else None for column in ("open", "high", "low", "close", "volume")))
+                dates, rows = bars.setdefault(row["symbol"], ([], []))
+                dates.append(date)
+                rows.append(bar)
+        for dates, rows in bars.values():
+            if any(later < earlier for earlier, later in zip(dates, dates[1:])):
+                rows.sort(key=lambda bar: bar[0])
+                dates.sort()
+        self._bars = bars
+
+    def _data(self) -> dict[str, tuple[list[datetime], list[tuple[Any, ...]]]]:
+        if self._bars is None:
+            with self._lock:
+                if self._bars is None:
+                    self.load()
+        return self._bars  # type: ignore[return-value]
+
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        data = self._data()
+        return {symbol: (data[symbol][1][-1][4], data[symbol][0][-1]) for symbol in symbols if symbol in data and data[symbol][0]}
+
+    def get_histories(
+        self,
+        symbols: list[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        interval: IntervalEnum | None = None,
+    ) -> dict[str, list[dict[str, Any]]]:
+        _check_daily(self, interval)
+        data = self._data()
+        histories: dict[str, list[dict[str, Any]]] = {}
+        for symbol in symbols:
+            if symbol not in data:
+                continue
+            dates, rows = data[symbol]
+            first = bisect_left(dates, start) if start is not None else 0
+            last = bisect_right(dates, end) if end is not None else len(dates)
+            if first < last:
+                histories[symbol] = [dict(zip(HISTORY_COLUMNS, bar)) for bar in rows[first:last]]
+        return histories
+
+class FaultyProvider(PriceProvider):
+    """Another provider's data (the file provider's by default) served through an upstream guard with injected
+    failures, for testing the resilience of provider calls offline: e.g. PRICE_PROVIDERS=YAHOO=faulty with PRICE_FILE set.
+
+    FAULTY_FAILURE_RATE of the calls (0 to 1) raise ConnectionError after FAULTY_LATENCY seconds. Both can also
+    be changed on the instance at run time; settings of the "faulty" guard are FAULTY_RATE_LIMIT, FAULTY_RETRIES etc.
+    """
+    name = "faulty"
+
+    def __init__(self, inner: PriceProvider | None = None, failure_rate: float | None = None, latency: float | None = None) -> None:
+        self.inner = inner or FileProvider()
+        self.failure_rate = float(os.getenv("FAULTY_FAILURE_RATE", "0")) if failure_rate is None else failure_rate
+        self.latency = float(os.getenv("FAULTY_LATENCY", "0")) if latency is None else latency
+        self.upstream_calls = 0
+
+    def _upstream(self, func: Any, *args: Any, **kwargs: Any) -> Any:
+        self.upstream_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError(f"Injected {self.name} provider failure")
+        return func(*args, **kwargs)
+
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        return get_guard(self.name).call("price", self._upstream, self.inner.get_prices, symbols)
+
+    def get_histories(
+        self,
+        symbols: list[str],
+        start: datetime | None = None,
+        end: datetime | None = None,
+        interval: IntervalEnum | None = None,
+    ) -> dict[str, list[dict[str, Any]]]:
+        return get_guard(self.name).call("history", self._upstream, self.inner.get_histories, symbols, start=start, end=end, interval=interval)
+
+_file_provider = FileProvider()
+_providers: dict[str, PriceProvider] = {
+    provider.name: provider for provider in (YahooProvider(), ManualProvider(), _file_provider, FaultyProvider(_file_provider))
+}
+_sources: dict[DataSource, str] = {DataSource.YAHOO: "yahoo", DataSource.MANUAL: "manual", DataSource.OTHER: "manual"}
+
+# PRICE_PROVIDERS overrides the provider per data source, e.g. "YAHOO=file,OTHER=file" to run offline
+for _mapping in filter(None, os.getenv("PRICE_PROVIDERS", "").split(",")):
+    _source, _, _name = _mapping.partition("=")
+    _sources[DataSource[_source.strip().upper()]] = _name.strip().lower()
+
+def register_provider(provider: PriceProvider) -> None:
+    _providers[provider.name] = provider
+
+def use_provider(data_source: DataSource, name: str) -> None:
+    """Route a data source to a registered provider."""
+    if name not in _providers:
+        raise ValueError(f"Unknown price provider {name}")
+    _sources[data_source] = name
+
+def get_provider(data_source: DataSource) -> PriceProvider:
+    return _providers[_sources[data_source]]
@@ -0,0 +1,272 @@
+# Rate limiting, retries and circuit breaking for calls to upstream data providers
+# Every upstream (e.g. "yahoo") has one guard per process, shared by all its operations:
+# - a token bucket admits PROVIDER_RATE_LIMIT calls per second with bursts of PROVIDER_BURST; callers
+#   wait their turn, up to PROVIDER_MAX_WAIT seconds, instead of firing unbounded requests
+# - transient errors are retried PROVIDER_RETRIES times with full-jitter exponential backoff
+# - after PROVIDER_BREAKER_FAILURES failed calls in a row the circuit opens and calls fail fast with
+#   CircuitOpen for PROVIDER_BREAKER_RESET seconds; then one trial call decides whether it closes again
+# Every setting can be overridden per upstream, e.g. YAHOO_RATE_LIMIT. Limits apply per worker process.
+from __future__ import annotations
+from enum import Enum
+from functools import wraps
+from typing import Any, Callable, TypeVar
+import logging
+import os
+import random
+import threading
+import time
+from ..app.metrics import PROVIDER_CIRCUIT_STATE, PROVIDER_REJECTED, PROVIDER_RETRIES, PROVIDER_THROTTLE_WAIT
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Errors that mean the request itself is wrong (e.g. an unsupported interval): not retried, not counted as failures
+NON_TRANSIENT_ERRORS: tuple[type[Exception], ...] = (ValueError, TypeError, NotImplementedError)
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that can't take the call now; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpen(UpstreamUnavailable):
+    """The upstream failed repeatedly and isn't called until its circuit closes."""
+
+class RateLimited(UpstreamUnavailable):
+    """The upstream's rate limit wouldn't admit the call within the maximum wait."""
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+def _setting(upstream: str, name: str, default: float) -> float:
+    return float(os.getenv(f"{upstream.upper()}_{name}", os.getenv(f"PROVIDER_{name}", str(default))))
+
+class TokenBucket:
+    """Thread-safe token bucket. Tokens can go negative: each caller reserves the next token and sleeps until it is due.
+
+    Args:
+        rate (float): Tokens added per second; 0 or less disables the limit.
+        burst (float): Most tokens held, i.e. calls admitted at once after an idle period.
+        clock (Callable[[], float], optional): Monotonic clock, overridable for tests.
+        sleep (Callable[[float], None], optional): Sleep function, overridable for tests.
+    """
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, max_wait: float) -> float:
+        """Take a token, sleeping until it is due. Returns the seconds waited.
+
+        Raises:
+            RateLimited: If the token wouldn't be due within max_wait seconds; no token is taken.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if wait > max_wait:
+                raise RateLimited(f"Rate limit of {self.rate:g}/s would delay the call {wait:.1f}s", retry_after=wait)
+            self._tokens -= 1.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single trial call when the reset timeout has passed.
+
+    Args:
+        failure_threshold (int): Failed calls in a row that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial call is let through.
+        clock (Callable[[], float], optional): Monotonic clock, overridable for tests.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    def before_call(self) -> None:
+        """Let the call through or raise CircuitOpen."""
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return
+            remaining = (self.opened_at or 0.0) + self.reset_timeout - self._clock()
+            if self.state == CircuitState.OPEN and remaining <= 0:
+                self.state = CircuitState.HALF_OPEN
+            if self.state == CircuitState.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpen("Circuit open after repeated upstream failures", retry_after=max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = CircuitState.OPEN
+                self.opened_at = self._clock()
+
+    def release(self) -> None:
+        """End a call that says nothing about the upstream's health (rejected locally or a request error)."""
+        with self._lock:
+            self._trial_running = False
+
+    def retry_after(self) -> float | None:
+        with self._lock:
+            if self.state == CircuitState.CLOSED or self.opened_at is None:
+                return None
+            return max(0.0, self.opened_at + self.reset_timeout - self._clock())
+
+class UpstreamGuard:
+    """Rate limiter, retry policy and circuit breaker of one upstream."""
+
+    def __init__(self, upstream: str) -> None:
+        self.upstream = upstream
+        self.limiter = TokenBucket(rate=_setting(upstream, "RATE_LIMIT", 2.0), burst=_setting(upstream, "BURST", 5.0))
+        self.max_wait = _setting(upstream, "MAX_WAIT", 10.0)
+        self.retries = int(_setting(upstream, "RETRIES", 3))
+        self.backoff = _setting(upstream, "BACKOFF", 0.5)
+        self.backoff_max = _setting(upstream, "BACKOFF_MAX", 8.0)
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(_setting(upstream, "BREAKER_FAILURES", 5)),
+            reset_timeout=_setting(upstream, "BREAKER_RESET", 30.0),
+        )
+        self.calls = 0
+        self.failed_calls = 0
+        self.retried = 0
+        self.rejected = 0
+        self._state_gauge = PROVIDER_CIRCUIT_STATE.labels(upstream)
+        self._wait_histogram = PROVIDER_THROTTLE_WAIT.labels(upstream)
+        self._state_gauge.set(0)
+
+    def _update_state(self) -> None:
+        self._state_gauge.set({CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}[self.breaker.state])
+
+    def call(self, operation: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Call func through the breaker, the rate limiter and the retry policy.
+
+        Raises:
+            CircuitOpen: If the circuit is open.
+            RateLimited: If no token would be due within the maximum wait.
+            Exception: The last error of func once the retries are used up, or a non-transient error right away.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self.rejected += 1
+            PROVIDER_REJECTED.labels(self.upstream, "circuit_open").inc()
+            raise
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                self._wait_histogram.observe(self.limiter.acquire(self.max_wait))
+            except RateLimited:
+                self.rejected += 1
+                PROVIDER_REJECTED.labels(self.upstream, "rate_limited").inc()
+                self.breaker.release()
+                raise
+            try:
+                result = func(*args, **kwargs)
+            except NON_TRANSIENT_ERRORS:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    self.failed_calls += 1
+                    self.breaker.record_failure()
+                    self._update_state()
+                    raise
+                # Full jitter: callers that failed together don't retry together
+                delay = random.uniform(0.0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                attempt += 1
+                self.retried += 1
+                PROVIDER_RETRIES.labels(self.upstream, operation).inc()
+                logger.info(f"{self.upstream} {operation} failed ({e}), retry {attempt}/{self.retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self._update_state()
+            return result
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "upstream": self.upstream,
+            "state": self.breaker.state.value,
+            "consecutive_failures": self.breaker.failures,
+            "retry_after": self.breaker.retry_after(),
+            "tokens": round(self.limiter.available(), 3),
+            "rate_limit": self.limiter.rate,
+            "burst": self.limiter.burst,
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "retries": self.retried,
+            "rejected": self.rejected,
+        }
+
+_guards: dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+def get_guard(upstream: str) -> UpstreamGuard:
+    with _guards_lock:
+        if upstream not in _guards:
+            _guards[upstream] = UpstreamGuard(upstream)
+        return _guards[upstream]
+
+def reset_guard(upstream: str) -> UpstreamGuard:
+    """Replace an upstream's guard with a fresh one, re-reading its settings (for tests and benchmarks)."""
+    with _guards_lock:
+        _guards[upstream] = UpstreamGuard(upstream)
+        return _guards[upstream]
+
+def resilient(upstream: str, operation: str) -> Callable[[F], F]:
+    """Decorator routing every call of a provider function through the upstream's guard."""
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return get_guard(upstream).call(operation, func, *args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+def upstream_status() -> list[dict[str, Any]]:
+    """Circuit state, rate limiter and call counters of every upstream called by this worker."""
+    with _guards_lock:
+        guards = list(_guards.values())
+    return [guard.status() for guard in guards]
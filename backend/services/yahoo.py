@@ -1,26 +1,148 @@
 # Services provided by the Yahoo Finance API via yfinance
-from pandas import DataFrame
-import yfinance as yf
+# pandas and yfinance are imported on first use, so importing the app doesn't load them
+# Every call goes through the "yahoo" guard: rate limited, retried with backoff and circuit broken
+# Downloads that yfinance swallowed errors of (throttling, connection failures) raise, so the guard sees them
+from __future__ import annotations
 from datetime import datetime
-from ..app.schemas import IntervalEnum
-
-# Lookup the current price of an asset using the asset symbol
-def get_yahoo_price(symbol: str) -> tuple[float, datetime] | None:
-    ticker: yf.Ticker = yf.Ticker(ticker=symbol)
-    data: DataFrame = ticker.history(period="1d")
-    if not data.empty:
-        price = float(data["Close"].iloc[-1])
-        price_time = data.index[-1].to_pydatetime()
-        return price, price_time
-    return None
-
-# Lookup historical price data for an asset using the asset symbol
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+from ..app.metrics import observe_provider
+from ..app.schemas import CorporateActionType, IntervalEnum
+from .resilience import resilient
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# Messages of symbols yfinance found but that have no data (delisted, or nothing in the range)
+_MISSING_DATA_ERRORS = ("YFPricesMissingError", "YFTzMissingError", "possibly delisted", "no price data found", "no timezone found")
+# Messages of requests yfinance rejected without asking Yahoo, e.g. a period the interval doesn't support
+_REQUEST_ERRORS = ("YFInvalidPeriodError",)
+
+def check_download_errors(errors: Mapping[str, str], tickers: Iterable[str]) -> None:
+    """Raise for the per-symbol errors yf.download reported, instead of returning them as empty frames.
+
+    Symbols without data aren't errors: they are left out of the result like before.
+
+    Args:
+        errors (Mapping[str, str]): yfinance.shared._ERRORS after the download, message by upper-case ticker.
+        tickers (Iterable[str]): The downloaded tickers; errors of other tickers are ignored.
+
+    Raises:
+        ValueError: If yfinance rejected the request (not retried).
+        ConnectionError: For any other error, e.g. rate limiting or a failed connection (retried by the guard).
+    """
+    requested = {ticker.upper() for ticker in tickers}
+    for ticker, message in errors.items():
+        message = str(message)
+        if ticker.upper() not in requested or any(marker in message for marker in _MISSING_DATA_ERRORS):
+            continue
+        if any(marker in message for marker in _REQUEST_ERRORS):
+            raise ValueError(f"Yahoo rejected {ticker}: {message}")
+        raise ConnectionError(f"Yahoo download of {ticker} failed: {message}")
+
+def _download(tickers: list[str], **kwargs: Any) -> DataFrame:
+    # yf.download doesn't raise: it returns failed symbols as empty columns and keeps their errors in
+    # yfinance.shared._ERRORS (reset by every download, so only other tickers of a concurrent download can leak in)
+    import yfinance as yf
+    from yfinance import shared
+    data: DataFrame = yf.download(tickers=tickers, progress=False, **kwargs)
+    check_download_errors(shared._ERRORS, tickers)
+    return data
+
+# Lookup the latest price of several symbols in one download
+# returns {symbol: (price, price time)}; symbols without a price are left out
+@resilient("yahoo", "price")
+@observe_provider("yahoo", "price")
+def get_yahoo_prices(symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+    data = _download(symbols, period="5d", interval="1d", group_by="column")
+    prices: dict[str, tuple[float, datetime]] = {}
+    if data is None or data.empty:
+        return prices
+    close = data["Close"]
+    if close.ndim == 1:
+        close = close.to_frame(name=symbols[0])
+    for symbol in symbols:
+        if symbol not in close:
+            continue
+        values = close[symbol].dropna()
+        if not values.empty:
+            prices[symbol] = float(values.iloc[-1]), values.index[-1].to_pydatetime()
+    return prices
+
+# Lookup historical price data for several symbols in one download
 # optional to provide a start time, end time, and interval (IntervalEnum provides allowed values)
-def get_yahoo_history(
-    symbol: str, 
-    start: datetime | None = None, 
-    end: datetime | None = None, 
+# returns {symbol: DataFrame indexed by date}; symbols without data are left out
+@resilient("yahoo", "history")
+@observe_provider("yahoo", "history")
+def get_yahoo_histories(
+    symbols: list[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
     interval: IntervalEnum | None = None
-) -> DataFrame:
-    ticker: yf.Ticker = yf.Ticker(ticker=symbol)
-    return ticker.history(start=start, end=end, interval=interval)
\ No newline at end of file
+) -> dict[str, DataFrame]:
+    import pandas as pd
+    data = _download(symbols, start=start, end=end, interval=interval.value if interval else "1d", group_by="ticker")
+    histories: dict[str, DataFrame] = {}
+    if data is None or data.empty:
+        return histories
+    for symbol in symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0):
+                continue
+            frame = data[symbol]
+        else:
+            frame = data
+        frame = frame.dropna(how="all")
+        if not frame.empty:
+            histories[symbol] = frame
+    return histories
+
+# Lookup the split and dividend history of several symbols in one batch
+# returns {symbol: [(ex-date, type, value), ...]} with naive datetimes, splits as new shares per old share
+@resilient("yahoo", "corporate_actions")
+@observe_provider("yahoo", "corporate_actions")
+def get_yahoo_corporate_actions(symbols: list[str]) -> dict[str, list[tuple[datetime, CorporateActionType, float]]]:
+    import yfinance as yf
+    tickers: yf.Tickers = yf.Tickers(tickers=" ".join(symbols))
+    actions: dict[str, list[tuple[datetime, CorporateActionType, float]]] = {}
+    for symbol in symbols:
+        data: DataFrame = tickers.tickers[symbol.upper()].actions
+        if data is None or data.empty:
+            actions[symbol] = []
+            continue
+        if data.index.tz is not None:
+            data.index = data.index.tz_localize(None)
+        rows: list[tuple[datetime, CorporateActionType, float]] = []
+        for column, action_type in (("Stock Splits", CorporateActionType.SPLIT), ("Dividends", CorporateActionType.DIVIDEND)):
+            if column not in data:
+                continue
+            values = data[column]
+            values = values[values > 0]
+            rows.extend((date.to_pydatetime(), action_type, float(value)) for date, value in values.items())
+        actions[symbol] = sorted(rows)
+    return actions
+
+# Lookup daily exchange rates of several currencies against USD in one download
+# returns {currency: [(date, USD per unit), ...]} with naive dates
+@resilient("yahoo", "fx")
+@observe_provider("yahoo", "fx")
+def get_yahoo_fx_history(
+    currencies: list[str],
+    start: datetime | None = None,
+    end: datetime | None = None
+) -> dict[str, list[tuple[datetime, float]]]:
+    tickers = {f"{currency}USD=X": currency for currency in currencies}
+    data = _download(list(tickers), start=start, end=end, interval="1d", auto_adjust=False)
+    rates: dict[str, list[tuple[datetime, float]]] = {currency: [] for currency in currencies}
+    if data is None or data.empty:
+        return rates
+    close = data["Close"]
+    if close.ndim == 1:
+        close = close.to_frame(name=next(iter(tickers)))
+    if close.index.tz is not None:
+        close.index = close.index.tz_localize(None)
+    for ticker, currency in tickers.items():
+        if ticker not in close:
+            continue
+        values = close[ticker].dropna()
+        rates[currency] = [(date.to_pydatetime(), float(value)) for date, value in values.items()]
+    return rates
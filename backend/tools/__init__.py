@@ -0,0 +1 @@
+# This file marks the tools module as a package.
@@ -0,0 +1,292 @@
+"""Benchmark suite for the API hot paths and the CSV import pipeline.
+
+Seeds a throwaway SQLite database at the requested scale, runs every scenario in-process
+against the ASGI app with prices served offline by the file provider, and writes the timings to a JSON file.
+``compare`` flags scenarios whose median got slower than a stored baseline.
+
+Usage:
+    python -m backend.tools.bench run [--transactions 100000] [--output bench.json] ...
+    python -m backend.tools.bench compare baseline.json bench.json [--threshold 0.2]
+"""
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+def parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Seed a database and run the benchmarks")
+    run.add_argument("--database", help="SQLite file to seed (default: a temporary file)")
+    run.add_argument("--users", type=int, default=10)
+    run.add_argument("--accounts-per-user", type=int, default=3)
+    run.add_argument("--assets", type=int, default=50)
+    run.add_argument("--transactions", type=int, default=100_000)
+    run.add_argument("--import-rows", type=int, default=5_000)
+    run.add_argument("--repeat", type=int, default=20, help="Samples per request scenario")
+    run.add_argument("--login-storm", type=int, default=20, help="Concurrent logins in the login storm")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--only", nargs="*", help="Run only these scenarios")
+    run.add_argument("--output", default="bench.json")
+
+    compare = commands.add_parser("compare", help="Compare a result file against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown of the median, as a fraction")
+    return parser.parse_args(argv)
+
+def summarize(samples_ms: list[float]) -> dict[str, float]:
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "mean": statistics.fmean(ordered),
+    }
+
+def seed_database(engine: Any, args: argparse.Namespace, prices_path: str) -> dict[str, list[uuid.UUID]]:
+    """Seed a synthetic dataset and give its first user the benchmark login. Returns the generated ids.
+
+    The matching daily price history is written to prices_path for the file provider.
+    """
+    from sqlmodel import update
+    from ..app.auth import get_password_hash
+    from ..app.models import Asset, User
+    from ..app.schemas import DataSource
+    from .synth import SynthConfig, SyntheticDataset, seed_database as seed_synthetic, write_prices_csv
+
+    config = SynthConfig(users=args.users, accounts_per_user=args.accounts_per_user, assets=args.assets, seed=args.seed)
+    config.target_transactions(args.transactions)
+    dataset = SyntheticDataset(config)
+    seed_synthetic(engine, dataset)
+    write_prices_csv(dataset, prices_path)
+
+    ids = {
+        "users": [uuid.UUID(hex=user_id) for user_id in dataset.user_ids],
+        "accounts": [uuid.UUID(hex=account_id) for account_id in dataset.account_ids],
+        "assets": [uuid.UUID(hex=asset_id) for asset_id in dataset.asset_ids],
+    }
+    with engine.begin() as connection:
+        connection.execute(
+            update(User)
+            .where(User.id == ids["users"][0])
+            .values(username=BENCH_USERNAME, password_hash=get_password_hash(BENCH_PASSWORD))
+        )
+        # Price every asset through the Yahoo data source, which the benchmark routes to the file provider
+        connection.execute(update(Asset).values(data_source=DataSource.YAHOO))
+    return ids
+
+def use_file_prices(prices_path: str) -> None:
+    """Serve Yahoo-sourced prices from the synthetic price file instead of the network."""
+    from ..app.schemas import DataSource
+    from ..services.providers import FileProvider, register_provider, use_provider
+
+    register_provider(FileProvider(prices_path))
+    use_provider(DataSource.YAHOO, "file")
+
+async def time_requests(request: Callable[[], Awaitable[Any]], repeat: int) -> list[float]:
+    await request()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await request()
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return samples
+
+async def bench_transactions_pagination(ctx: dict[str, Any]) -> dict[str, Any]:
+    client, args = ctx["client"], ctx["args"]
+    # The list is scoped to the logged-in bench user, who owns about one user's share of the ledger
+    user_transactions = args.transactions // args.users
+    results = {}
+    for label, offset in [("first_page", 0), ("middle_page", user_transactions // 2), ("last_page", max(user_transactions - 100, 0))]:
+        samples = await time_requests(lambda: client.get("/transactions/", params={"offset": offset, "limit": 100}), args.repeat)
+        results[f"transactions_list_{label}"] = summarize(samples)
+    return results
+
+async def bench_dashboard(ctx: dict[str, Any]) -> dict[str, Any]:
+    client, args = ctx["client"], ctx["args"]
+    samples = await time_requests(lambda: client.get("/dashboard"), args.repeat)
+    return {"dashboard_render": summarize(samples)}
+
+async def bench_prices(ctx: dict[str, Any]) -> dict[str, Any]:
+    client, args, asset_ids = ctx["client"], ctx["args"], ctx["ids"]["assets"]
+    asset_id = asset_ids[0]
+    results = {"asset_price": summarize(await time_requests(lambda: client.get(f"/assets/{asset_id}/price"), args.repeat))}
+    samples = await time_requests(lambda: client.get("/assets/prices", params={"asset_id": [str(id) for id in asset_ids]}), args.repeat)
+    results["asset_prices_batch"] = summarize(samples)
+    samples = await time_requests(lambda: client.get(f"/assets/{asset_id}/history"), args.repeat)
+    results["asset_history"] = summarize(samples)
+    return results
+
+async def bench_login_storm(ctx: dict[str, Any]) -> dict[str, Any]:
+    """API latency while many logins hash passwords concurrently, compared to idle latency."""
+    import httpx
+    client, args = ctx["client"], ctx["args"]
+    idle = await time_requests(lambda: client.get("/assets/"), args.repeat)
+
+    async def login() -> None:
+        async with httpx.AsyncClient(transport=client._transport, base_url=client.base_url) as storm_client:
+            await storm_client.post("/login/form", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+
+    storm = asyncio.gather(*[login() for _ in range(args.login_storm)])
+    during = await time_requests(lambda: client.get("/assets/"), args.repeat)
+    await storm
+    return {"api_latency_idle": summarize(idle), "api_latency_login_storm": summarize(during)}
+
+def bench_csv_import(ctx: dict[str, Any]) -> dict[str, Any]:
+    from sqlmodel import Session
+    from ..app.database import engine
+    from ..app.import_transactions import process_csv_import
+    from ..app.schemas import TransactionType
+
+    args, ids = ctx["args"], ctx["ids"]
+    rng = random.Random(args.seed + 1)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["asset_id", "account_id", "type", "quantity", "price", "fee", "date"])
+    for _ in range(args.import_rows):
+        writer.writerow([
+            rng.choice(ids["assets"]), rng.choice(ids["accounts"]), TransactionType.BUY.value,
+            round(rng.uniform(0.1, 100), 3), round(rng.uniform(10, 500), 2), 0.0,
+            (datetime(2020, 1, 1) + timedelta(minutes=rng.randrange(4 * 365 * 24 * 60))).isoformat(),
+        ])
+    text = buffer.getvalue()
+
+    results = {}
+    # The second pass finds every row already present and takes the update path
+    for label in ("insert", "update"):
+        with Session(bind=engine) as session:
+            started = time.perf_counter()
+            process_csv_import(csv.DictReader(io.StringIO(text)), session)
+            elapsed = time.perf_counter() - started
+        results[f"csv_import_{label}"] = {
+            **summarize([elapsed * 1000]),
+            "rows": args.import_rows,
+            "rows_per_second": args.import_rows / elapsed,
+        }
+    return results
+
+SCENARIOS: dict[str, Callable[[dict[str, Any]], Any]] = {
+    "transactions": bench_transactions_pagination,
+    "dashboard": bench_dashboard,
+    "prices": bench_prices,
+    "login_storm": bench_login_storm,
+    "csv_import": bench_csv_import,
+}
+
+async def run_scenarios(args: argparse.Namespace, ids: dict[str, list[uuid.UUID]]) -> dict[str, Any]:
+    import httpx
+    from ..app.main import app
+
+    results: dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/login/form", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+        if response.status_code >= 400:
+            raise RuntimeError(f"Benchmark login failed with {response.status_code}")
+        ctx = {"client": client, "args": args, "ids": ids}
+        for name, scenario in SCENARIOS.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            outcome = scenario(ctx)
+            results.update(await outcome if asyncio.iscoroutine(outcome) else outcome)
+    return results
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args: argparse.Namespace) -> int:
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="boglefolio-bench-"), "bench.db")
+    if os.path.exists(database):
+        os.remove(database)
+    # The app reads these when its modules are first imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["SQL_ECHO"] = "false"
+    logging.getLogger("backend.app.import_transactions").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    from ..app.database import engine
+    prices_path = os.path.join(os.path.dirname(database), "prices.csv")
+    started = time.perf_counter()
+    ids = seed_database(engine, args, prices_path)
+    seed_seconds = time.perf_counter() - started
+    use_file_prices(prices_path)
+    results = asyncio.run(run_scenarios(args, ids))
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": {
+                "users": args.users,
+                "accounts_per_user": args.accounts_per_user,
+                "assets": args.assets,
+                "transactions": args.transactions,
+                "import_rows": args.import_rows,
+            },
+            "seed": args.seed,
+            "seed_seconds": seed_seconds,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, stats in results.items():
+        print(f"{name:40} median {stats['median']:9.2f} ms   p95 {stats['p95']:9.2f} ms")
+    print(f"Results written to {args.output}")
+    return 0
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            print(f"{name:40} only in {'current' if name in current else 'baseline'}")
+            continue
+        before, after = baseline[name]["median"], current[name]["median"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:40} {before:9.2f} -> {after:9.2f} ms ({change:+.1%}){flag}")
+    if regressions:
+        print(f"{regressions} scenario(s) slower than the {args.threshold:.0%} threshold")
+        return 1
+    return 0
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    return run(args) if args.command == "run" else compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
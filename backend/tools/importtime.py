@@ -0,0 +1,72 @@
+"""Import-time budget check for the app and CLI entry points.
+
+Runs ``python -X importtime`` in a fresh interpreter for each module and fails when the
+cumulative import time exceeds the budget or when a module that must stay lazy was loaded.
+
+Usage:
+    python -m backend.tools.importtime [--budget-ms 1500] [--repeat 3] [module ...]
+"""
+import argparse
+import subprocess
+import sys
+
+# Entry points imported by uvicorn workers and Alembic
+DEFAULT_MODULES = ["backend.app.main", "backend.app.models"]
+# Heavy dependencies that must only be imported on first use
+LAZY_MODULES = ["pandas", "numpy", "yfinance", "authlib", "duckdb", "pyarrow"]
+DEFAULT_BUDGET_MS = 1500.0
+
+def measure_import(module: str) -> tuple[float, set[str]]:
+    """Import a module in a fresh interpreter.
+
+    Args:
+        module (str): Dotted module name to import.
+
+    Returns:
+        tuple[float, set[str]]: Cumulative import time in milliseconds, and every module name imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    total_us = 0
+    imported: set[str] = set()
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.add(name.strip())
+        # Top-level imports have no indentation after the separator
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000, imported
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs, to smooth out noise")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        best_ms = min(ms for ms, _ in runs)
+        eager = sorted(name for name in LAZY_MODULES if name in runs[0][1])
+        status = "ok"
+        if best_ms > args.budget_ms:
+            status = f"over budget ({args.budget_ms:.0f} ms)"
+            failed = True
+        if eager:
+            status = f"eagerly imports {', '.join(eager)}"
+            failed = True
+        print(f"{module}: {best_ms:.1f} ms - {status}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
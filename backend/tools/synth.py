@@ -0,0 +1,380 @@
+"""Synthetic portfolio data generator for load and scale testing.
+
+Generates a deterministic dataset for a seed: users with several accounts each, a pool of
+assets with simulated daily price histories, decades of monthly contributions, quarterly
+DRIP dividends and annual rebalancing sells. The data is bulk inserted into the User, Account,
+Asset and Transaction tables, and can also be written out as transaction import CSVs and a
+price-history CSV.
+
+Usage:
+    python -m backend.tools.synth --users 1000 --transactions 10000000 [--database-url URL]
+        [--csv-dir out/] [--prices out/prices.csv] [--no-db] [--seed 42]
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Iterator
+import argparse
+import csv
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+TRANSACTION_COLUMNS = ["id", "asset_id", "account_id", "type", "quantity", "price", "fee", "date"]
+PRICE_COLUMNS = ["date", "symbol", "open", "high", "low", "close", "volume"]
+# Transaction type codes used in the generated arrays, in TransactionType member names
+TYPE_NAMES = np.array(["BUY", "SELL", "DIVIDEND_REINVESTED"])
+BUY, SELL, DRIP = 0, 1, 2
+# Lowest buy rate target_transactions picks before it drops dividends and sells too
+MIN_TRADES_PER_MONTH = 0.05
+
+@dataclass
+class SynthConfig:
+    """Shape of the generated dataset.
+
+    Args:
+        users (int): Number of users.
+        accounts_per_user (int): Accounts per user.
+        holdings_per_account (int): Assets each account trades.
+        assets (int): Size of the asset pool.
+        years (int): Years of history, ending at ``end``.
+        trades_per_month (float): Average buys per holding per month.
+        dividend_yield (float): Annual dividend yield reinvested quarterly.
+        event_rate (float): Share of the DRIP and sell events kept (0 to 1), to generate fewer
+            transactions than monthly buys with quarterly dividends allow.
+        seed (int): Seed for every random draw, including the generated ids.
+        end (date): Last day of the generated history.
+        chunk_rows (int): Approximate number of transactions generated and inserted at once.
+    """
+    users: int = 100
+    accounts_per_user: int = 3
+    holdings_per_account: int = 3
+    assets: int = 20
+    years: int = 30
+    trades_per_month: float = 1.0
+    dividend_yield: float = 0.02
+    event_rate: float = 1.0
+    seed: int = 42
+    end: date = field(default_factory=lambda: date(2024, 12, 31))
+    chunk_rows: int = 500_000
+
+    def streams(self) -> int:
+        return self.users * self.accounts_per_user * self.holdings_per_account
+
+    def _events_per_stream(self, trades_per_month: float, event_rate: float) -> float:
+        # Monthly buys, quarterly DRIP and on average one sell every other year per holding; DRIP and
+        # sells only happen once the holding has been bought, which matters at low buy rates
+        months = 12 * self.years
+        # Chance of at least one buy before the quarter ends and before the middle of each year
+        drips = (1 - np.exp(-trades_per_month * np.arange(3, months + 1, 3))).sum()
+        sells = 0.5 * (1 - np.exp(-trades_per_month * np.arange(6, months, 12))).sum()
+        return months * trades_per_month + event_rate * (drips + sells)
+
+    def estimated_transactions(self) -> int:
+        return int(self.streams() * self._events_per_stream(self.trades_per_month, self.event_rate))
+
+    def target_transactions(self, transactions: int) -> None:
+        """Pick trades_per_month, and below MIN_TRADES_PER_MONTH event_rate too, so the dataset has about this many transactions."""
+        per_stream = transactions / max(self.streams(), 1)
+        # Too few for every dividend and sell: thin out buys and the other events alike
+        thin_out = per_stream < self._events_per_stream(MIN_TRADES_PER_MONTH, 1.0)
+
+        def rates(scale: float) -> tuple[float, float]:
+            return (MIN_TRADES_PER_MONTH * scale, scale) if thin_out else (scale, 1.0)
+
+        # Bisect the scale; the expected count grows with it
+        low, high = (0.0, 1.0) if thin_out else (MIN_TRADES_PER_MONTH, max(per_stream / (12 * self.years), MIN_TRADES_PER_MONTH))
+        for _ in range(50):
+            middle = (low + high) / 2
+            if self._events_per_stream(*rates(middle)) < per_stream:
+                low = middle
+            else:
+                high = middle
+        self.trades_per_month, self.event_rate = rates(high)
+
+def random_uuids(rng: np.random.Generator, n: int) -> list[str]:
+    """Deterministic version 4 UUIDs, as 32 character hex strings."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexed = raw.tobytes().hex()
+    return [hexed[i:i + 32] for i in range(0, 32 * n, 32)]
+
+class SyntheticDataset:
+    """Users, accounts, assets and price paths for a config; transactions are generated lazily in chunks."""
+    def __init__(self, config: SynthConfig) -> None:
+        self.config = config
+        rng = np.random.default_rng(config.seed)
+
+        start = np.datetime64(date(config.end.year - config.years + 1, 1, 1), "D")
+        all_days = np.arange(start, np.datetime64(config.end, "D") + 1)
+        self.days = all_days[np.is_busday(all_days)]
+        months = self.days.astype("datetime64[M]")
+        # Index of the first trading day of each month, plus a final sentinel
+        self.month_starts = np.concatenate([np.flatnonzero(np.r_[True, months[1:] != months[:-1]]), [len(self.days)]])
+        quarters = (months.astype(int) // 3)
+        self.quarter_ends = np.flatnonzero(np.r_[quarters[1:] != quarters[:-1], True])
+        years = self.days.astype("datetime64[Y]")
+        self.year_starts = np.concatenate([np.flatnonzero(np.r_[True, years[1:] != years[:-1]]), [len(self.days)]])
+
+        self.user_ids = random_uuids(rng, config.users)
+        self.account_ids = random_uuids(rng, config.users * config.accounts_per_user)
+        self.asset_ids = random_uuids(rng, config.assets)
+        self.symbols = [f"SYN{i:04d}" for i in range(config.assets)]
+
+        # Geometric Brownian motion closes, one row per asset
+        drift = rng.uniform(0.03, 0.10, size=(config.assets, 1)) / 252
+        volatility = rng.uniform(0.08, 0.30, size=(config.assets, 1)) / np.sqrt(252)
+        shocks = rng.standard_normal((config.assets, len(self.days)))
+        log_returns = drift - volatility ** 2 / 2 + volatility * shocks
+        initial = rng.uniform(20, 200, size=(config.assets, 1))
+        self.closes = np.round(initial * np.exp(np.cumsum(log_returns, axis=1)), 4)
+        self._price_rng = np.random.default_rng([config.seed, 1])
+
+    def user_rows(self) -> list[dict[str, Any]]:
+        return [
+            {"id": uuid.UUID(hex=user_id), "username": f"synth{i:06d}", "email": f"synth{i:06d}@example.com", "password_hash": None}
+            for i, user_id in enumerate(self.user_ids)
+        ]
+
+    def account_rows(self) -> list[dict[str, Any]]:
+        per_user = self.config.accounts_per_user
+        names = ["Taxable", "Roth IRA", "Traditional IRA", "401k", "HSA"]
+        return [
+            {
+                "id": uuid.UUID(hex=account_id),
+                "name": names[i % per_user % len(names)] if per_user <= len(names) else f"Account {i % per_user}",
+                "user_id": uuid.UUID(hex=self.user_ids[i // per_user]),
+                "balance": 0.0,
+            }
+            for i, account_id in enumerate(self.account_ids)
+        ]
+
+    def asset_rows(self) -> list[dict[str, Any]]:
+        from ..app.schemas import DataSource
+        return [
+            {"id": uuid.UUID(hex=asset_id), "symbol": symbol, "name": f"Synthetic Fund {i}", "currency": "USD", "data_source": DataSource.OTHER}
+            for i, (asset_id, symbol) in enumerate(zip(self.asset_ids, self.symbols))
+        ]
+
+    def _holding_events(self, rng: np.random.Generator, asset: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Buy, DRIP and sell events of one holding, as (day index, type, quantity, price) arrays."""
+        config = self.config
+        month_lengths = np.diff(self.month_starts)
+        buys_per_month = rng.poisson(config.trades_per_month, size=len(month_lengths))
+        buy_months = np.repeat(np.arange(len(month_lengths)), buys_per_month)
+        buy_days = self.month_starts[buy_months] + (rng.random(len(buy_months)) * month_lengths[buy_months]).astype(int)
+        buy_days.sort()
+        closes = self.closes[asset]
+        buy_quantities = rng.lognormal(np.log(500), 0.5, size=len(buy_days)) / closes[buy_days]
+        position = np.cumsum(buy_quantities)
+
+        # Shares held at a day, counting buys only; keeps sells and DRIP from depending on each other
+        def held(days: np.ndarray) -> np.ndarray:
+            if not len(buy_days):
+                return np.zeros(len(days))
+            count = np.searchsorted(buy_days, days, side="right")
+            return np.where(count > 0, position[np.maximum(count - 1, 0)], 0.0)
+
+        drip_days = self.quarter_ends
+        if config.event_rate < 1:
+            drip_days = drip_days[rng.random(len(drip_days)) < config.event_rate]
+        drip_quantities = held(drip_days) * config.dividend_yield / 4
+
+        year_lengths = np.diff(self.year_starts)
+        selling_years = np.flatnonzero(rng.random(len(year_lengths)) < 0.5 * config.event_rate)
+        sell_days = self.year_starts[selling_years] + (rng.random(len(selling_years)) * year_lengths[selling_years]).astype(int)
+        sell_quantities = held(sell_days) * rng.uniform(0.01, 0.03, size=len(sell_days))
+
+        days = np.concatenate([buy_days, drip_days, sell_days])
+        types = np.concatenate([np.full(len(buy_days), BUY), np.full(len(drip_days), DRIP), np.full(len(sell_days), SELL)])
+        quantities = np.round(np.concatenate([buy_quantities, drip_quantities, sell_quantities]), 4)
+        keep = quantities > 0
+        return days[keep], types[keep], quantities[keep], closes[days[keep]]
+
+    def transaction_chunks(self) -> Iterator[dict[str, Any]]:
+        """Yield transactions as column arrays, a few hundred thousand rows at a time."""
+        config = self.config
+        rng = np.random.default_rng([config.seed, 2])
+        columns: dict[str, list[np.ndarray]] = {name: [] for name in ("account", "asset", "day", "type", "quantity", "price")}
+        rows = 0
+        for account in range(len(self.account_ids)):
+            for asset in rng.choice(config.assets, size=min(config.holdings_per_account, config.assets), replace=False):
+                days, types, quantities, prices = self._holding_events(rng, asset)
+                columns["account"].append(np.full(len(days), account))
+                columns["asset"].append(np.full(len(days), asset))
+                columns["day"].append(days)
+                columns["type"].append(types)
+                columns["quantity"].append(quantities)
+                columns["price"].append(prices)
+                rows += len(days)
+            if rows >= config.chunk_rows or account == len(self.account_ids) - 1:
+                yield self._finish_chunk(rng, {name: np.concatenate(parts) for name, parts in columns.items()})
+                columns = {name: [] for name in columns}
+                rows = 0
+
+    def _finish_chunk(self, rng: np.random.Generator, chunk: dict[str, np.ndarray]) -> dict[str, Any]:
+        n = len(chunk["day"])
+        # Trades during market hours; fees only on some buys and sells
+        seconds = rng.integers(9 * 3600 + 30 * 60, 16 * 3600, size=n).astype("timedelta64[s]")
+        fees = np.where((chunk["type"] != DRIP) & (rng.random(n) < 0.1), 4.95, 0.0)
+        return {
+            "id": random_uuids(rng, n),
+            "account_id": [self.account_ids[i] for i in chunk["account"]],
+            "asset_id": [self.asset_ids[i] for i in chunk["asset"]],
+            "type": TYPE_NAMES[chunk["type"]],
+            "quantity": chunk["quantity"],
+            "price": chunk["price"],
+            "fee": fees,
+            "date": self.days[chunk["day"]].astype("datetime64[s]") + seconds,
+        }
+
+def _sqlite_rows(chunk: dict[str, Any]) -> list[tuple]:
+    # SQLAlchemy stores Uuid as 32 hex chars, Enum by member name and DateTime as "YYYY-MM-DD HH:MM:SS.ffffff" on SQLite
+    dates = np.char.replace(np.datetime_as_string(chunk["date"], unit="us"), "T", " ")
+    return list(zip(
+        chunk["id"], chunk["asset_id"], chunk["account_id"], chunk["type"].tolist(),
+        chunk["quantity"].tolist(), chunk["price"].tolist(), chunk["fee"].tolist(), dates.tolist(),
+    ))
+
+def _orm_rows(chunk: dict[str, Any]) -> list[dict[str, Any]]:
+    from ..app.schemas import TransactionType
+    return [
+        {
+            "id": uuid.UUID(hex=tx_id), "asset_id": uuid.UUID(hex=asset_id), "account_id": uuid.UUID(hex=account_id),
+            "type": TransactionType[type_], "quantity": quantity, "price": price, "fee": fee, "date": date_.item(),
+        }
+        for tx_id, asset_id, account_id, type_, quantity, price, fee, date_ in zip(
+            chunk["id"], chunk["asset_id"], chunk["account_id"], chunk["type"].tolist(),
+            chunk["quantity"].tolist(), chunk["price"].tolist(), chunk["fee"].tolist(), chunk["date"],
+        )
+    ]
+
+def write_csv_chunk(writer: Any, chunk: dict[str, Any]) -> None:
+    """Append a chunk in the format accepted by POST /transactions/import-csv."""
+    from ..app.schemas import TransactionType
+    type_values = {member.name: member.value for member in TransactionType}
+    dates = np.datetime_as_string(chunk["date"], unit="s")
+    writer.writerows(zip(
+        (str(uuid.UUID(hex=asset_id)) for asset_id in chunk["asset_id"]),
+        (str(uuid.UUID(hex=account_id)) for account_id in chunk["account_id"]),
+        (type_values[type_] for type_ in chunk["type"].tolist()),
+        chunk["quantity"].tolist(), chunk["price"].tolist(), chunk["fee"].tolist(), dates.tolist(),
+    ))
+
+def write_prices_csv(dataset: SyntheticDataset, path: str) -> int:
+    """Write daily OHLCV bars for every asset. Returns the number of bars."""
+    rng = dataset._price_rng
+    dates = np.datetime_as_string(dataset.days, unit="D").tolist()
+    bars = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PRICE_COLUMNS)
+        for symbol, closes in zip(dataset.symbols, dataset.closes):
+            opens = np.round(np.r_[closes[0], closes[:-1]] * (1 + rng.normal(0, 0.002, len(closes))), 4)
+            highs = np.round(np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.004, len(closes)))), 4)
+            lows = np.round(np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.004, len(closes)))), 4)
+            volumes = rng.lognormal(13, 0.6, len(closes)).astype(int)
+            writer.writerows(zip(dates, [symbol] * len(dates), opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist(), volumes.tolist()))
+            bars += len(closes)
+    return bars
+
+def seed_database(engine: Any, dataset: SyntheticDataset, csv_dir: str | None = None) -> int:
+    """Bulk insert the dataset, optionally writing the matching import CSV. Returns the transaction count."""
+    from sqlmodel import SQLModel
+    from ..app.models import Account, Asset, Transaction, User
+    from ..app.versioning import bump_versions
+
+    SQLModel.metadata.create_all(bind=engine)
+    csv_file = open(os.path.join(csv_dir, "transactions.csv"), "w", newline="") if csv_dir else None
+    writer = csv.writer(csv_file) if csv_file else None
+    if writer:
+        writer.writerow(TRANSACTION_COLUMNS[1:])
+
+    table = Transaction.__table__
+    insert_sql = f'INSERT INTO "{table.name}" ({", ".join(TRANSACTION_COLUMNS)}) VALUES ({", ".join("?" * len(TRANSACTION_COLUMNS))})'
+    sqlite = engine.dialect.name == "sqlite"
+    total = 0
+    try:
+        with engine.begin() as connection:
+            connection.execute(User.__table__.insert(), dataset.user_rows())
+            connection.execute(Account.__table__.insert(), dataset.account_rows())
+            connection.execute(Asset.__table__.insert(), dataset.asset_rows())
+            for chunk in dataset.transaction_chunks():
+                if sqlite:
+                    connection.exec_driver_sql(insert_sql, _sqlite_rows(chunk))
+                else:
+                    connection.execute(table.insert(), _orm_rows(chunk))
+                if writer:
+                    write_csv_chunk(writer, chunk)
+                total += len(chunk["id"])
+                print(f"  {total:,} transactions", file=sys.stderr)
+            # Raw inserts don't go through the ORM, so invalidate the ETags of the tables written here
+            bump_versions(connection, ["user", "asset"], all_users=["account", "transaction"])
+    finally:
+        if csv_file:
+            csv_file.close()
+    return total
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=None, help="Target database (default: the app's DATABASE_URL)")
+    parser.add_argument("--no-db", action="store_true", help="Only write the CSV files")
+    parser.add_argument("--csv-dir", help="Write transactions.csv in the import format to this directory")
+    parser.add_argument("--prices", help="Write a daily price-history CSV to this path")
+    parser.add_argument("--users", type=int, default=SynthConfig.users)
+    parser.add_argument("--accounts-per-user", type=int, default=SynthConfig.accounts_per_user)
+    parser.add_argument("--holdings-per-account", type=int, default=SynthConfig.holdings_per_account)
+    parser.add_argument("--assets", type=int, default=SynthConfig.assets)
+    parser.add_argument("--years", type=int, default=SynthConfig.years)
+    parser.add_argument("--trades-per-month", type=float, default=SynthConfig.trades_per_month)
+    parser.add_argument("--transactions", type=int, help="Approximate total; overrides --trades-per-month")
+    parser.add_argument("--seed", type=int, default=SynthConfig.seed)
+    args = parser.parse_args(argv)
+
+    config = SynthConfig(
+        users=args.users,
+        accounts_per_user=args.accounts_per_user,
+        holdings_per_account=args.holdings_per_account,
+        assets=args.assets,
+        years=args.years,
+        trades_per_month=args.trades_per_month,
+        seed=args.seed,
+    )
+    if args.transactions:
+        config.target_transactions(args.transactions)
+    print(f"Generating about {config.estimated_transactions():,} transactions", file=sys.stderr)
+
+    started = time.perf_counter()
+    dataset = SyntheticDataset(config)
+    if args.csv_dir:
+        os.makedirs(args.csv_dir, exist_ok=True)
+    if args.prices:
+        bars = write_prices_csv(dataset, args.prices)
+        print(f"Wrote {bars:,} price bars to {args.prices}", file=sys.stderr)
+
+    if args.no_db:
+        if args.csv_dir:
+            with open(os.path.join(args.csv_dir, "transactions.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(TRANSACTION_COLUMNS[1:])
+                total = 0
+                for chunk in dataset.transaction_chunks():
+                    write_csv_chunk(writer, chunk)
+                    total += len(chunk["id"])
+            print(f"Wrote {total:,} transactions to {args.csv_dir}", file=sys.stderr)
+    else:
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        os.environ.setdefault("SQL_ECHO", "false")
+        from ..app.database import engine
+        total = seed_database(engine, dataset, csv_dir=args.csv_dir)
+        print(f"Inserted {config.users:,} users, {len(dataset.account_ids):,} accounts, {config.assets:,} assets "
+              f"and {total:,} transactions", file=sys.stderr)
+    print(f"Done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
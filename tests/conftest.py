@@ -0,0 +1,40 @@
+"""Every test session runs against its own SQLite database and caches in a temporary directory.
+
+The settings are read when the backend modules are imported, so they are set before the imports.
+Run the tests from the repository root: templates and static files are found relative to it.
+"""
+import os
+import tempfile
+
+_data_dir = tempfile.mkdtemp(prefix="boglefolio-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_data_dir, 'test.db')}"
+os.environ["SQL_ECHO"] = "false"
+os.environ["PRICE_CACHE_PATH"] = os.path.join(_data_dir, "prices.db")
+os.environ["TEMPLATE_CACHE_DIR"] = ""
+os.environ["ANALYTICS_DIR"] = os.path.join(_data_dir, "analytics")
+# Prices come from the price table, so no test calls Yahoo
+os.environ["PRICE_PROVIDERS"] = "YAHOO=manual"
+
+from typing import Any, Iterator
+import pytest
+from sqlmodel import SQLModel, Session
+from backend.app.main import app  # noqa: F401  (registers every model and instruments the engine)
+from backend.app.cache import _caches
+from backend.app.database import engine
+
+@pytest.fixture
+def session() -> Iterator[Session]:
+    """A session on an empty database, with every in-process cache cleared."""
+    SQLModel.metadata.drop_all(bind=engine)
+    SQLModel.metadata.create_all(bind=engine)
+    for cache in _caches.values():
+        cache.clear()
+    with Session(bind=engine) as session:
+        yield session
+
+@pytest.fixture
+def request_stub() -> Any:
+    """Stand-in for the Request the page templates read the login session from."""
+    class RequestStub:
+        session: dict[str, Any] = {}
+    return RequestStub()
@@ -0,0 +1,54 @@
+"""The analytics export rewrites only the years whose rows changed, including changes its sums can't see."""
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import Session, select
+from backend.app import analytics
+from backend.app.main import app
+from backend.app.models import Account, AnalyticsDirtyYear, Asset, PriceBar, Transaction, User
+from backend.app.profiling import count_queries
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+def test_moved_transaction_rewrites_only_its_year(session: Session) -> None:
+    user = User(username="investor")
+    account = Account(name="Taxable", user=user)
+    first, second = Asset(symbol="VTI"), Asset(symbol="BND")
+    old = Transaction(asset=first, account=account, quantity=1, price=100, date=datetime(2022, 3, 1))
+    moved = Transaction(asset=first, account=account, quantity=2, price=50, date=datetime(2023, 3, 1))
+    session.add_all([old, moved, second])
+    session.commit()
+    analytics.refresh_exports(session, full=True)
+    assert not session.exec(select(AnalyticsDirtyYear)).all()
+
+    # Same count and sums: only the mark tells the year apart
+    moved.asset_id = second.id
+    session.add(moved)
+    session.commit()
+    assert [(mark.dataset, mark.year) for mark in session.exec(select(AnalyticsDirtyYear)).all()] == [("transactions", 2023)]
+    with count_queries() as profile:
+        stats = analytics.refresh_exports(session)
+    assert stats["partitions_written"] == 1
+    # Versions, marks, per-year aggregates, the 2023 rows and clearing the mark: no per-row scan of the table
+    assert profile.count == 5
+    assert not session.exec(select(AnalyticsDirtyYear)).all()
+    rows = analytics.contributions_by_asset(session, user.id)
+    assert {row["symbol"]: row["contributed"] for row in rows} == {"VTI": 100.0, "BND": 100.0}
+
+def test_bulk_inserted_price_bars_mark_their_years(session: Session) -> None:
+    asset = Asset(symbol="VTI")
+    session.add(asset)
+    session.commit()
+    session.execute(insert(PriceBar), [
+        {"asset_id": asset.id, "date": datetime(2021, 6, 1), "close": 200.0},
+        {"asset_id": asset.id, "date": datetime(2024, 6, 3), "close": 250.0},
+    ])
+    session.commit()
+    marks = session.exec(select(AnalyticsDirtyYear.year).where(AnalyticsDirtyYear.dataset == "price_bars")).all()
+    assert sorted(marks) == [2021, 2024]
+
+def test_refresh_needs_monitoring_access(session: Session) -> None:
+    # TestClient requests come from "testclient", outside the default loopback allow list
+    assert TestClient(app).post("/reports/refresh?full=true").status_code == 403
@@ -0,0 +1,63 @@
+"""The event-driven backtest gives the same values as stepping through every day."""
+from typing import Any
+import numpy as np
+import pytest
+from backend.app.backtest import _scheduled_rebalances, simulate
+from backend.app.schemas import RebalanceRule
+
+def naive_simulate(
+    dates: np.ndarray,
+    prices: np.ndarray,
+    weights: np.ndarray,
+    rule: RebalanceRule,
+    threshold: float,
+    initial_value: float,
+    monthly_contribution: float,
+) -> dict[str, Any]:
+    months = dates.astype("datetime64[M]")
+    scheduled = _scheduled_rebalances(dates, rule)
+    before = [initial_value]
+    after = [initial_value]
+    shares = initial_value * weights / prices[0]
+    rebalances = 0
+    contributions = initial_value
+    for day in range(1, len(dates)):
+        value = float(prices[day] @ shares)
+        rebalance = bool(scheduled[day])
+        if rule == RebalanceRule.THRESHOLD:
+            rebalance = float(np.abs(prices[day] * shares / value - weights).max()) > threshold
+        flow = monthly_contribution if months[day] != months[day - 1] else 0.0
+        contributions += flow
+        before.append(value)
+        after.append(value + flow)
+        if rebalance:
+            shares = (value + flow) * weights / prices[day]
+            rebalances += 1
+        else:
+            shares = shares + flow * weights / prices[day]
+    return {"before": np.array(before), "after": np.array(after), "rebalances": rebalances, "contributions": contributions}
+
+@pytest.fixture(scope="module")
+def market() -> tuple[np.ndarray, np.ndarray]:
+    # Five years of trading days for three assets with different drifts and volatilities
+    rng = np.random.default_rng(3)
+    dates = np.arange(np.datetime64("2019-01-02"), np.datetime64("2024-01-01"), dtype="datetime64[D]")
+    dates = dates[np.is_busday(dates)]
+    returns = rng.normal([0.0004, 0.0001, 0.0006], [0.012, 0.004, 0.02], size=(len(dates), 3))
+    return dates, 100.0 * np.cumprod(1.0 + returns, axis=0)
+
+@pytest.mark.parametrize("rule", [RebalanceRule.NONE, RebalanceRule.MONTHLY, RebalanceRule.QUARTERLY, RebalanceRule.ANNUAL, RebalanceRule.THRESHOLD])
+@pytest.mark.parametrize("monthly_contribution", [0.0, 500.0])
+def test_matches_daily_loop(market: tuple[np.ndarray, np.ndarray], rule: RebalanceRule, monthly_contribution: float) -> None:
+    dates, prices = market
+    weights = np.array([0.6, 0.3, 0.1])
+    expected = naive_simulate(dates, prices, weights, rule, 0.05, 10_000.0, monthly_contribution)
+    run = simulate(dates, prices, weights, rule, 0.05, 10_000.0, monthly_contribution)
+    np.testing.assert_allclose(run["before"], expected["before"], rtol=1e-9)
+    np.testing.assert_allclose(run["after"], expected["after"], rtol=1e-9)
+    assert run["rebalances"] == expected["rebalances"]
+    assert run["contributions"] == pytest.approx(expected["contributions"])
+    if rule == RebalanceRule.ANNUAL:
+        assert run["rebalances"] == 4
+    if rule == RebalanceRule.THRESHOLD:
+        assert run["rebalances"] > 0
@@ -0,0 +1,69 @@
+"""The HTML list pages load everything they render in a fixed number of queries, however many rows there are."""
+from datetime import datetime, timedelta
+from typing import Any
+import pytest
+from sqlmodel import Session, select
+from backend.app.dashboard import dashboard_context
+from backend.app.models import Account, Asset, Transaction, User
+from backend.app.profiling import count_queries
+from backend.app.routes.frontend import _accounts_page_context, _transactions_page_context
+from backend.app.templating import fragment_cache, templates
+
+def seed(session: Session, rows: int) -> User:
+    user = User(username="investor", email="investor@example.com")
+    accounts = [Account(name=f"Account {index}", user=user) for index in range(3)]
+    assets = [Asset(symbol=f"SYM{index}", name=f"Asset {index}") for index in range(rows)]
+    start = datetime(2020, 1, 1)
+    session.add_all([
+        Transaction(asset=assets[index % len(assets)], account=accounts[index % len(accounts)], quantity=1, price=10, date=start + timedelta(days=index))
+        for index in range(rows)
+    ])
+    session.commit()
+    session.refresh(user)
+    return user
+
+def render(session: Session, request: Any, template: str, page_context: Any, user: User) -> int:
+    # The ORM identity map would hide lazy loads of rows it already holds
+    session.expunge_all()
+    with count_queries() as profile:
+        templates.get_template(template).render({"request": request, **page_context(session, user)})
+    return profile.count
+
+@pytest.mark.parametrize("rows", [10, 100])
+def test_transactions_page_query_count(session: Session, request_stub: Any, rows: int) -> None:
+    user = seed(session, rows)
+    fragment_cache.clear()
+    # Assets and accounts for the form selects, the data versions of the cache key, the joined transactions
+    assert render(session, request_stub, "transactions/list.html", _transactions_page_context, user) == 4
+    # The cached table skips the transactions query
+    assert render(session, request_stub, "transactions/list.html", _transactions_page_context, user) == 3
+
+@pytest.mark.parametrize("rows", [10, 100])
+def test_accounts_page_query_count(session: Session, request_stub: Any, rows: int) -> None:
+    user = seed(session, rows)
+    # The accounts with their owner joined in
+    assert render(session, request_stub, "accounts/list.html", _accounts_page_context, user) == 1
+
+@pytest.mark.parametrize("rows", [10, 100])
+def test_dashboard_query_count(session: Session, request_stub: Any, rows: int) -> None:
+    user = seed(session, rows)
+    fragment_cache.clear()
+    # The data versions of the cache key, the joined recent transactions
+    assert render(session, request_stub, "dashboard.html", dashboard_context, user) == 2
+    # The cached recent activity block only needs the data versions
+    assert render(session, request_stub, "dashboard.html", dashboard_context, user) == 1
+
+def test_dashboard_fragment_invalidated_by_write(session: Session, request_stub: Any) -> None:
+    user = seed(session, 10)
+    fragment_cache.clear()
+    def page() -> str:
+        return templates.get_template("dashboard.html").render({"request": request_stub, **dashboard_context(session, user)})
+    assert "NEWSYM" not in page()
+    account = session.exec(select(Account).where(Account.user_id == user.id)).first()
+    session.add(Transaction(asset=Asset(symbol="NEWSYM"), account=account, quantity=1, price=10, date=datetime(2030, 1, 1)))
+    session.commit()
+    assert "NEWSYM" in page()
+    # The new version is cached again
+    with count_queries() as profile:
+        assert "NEWSYM" in page()
+    assert profile.count == 1
@@ -0,0 +1,10 @@
+"""Importing the app stays within the startup-time budget and leaves heavy dependencies to first use."""
+import pytest
+from backend.tools.importtime import DEFAULT_BUDGET_MS, DEFAULT_MODULES, LAZY_MODULES, measure_import
+
+@pytest.mark.parametrize("module", DEFAULT_MODULES)
+def test_import_time(module: str) -> None:
+    # Best of three fresh interpreters, to smooth out noise
+    runs = [measure_import(module) for _ in range(3)]
+    assert not [name for name in LAZY_MODULES if name in runs[0][1]]
+    assert min(ms for ms, _ in runs) <= DEFAULT_BUDGET_MS
@@ -0,0 +1,93 @@
+"""Discovery and JWKS of an issuer are fetched once, served from the cache and refreshed when due."""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+import pytest
+from backend.app.oidc import OIDCMetadataCache
+
+class StubIssuer:
+    """Local issuer serving a discovery document and a JWKS, counting the requests per path."""
+
+    def __init__(self) -> None:
+        self.keys: list[dict[str, Any]] = [{"kid": "one", "kty": "RSA"}]
+        self.with_jwks_uri = True
+        self.requests: dict[str, int] = {}
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                issuer.requests[self.path] = issuer.requests.get(self.path, 0) + 1
+                if self.path == "/.well-known/openid-configuration":
+                    body: dict[str, Any] = {"issuer": issuer.url, "authorization_endpoint": f"{issuer.url}/authorize"}
+                    if issuer.with_jwks_uri:
+                        body["jwks_uri"] = f"{issuer.url}/jwks"
+                elif self.path == "/jwks":
+                    body = {"keys": issuer.keys}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def fetches(self, path: str) -> int:
+        return self.requests.get(path, 0)
+
+@pytest.fixture
+def issuer() -> Iterator[StubIssuer]:
+    issuer = StubIssuer()
+    thread = threading.Thread(target=issuer.server.serve_forever, daemon=True)
+    thread.start()
+    yield issuer
+    issuer.server.shutdown()
+    issuer.server.server_close()
+
+DISCOVERY = "/.well-known/openid-configuration"
+
+def test_metadata_cached_and_refreshed(issuer: StubIssuer) -> None:
+    async def run() -> None:
+        cache = OIDCMetadataCache(issuer.url, ttl=3600, jwks_min_refresh=0)
+        assert (await cache.get_metadata())["issuer"] == issuer.url
+        assert (await cache.get_jwks())["keys"][0]["kid"] == "one"
+        await cache.get_metadata()
+        assert (issuer.fetches(DISCOVERY), issuer.fetches("/jwks")) == (1, 1)
+
+        # An unknown key id forces a JWKS refresh, without fetching discovery again
+        issuer.keys = [{"kid": "two", "kty": "RSA"}]
+        assert (await cache.get_jwks(force=True))["keys"][0]["kid"] == "two"
+        assert (issuer.fetches(DISCOVERY), issuer.fetches("/jwks")) == (1, 2)
+
+        # Forced refreshes are rate limited
+        cache.jwks_min_refresh = 3600
+        await cache.get_jwks(force=True)
+        assert issuer.fetches("/jwks") == 2
+
+        # Stale documents are served while one background refresh runs
+        cache.ttl = 0
+        issuer.keys = [{"kid": "three", "kty": "RSA"}]
+        assert (await cache.get_jwks())["keys"][0]["kid"] == "two"
+        await cache._background
+        assert (await cache.get_jwks())["keys"][0]["kid"] == "three"
+        assert issuer.fetches(DISCOVERY) >= 2
+    asyncio.run(run())
+
+def test_metadata_without_jwks_uri(issuer: StubIssuer) -> None:
+    issuer.with_jwks_uri = False
+    async def run() -> None:
+        cache = OIDCMetadataCache(issuer.url, jwks_min_refresh=0)
+        assert await cache.get_jwks() == {"keys": []}
+        with pytest.raises(ValueError, match="no jwks_uri"):
+            await cache.get_jwks(force=True)
+        assert issuer.fetches("/jwks") == 0
+    asyncio.run(run())
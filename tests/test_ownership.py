@@ -0,0 +1,81 @@
+"""API routes addressing a user, account or transaction by id only serve the authenticated user's own data."""
+from datetime import datetime
+from typing import Any
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from backend.app.auth import create_access_token
+from backend.app.main import app
+from backend.app.models import Account, Asset, Transaction, User
+
+@pytest.fixture
+def ledgers(session: Session) -> dict[str, Any]:
+    asset = Asset(symbol="VTI")
+    ledgers: dict[str, Any] = {}
+    for name in ("owner", "other"):
+        user = User(username=name)
+        account = Account(name=f"{name} account", user=user)
+        transaction = Transaction(asset=asset, account=account, quantity=1, price=100, date=datetime(2024, 1, 2))
+        session.add(transaction)
+        session.commit()
+        ledgers[name] = {"user": user.id, "account": account.id, "transaction": transaction.id}
+    ledgers["asset"] = asset.id
+    return ledgers
+
+@pytest.fixture
+def client() -> TestClient:
+    return TestClient(app)
+
+def headers(username: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+def other_users_routes(other: dict[str, Any]) -> list[tuple[str, str]]:
+    return [
+        ("GET", f"/users/{other['user']}"),
+        ("GET", f"/users/{other['user']}/holdings?with_prices=false"),
+        ("GET", f"/users/{other['user']}/value-series"),
+        ("POST", f"/users/{other['user']}/value-series/refresh"),
+        ("PATCH", f"/users/{other['user']}"),
+        ("DELETE", f"/users/{other['user']}"),
+        ("GET", f"/reports/{other['user']}/returns-by-year"),
+        ("GET", f"/reports/{other['user']}/contributions-by-asset"),
+        ("GET", f"/reports/{other['user']}/dividends-by-month"),
+        ("GET", f"/tax/harvest-candidates?user_id={other['user']}"),
+        ("GET", f"/stream/users/{other['user']}"),
+        ("GET", f"/accounts/{other['account']}"),
+        ("GET", f"/accounts/{other['account']}/holdings?with_prices=false"),
+        ("PATCH", f"/accounts/{other['account']}"),
+        ("DELETE", f"/accounts/{other['account']}"),
+        ("GET", f"/transactions/{other['transaction']}"),
+        ("PATCH", f"/transactions/{other['transaction']}"),
+        ("DELETE", f"/transactions/{other['transaction']}"),
+    ]
+
+def test_other_users_data_is_not_found(client: TestClient, ledgers: dict[str, Any]) -> None:
+    for method, url in other_users_routes(ledgers["other"]):
+        body = {"json": {}} if method == "PATCH" else {}
+        response = client.request(method, url, headers=headers("owner"), **body)
+        assert response.status_code == 404, f"{method} {url} answered {response.status_code}"
+
+def test_routes_require_authentication(client: TestClient, ledgers: dict[str, Any]) -> None:
+    for method, url in other_users_routes(ledgers["owner"]):
+        body = {"json": {}} if method == "PATCH" else {}
+        response = client.request(method, url, **body)
+        assert response.status_code == 401, f"{method} {url} answered {response.status_code}"
+
+def test_own_data_is_served(client: TestClient, ledgers: dict[str, Any]) -> None:
+    owner = ledgers["owner"]
+    assert client.get(f"/users/{owner['user']}", headers=headers("owner")).status_code == 200
+    assert client.get(f"/accounts/{owner['account']}", headers=headers("owner")).status_code == 200
+    assert client.get(f"/transactions/{owner['transaction']}", headers=headers("owner")).status_code == 200
+    holdings = client.get(f"/users/{owner['user']}/holdings?with_prices=false", headers=headers("owner"))
+    assert [holding["account_id"] for holding in holdings.json()] == [str(owner["account"])]
+
+def test_writes_cannot_target_other_users_accounts(client: TestClient, ledgers: dict[str, Any]) -> None:
+    owner, other = ledgers["owner"], ledgers["other"]
+    account = {"name": "Planted", "user_id": str(other["user"])}
+    assert client.post("/accounts/", json=account, headers=headers("owner")).status_code == 404
+    transaction = {"asset_id": str(ledgers["asset"]), "account_id": str(other["account"]), "type": "Buy", "quantity": 1, "price": 1}
+    assert client.post("/transactions/", json=transaction, headers=headers("owner")).status_code == 404
+    moved = client.patch(f"/transactions/{owner['transaction']}", json={"account_id": str(other["account"])}, headers=headers("owner"))
+    assert moved.status_code == 404
@@ -0,0 +1,49 @@
+"""Concurrent logins hash on the password executor: the event loop stays responsive and excess logins get 503."""
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from sqlmodel import Session
+from backend.app import auth
+from backend.app.main import app
+from backend.app.models import User
+
+MAX_PENDING = 4
+LOGINS = 10
+
+def test_login_storm(session: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    session.add(User(username="investor", password_hash="hash"))
+    session.commit()
+    release = threading.Event()
+    def verify_password(plain_password: str, hashed_password: str) -> bool:
+        # Holds its executor thread like a slow bcrypt verify, until every login has been answered or queued
+        release.wait(timeout=10)
+        return True
+    monkeypatch.setattr(auth, "verify_password", verify_password)
+    monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_PENDING", MAX_PENDING)
+
+    async def storm() -> tuple[list[int], float]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            logins = [
+                asyncio.create_task(client.post("/login/form", data={"username": "investor", "password": "secret"}))
+                for _ in range(LOGINS)
+            ]
+            # The loop keeps running other tasks on time while the pending logins wait for the executor
+            worst_delay = 0.0
+            deadline = time.monotonic() + 10
+            while sum(login.done() for login in logins) < LOGINS - MAX_PENDING and time.monotonic() < deadline:
+                started = time.monotonic()
+                await asyncio.sleep(0.01)
+                worst_delay = max(worst_delay, time.monotonic() - started - 0.01)
+            assert auth._pending_password_jobs == MAX_PENDING
+            release.set()
+            responses = await asyncio.gather(*logins)
+        return [response.status_code for response in responses], worst_delay
+
+    statuses, worst_delay = asyncio.run(storm())
+    assert statuses.count(503) == LOGINS - MAX_PENDING
+    assert statuses.count(302) == MAX_PENDING
+    assert worst_delay < 0.5
+    assert auth._pending_password_jobs == 0
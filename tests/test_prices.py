@@ -0,0 +1,80 @@
+"""Quotes are cached per (symbol, data source), in each worker and in the shared cache; only signed-in users upload prices."""
+from datetime import datetime
+from typing import Any, Iterator
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from backend.app.auth import create_access_token
+from backend.app.cache import SharedCache
+from backend.app.main import app
+from backend.app.models import User
+from backend.app.schemas import DataSource
+from backend.services import prices
+from backend.services.providers import PriceProvider
+
+class StubProvider(PriceProvider):
+    """Serves one fixed price for every symbol and counts the calls."""
+
+    def __init__(self, price: float) -> None:
+        self.price = price
+        self.calls: list[list[str]] = []
+
+    def get_prices(self, symbols: list[str]) -> dict[str, tuple[float, datetime]]:
+        self.calls.append(symbols)
+        return {symbol: (self.price, datetime(2024, 1, 2)) for symbol in symbols}
+
+    def get_histories(self, symbols: list[str], start: Any = None, end: Any = None, interval: Any = None) -> dict[str, Any]:
+        return {}
+
+@pytest.fixture
+def providers(monkeypatch: pytest.MonkeyPatch) -> Iterator[dict[DataSource, StubProvider]]:
+    stubs = {DataSource.YAHOO: StubProvider(100.0), DataSource.MANUAL: StubProvider(42.0)}
+    monkeypatch.setattr(prices, "get_provider", lambda data_source: stubs[data_source])
+    prices.quote_cache.clear()
+    prices.stale_quote_cache.clear()
+    yield stubs
+    prices.quote_cache.clear()
+    prices.stale_quote_cache.clear()
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> str:
+    if request.param == "sqlite":
+        monkeypatch.setattr(prices, "shared_quote_cache", SharedCache(name="quote_shared_test", path=str(tmp_path / "prices.db"), ttl=60))
+    else:
+        monkeypatch.setattr(prices, "shared_quote_cache", None)
+    return request.param
+
+def test_same_symbol_from_two_sources(providers: dict[DataSource, StubProvider], backend: str) -> None:
+    assets = [("VTI", DataSource.YAHOO), ("VTI", DataSource.MANUAL)]
+    for _ in range(2):
+        quotes = prices.get_cached_prices(assets)
+        assert quotes[("VTI", DataSource.YAHOO)][0] == 100.0
+        assert quotes[("VTI", DataSource.MANUAL)][0] == 42.0
+    # The second lookup is served from the cache
+    assert [len(stub.calls) for stub in providers.values()] == [1, 1]
+    assert prices.get_cached_price("VTI", DataSource.MANUAL)[0] == 42.0
+
+    prices.invalidate_prices(["VTI"])
+    assert prices.get_cached_price("VTI", DataSource.YAHOO)[0] == 100.0
+    assert len(providers[DataSource.YAHOO].calls) == 2
+
+def test_price_upload_requires_login(session: Session) -> None:
+    session.add(User(username="investor"))
+    session.commit()
+    client = TestClient(app)
+    upload = {"file": ("prices.csv", b"date,symbol,close\n2024-01-02,VTI,231.5\n", "text/csv")}
+    assert client.post("/assets/prices/upload", files=upload).status_code in (401, 403)
+    token = create_access_token({"sub": "investor"})
+    response = client.post("/assets/prices/upload", files=upload, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+def test_symbols_fetched_after_wait_timeout_are_cached(providers: dict[DataSource, StubProvider], monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> None:
+    shared = SharedCache(name="quote_shared_test", path=str(tmp_path / "prices.db"), ttl=60)
+    monkeypatch.setattr(prices, "shared_quote_cache", shared)
+    monkeypatch.setattr(prices, "PRICE_CACHE_WAIT", 0.1)
+    # Another worker claimed the symbol and never stores a price
+    shared.claim(["Yahoo:VTI"], "other-worker")
+    assert prices.get_cached_price("VTI", DataSource.YAHOO)[0] == 100.0
+    assert prices.get_cached_price("VTI", DataSource.YAHOO)[0] == 100.0
+    assert len(providers[DataSource.YAHOO].calls) == 1
+    assert "Yahoo:VTI" in shared.get_many(["Yahoo:VTI"])
@@ -0,0 +1,46 @@
+"""Projections only count paths emptied by withdrawals as ruined, and a seed gives the same result however it runs."""
+import numpy as np
+import pytest
+from sqlmodel import Session
+from backend.app import projection
+from backend.app.models import User
+from backend.app.projection import run_projection, simulate_paths
+from backend.app.schemas import CashFlowPeriod, ProjectionRequest, ReturnModel
+
+PARAMETRIC = {"expected_return": 0.06, "volatility": 0.15}
+
+@pytest.mark.parametrize("flows", [np.zeros(120), np.r_[np.zeros(60), np.full(60, 500.0)]])
+def test_empty_start_is_not_depleted(flows: np.ndarray) -> None:
+    year_ends, depleted = simulate_paths(0.0, flows, 200, 1, ReturnModel.PARAMETRIC, PARAMETRIC)
+    assert not depleted.any()
+    assert (year_ends[:, 5] == 0).all()
+
+def test_withdrawals_deplete() -> None:
+    flows = np.full(120, -2000.0)
+    year_ends, depleted = simulate_paths(50_000.0, flows, 200, 1, ReturnModel.PARAMETRIC, PARAMETRIC)
+    assert depleted.all()
+    assert (year_ends[:, -1] == 0).all()
+
+@pytest.fixture
+def user(session: Session) -> User:
+    user = User(username="investor")
+    session.add(user)
+    session.commit()
+    return user
+
+def test_seeded_projection_is_reproducible(session: Session, user: User, monkeypatch: pytest.MonkeyPatch) -> None:
+    request = ProjectionRequest(
+        years=20, paths=1000, seed=7, initial_value=100_000, model=ReturnModel.PARAMETRIC,
+        cash_flows=[CashFlowPeriod(start_year=10, amount=-9000)],
+    )
+    monkeypatch.setattr(projection, "PROJECTION_CHUNK_PATHS", 300)
+    in_process = run_projection(session, user, request)
+    assert run_projection(session, user, request) == in_process
+    assert 0 < in_process.success_probability < 1
+
+    # The same chunks on the process pool draw the same numbers
+    monkeypatch.setattr(projection, "PROJECTION_WORKERS", 2)
+    try:
+        assert run_projection(session, user, request) == in_process
+    finally:
+        projection.shutdown_executor()
@@ -0,0 +1,66 @@
+"""Provider calls are retried, failing upstreams open their circuit, and swallowed download errors still count."""
+from typing import Iterator
+import pytest
+from backend.services.providers import FaultyProvider, FileProvider
+from backend.services.resilience import CircuitOpen, CircuitState, UpstreamGuard, reset_guard
+from backend.services.yahoo import check_download_errors
+
+@pytest.fixture
+def guard(monkeypatch: pytest.MonkeyPatch) -> Iterator[UpstreamGuard]:
+    """A fresh "faulty" guard without rate limit or backoff: 2 retries, circuit opens after 2 failed calls."""
+    for name, value in {"RATE_LIMIT": "0", "BACKOFF": "0", "RETRIES": "2", "BREAKER_FAILURES": "2", "BREAKER_RESET": "60"}.items():
+        monkeypatch.setenv(f"FAULTY_{name}", value)
+    yield reset_guard("faulty")
+    monkeypatch.undo()
+    reset_guard("faulty")
+
+@pytest.fixture
+def provider(tmp_path) -> FaultyProvider:
+    path = tmp_path / "prices.csv"
+    path.write_text("date,symbol,open,high,low,close,volume\n2024-01-02,VTI,230,232,229,231.5,1000\n")
+    return FaultyProvider(FileProvider(str(path)), failure_rate=0.0)
+
+def test_failing_upstream_opens_and_closes_circuit(guard: UpstreamGuard, provider: FaultyProvider) -> None:
+    assert provider.get_prices(["VTI"])["VTI"][0] == 231.5
+
+    provider.failure_rate = 1.0
+    for calls in (3, 6):
+        with pytest.raises(ConnectionError):
+            provider.get_prices(["VTI"])
+        assert provider.upstream_calls == 1 + calls
+    assert guard.breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpen):
+        provider.get_prices(["VTI"])
+    assert provider.upstream_calls == 7
+
+    provider.failure_rate = 0.0
+    guard.breaker.reset_timeout = 0.0
+    assert provider.get_prices(["VTI"])["VTI"][0] == 231.5
+    assert guard.breaker.state == CircuitState.CLOSED
+    assert guard.status()["failed_calls"] == 2
+
+def test_download_errors() -> None:
+    # Symbols without data are left out of the result, not failures
+    check_download_errors({"OLD": "YFPricesMissingError('$OLD: possibly delisted; no price data found (1d 5d)')"}, ["OLD"])
+    check_download_errors({"OTHER": "YFRateLimitError('Too Many Requests. Rate limited. Try after a while.')"}, ["VTI"])
+    with pytest.raises(ConnectionError):
+        check_download_errors({"VTI": "YFRateLimitError('Too Many Requests. Rate limited. Try after a while.')"}, ["vti"])
+    with pytest.raises(ConnectionError):
+        check_download_errors({"VTI": "ConnectionError(MaxRetryError('Read timed out.'))"}, ["VTI"])
+    with pytest.raises(ValueError):
+        check_download_errors({"VTI": "YFInvalidPeriodError(\"VTI: Period '1y' is invalid\")"}, ["VTI"])
+
+def test_swallowed_download_errors_trip_circuit(guard: UpstreamGuard) -> None:
+    calls = 0
+    def download() -> dict[str, float]:
+        nonlocal calls
+        calls += 1
+        check_download_errors({"VTI": "YFRateLimitError('Too Many Requests. Rate limited. Try after a while.')"}, ["VTI"])
+        return {}
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guard.call("price", download)
+    assert calls == 6
+    with pytest.raises(CircuitOpen):
+        guard.call("price", download)
@@ -0,0 +1,10 @@
+"""The synthetic generator produces about the requested number of transactions, however few."""
+import pytest
+from backend.tools.synth import SynthConfig, SyntheticDataset
+
+@pytest.mark.parametrize("users, transactions", [(10, 2000), (100, 5000), (100, 50000)])
+def test_target_transactions(users: int, transactions: int) -> None:
+    config = SynthConfig(users=users, assets=5)
+    config.target_transactions(transactions)
+    generated = sum(len(chunk["id"]) for chunk in SyntheticDataset(config).transaction_chunks())
+    assert abs(generated - transactions) <= 0.1 * transactions
@@ -0,0 +1,38 @@
+"""Value series pick their tier from the requested range and start at the period containing start."""
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import Session
+from backend.app.models import PortfolioValue, User
+from backend.app.portfolio_values import get_value_series, update_rollups
+from backend.app.profiling import count_queries
+from backend.app.schemas import SeriesTier
+
+@pytest.fixture
+def user(session: Session) -> User:
+    user = User(username="investor")
+    session.add(user)
+    session.commit()
+    first = datetime(2020, 1, 1)
+    days = [first + timedelta(days=offset) for offset in range(5 * 365)]
+    session.add_all([PortfolioValue(user_id=user.id, date=day, value=1000.0 + index) for index, day in enumerate(days) if day.weekday() < 5])
+    session.commit()
+    update_rollups(session, user.id, first)
+    session.commit()
+    return user
+
+@pytest.mark.parametrize("start, end, tier", [
+    (datetime(2024, 1, 1), datetime(2024, 6, 30), SeriesTier.DAY),
+    (datetime(2023, 1, 1), datetime(2024, 12, 31), SeriesTier.WEEK),
+    (None, None, SeriesTier.MONTH),
+])
+def test_tier_from_range(session: Session, user: User, start: datetime | None, end: datetime | None, tier: SeriesTier) -> None:
+    with count_queries() as profile:
+        series = get_value_series(session, user, start=start, end=end, max_points=150)
+    assert series.tier == tier
+    assert not [statement for statement, _ in profile.statements if "count(" in statement.lower()]
+
+@pytest.mark.parametrize("tier, first", [(SeriesTier.MONTH, datetime(2023, 3, 1)), (SeriesTier.WEEK, datetime(2023, 3, 13))])
+def test_rollups_start_at_period_containing_start(session: Session, user: User, tier: SeriesTier, first: datetime) -> None:
+    # 2023-03-15 is a Wednesday
+    series = get_value_series(session, user, start=datetime(2023, 3, 15), end=datetime(2023, 6, 30), tier=tier)
+    assert series.points[0].date == first